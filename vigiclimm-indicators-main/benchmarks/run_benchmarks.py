@@ -0,0 +1,215 @@
+"""
+Benchmarks of the `vi-run-*` stages and of their main kernels, on synthetic inputs (see ``synthetic``) and station
+lists of increasing size.
+
+The timings are saved as JSON, with the versions of the package and of its dependencies, so that a run can be
+compared with the results of a previous version:
+
+    python -m benchmarks.run_benchmarks --workdir /tmp/vi-bench --output bench.json --compare previous.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import shutil
+import click
+import yaml
+import numpy as np
+import pandas as pd
+import xarray as xr
+import typing as T
+
+from importlib import metadata
+from pathlib import Path
+from loguru import logger
+
+from benchmarks import synthetic
+from vigiclimm_indicators import pipeline
+from vigiclimm_indicators.weather_indicators import daily_forecast, historical
+from vigiclimm_indicators.weather_indicators.degree_days import degree_days
+from vigiclimm_indicators.weather_indicators.etp import etp_from_gfs, etp_from_gfs_stations
+from vigiclimm_indicators.weather_indicators.output_store import blocks_to_dataset
+from vigiclimm_indicators.weather_indicators.preprocess import open_gfs, preprocess_gfs, preprocess_gfs_stations
+from vigiclimm_indicators.weather_indicators.utils import cdd_max, consecutive_event_count
+from vigiclimm_indicators.agro_indicators import generate_agro_indicators as agro
+
+STATION_COUNTS = [10, 100, 2000]
+
+
+def timeit(func: T.Callable[[], T.Any], repeat: int = 1) -> T.Dict[str, T.Any]:
+    """ Minimum and mean wall time of several calls of a function [s] """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'mean': sum(times) / len(times), 'repeat': repeat}
+
+
+def run_command(command: T.Any, args: T.List[str]) -> None:
+    """ Run a click command as from the command line, without exiting """
+    command.main([str(arg) for arg in args], standalone_mode=False)
+
+
+def benchmark_stages(paths: T.Dict[str, Path],
+                     yml_path: Path,
+                     obs_path: Path,
+                     outdir: Path,
+                     workers: int,
+                     output_format: str) -> T.Dict[str, T.Dict[str, T.Any]]:
+    """
+    Time the `vi-run-forecast`, `vi-run-historical` and `vi-run-agro` stages one after the other, then `vi-run-all`.
+    The cache directory is emptied first, so that the first historical run (with `--history-cache`) reads the whole
+    ERA5-Land and TAMSAT files to build the daily history cache and the second one only the days since the last
+    cached day and the overlap days before it (see ``history_cache``). The forecast and agro stages are also timed
+    with the forecast array.
+    """
+    shutil.rmtree(os.environ['VIGICLIMM_CACHE_DIR'], ignore_errors=True)
+    common = ['--yml-path', yml_path, '--outdir', outdir, '--workers', workers, '--output-format', output_format]
+    historical_args = common + ['--obs-path', obs_path, '--era5land-path', paths['era5land'],
+                                '--tamsat-path', paths['tamsat'], '--gfs-path', paths['gfs']]
+    stages = [
+        ('forecast', daily_forecast.run_all_stations, common + ['--ds-path', paths['gfs']]),
+        ('historical', historical.run_all_stations, historical_args + ['--history-cache']),
+        ('historical_cached', historical.run_all_stations, historical_args + ['--history-cache']),
+        ('agro', agro.run_all_stations, common + ['--input-path', outdir]),
+        ('forecast_array', daily_forecast.run_all_stations, common + ['--ds-path', paths['gfs'], '--forecast-array']),
+        ('agro_forecast_array', agro.run_all_stations, common + ['--input-path', outdir, '--forecast-array']),
+        ('all', pipeline.run_all, common + ['--ds-path', paths['gfs'], '--obs-path', obs_path,
+                                            '--era5land-path', paths['era5land'], '--tamsat-path', paths['tamsat']]),
+    ]
+    results = {}
+    for name, command, args in stages:
+        logger.warning(f"Stage {name}")
+        results[name] = timeit(lambda: run_command(command, args))
+    return results
+
+
+def benchmark_kernels(paths: T.Dict[str, Path],
+                      station_list: T.List[T.Dict[str, T.Any]],
+                      repeat: int) -> T.Dict[str, T.Dict[str, T.Any]]:
+    """
+    Time the main kernels of the stages. Kernels named after a single-station function are timed on the first
+    station, the others on all stations.
+    """
+    gfs = open_gfs(paths['gfs'])
+    station = station_list[0]
+
+    rng = np.random.default_rng(0)
+    time_index = pd.date_range(f'{pd.Timestamp.now().year}-01-01', periods=300, freq='D', name='time')
+    coords = {'station': [st['station'] for st in station_list], 'time': time_index}
+    shape = (len(station_list), len(time_index))
+    tmean = xr.DataArray(rng.uniform(20, 32, shape), dims=('station', 'time'), coords=coords)
+    tp = xr.DataArray(rng.gamma(0.5, 6, shape).round(1), dims=('station', 'time'), coords=coords)
+
+    forecast = blocks_to_dataset(daily_forecast.compute_all_stations(gfs, station_list))
+    history = xr.Dataset({'tp': (('station', 'day'), tp.values)},
+                         coords={'station': coords['station'], 'day': np.arange(-len(time_index), 0)})
+
+    kernels = {
+        'preprocess_gfs': lambda: preprocess_gfs(gfs, 'tp', station['lat'], station['lon']),
+        'preprocess_gfs_stations': lambda: preprocess_gfs_stations(gfs, 'tp', station_list),
+        'etp_from_gfs': lambda: etp_from_gfs(gfs, station['lat'], station['lon']),
+        'etp_from_gfs_stations': lambda: etp_from_gfs_stations(gfs, station_list),
+        'forecast_indicators': lambda: daily_forecast.compute_all_stations(gfs, station_list),
+        'forecast_grid': lambda: daily_forecast.compute_grid(gfs),
+        'degree_days': lambda: degree_days(base=18, tmean=tmean, index="hot"),
+        'cdd_max': lambda: cdd_max(tp),
+        'consecutive_event_count': lambda: consecutive_event_count(tp >= 1),
+        'agro_indicators': lambda: agro.compute_agro_dataset(forecast, history),
+    }
+    results = {}
+    for name, kernel in kernels.items():
+        results[name] = timeit(kernel, repeat)
+    return results
+
+
+def environment() -> T.Dict[str, T.Any]:
+    """ Versions of the package, of its main dependencies and of the machine running the benchmarks """
+    versions = {}
+    for package in ['vigiclimm-indicators', 'numpy', 'pandas', 'xarray', 'netCDF4', 'h5netcdf']:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': pd.Timestamp.now().isoformat(timespec='seconds'), 'commit': commit, 'versions': versions,
+            'python': platform.python_version(), 'machine': platform.machine(), 'cpu_count': os.cpu_count()}
+
+
+def compare(results: T.Dict[str, T.Any], previous: T.Dict[str, T.Any]) -> None:
+    """ Print the ratio of each timing to the same timing of a previous run """
+    click.echo(f"{'benchmark':<40} {'stations':>8} {'previous [s]':>12} {'current [s]':>12} {'ratio':>7}")
+    for n_stations, timings in results['results'].items():
+        for group, group_timings in timings.items():
+            for name, timing in group_timings.items():
+                old = previous.get('results', {}).get(n_stations, {}).get(group, {}).get(name)
+                if old is None:
+                    continue
+                click.echo(f"{group + '/' + name:<40} {n_stations:>8} {old['min']:>12.3f} {timing['min']:>12.3f} "
+                           f"{timing['min'] / old['min']:>7.2f}")
+
+
+@click.command()
+@click.option("--workdir", required=True, type=Path)
+@click.option("--output", required=True, type=Path)
+@click.option("--stations", "station_counts", multiple=True, type=click.IntRange(min=1), default=STATION_COUNTS,
+              show_default=True)
+@click.option("--repeat", default=3, show_default=True, type=click.IntRange(min=1))
+@click.option("--workers", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option("--output-format", default='csv', show_default=True, type=click.Choice(['csv', 'netcdf', 'parquet']))
+@click.option("--stages/--no-stages", default=True, show_default=True)
+@click.option("--compare", "previous_path", type=click.Path(exists=True, path_type=Path))
+def run_benchmarks(workdir: Path,
+                   output: Path,
+                   station_counts: T.Sequence[int] = STATION_COUNTS,
+                   repeat: int = 3,
+                   workers: int = 1,
+                   output_format: str = 'csv',
+                   stages: bool = True,
+                   previous_path: T.Optional[Path] = None):
+
+    # the stages log every station
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    os.environ['VIGICLIMM_CACHE_DIR'] = str(workdir / 'cache')
+    logger.warning("Writing synthetic input files")
+    paths = synthetic.write_inputs(workdir)
+
+    results: T.Dict[str, T.Any] = {'environment': environment(), 'results': {}}
+    for n_stations in station_counts:
+        station_list = synthetic.station_list(n_stations)
+        rundir = workdir / f'stations_{n_stations}'
+        shutil.rmtree(rundir, ignore_errors=True)
+        rundir.mkdir(parents=True)
+        yml_path = rundir / 'station_list.yaml'
+        with open(yml_path, 'w') as file:
+            yaml.safe_dump(station_list, file)
+        synthetic.write_observations(rundir / 'obs', station_list, pd.Timestamp.now().normalize())
+
+        logger.warning(f"Benchmarking {n_stations} stations")
+        timings = {'kernels': benchmark_kernels(paths, station_list, repeat)}
+        if stages:
+            timings['stages'] = benchmark_stages(paths, yml_path, rundir / 'obs', rundir / 'output', workers,
+                                                 output_format)
+        results['results'][str(n_stations)] = timings
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    logger.warning(f"Results written to {output}")
+
+    if previous_path is not None:
+        with open(previous_path, 'r') as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    run_benchmarks()
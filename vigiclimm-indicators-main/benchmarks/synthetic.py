@@ -0,0 +1,119 @@
+"""
+Synthetic input files for the benchmarks, with the grids and variables of the operational inputs over Ivory Coast:
+GFS 0.25° (variables of the GRIB to NetCDF conversion, see `gfs_to_nc.yml`), ERA5-Land 0.1° and TAMSAT 0.0375°.
+"""
+import os
+import yaml
+import numpy as np
+import pandas as pd
+import xarray as xr
+import typing as T
+
+from pathlib import Path
+
+GFS_CONFIG = Path(__file__).parents[1] / 'deploy' / 'cipstc' / 'vigiclimm' / 'gfs_to_nc.yml'
+
+# domain of the input files, and of the stations
+LAT_RANGE = (4., 11.)
+LON_RANGE = (-9., -2.)
+
+# range of the synthetic values of each GFS variable
+GFS_VALUES = {
+    'tp': (0, 5),
+    '2t': (293, 313),
+    'dswrf': (0, 900),
+    'gust': (0, 20),
+    '2r': (30, 100),
+    '2d': (285, 300),
+    '10u': (-8, 8),
+    '10v': (-8, 8),
+    'mcc': (0, 100),
+    'lcc': (0, 100),
+}
+
+
+def gfs_variables(config_path: T.Union[str, os.PathLike] = GFS_CONFIG) -> T.List[str]:
+    """ Names of the variables of the GFS file, as extracted by the GRIB to NetCDF conversion """
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)
+    return [var['name'] for var in config['grib_extractor']['filters']]
+
+
+def write_gfs(path: T.Union[str, os.PathLike], today: pd.Timestamp, seed: int = 0) -> None:
+    """ GFS 0.25° forecast, 3-hourly up to D+10 from the D-2 run """
+    rng = np.random.default_rng(seed)
+    valid_time = pd.date_range(today - pd.Timedelta(days=2, hours=-3), periods=8 * 11, freq='3h', name='valid_time')
+    latitude = np.arange(LAT_RANGE[1], LAT_RANGE[0] - 0.125, -0.25)
+    longitude = np.arange(LON_RANGE[0], LON_RANGE[1] + 0.125, 0.25)
+    shape = (len(valid_time), len(latitude), len(longitude))
+    xr.Dataset(
+        {var: (['valid_time', 'latitude', 'longitude'], rng.uniform(*GFS_VALUES[var], shape).astype('float32'))
+         for var in gfs_variables()},
+        coords={'valid_time': valid_time, 'latitude': latitude, 'longitude': longitude}).to_netcdf(path)
+
+
+def write_era5land(path: T.Union[str, os.PathLike], today: pd.Timestamp, seed: int = 1) -> None:
+    """ ERA5-Land 0.1° hourly 2m temperature, from the beginning of the year to D-2 """
+    rng = np.random.default_rng(seed)
+    time = pd.date_range(f'{today.year}-01-01', today - pd.Timedelta(days=2), freq='h', inclusive='left', name='time')
+    latitude = np.arange(LAT_RANGE[1], LAT_RANGE[0] - 0.05, -0.1).round(1)
+    longitude = np.arange(LON_RANGE[0], LON_RANGE[1] + 0.05, 0.1).round(1)
+    xr.Dataset(
+        {'t2m': (['time', 'latitude', 'longitude'],
+                 rng.uniform(293, 310, (len(time), len(latitude), len(longitude))).astype('float32'))},
+        coords={'time': time, 'latitude': latitude, 'longitude': longitude}).to_netcdf(path)
+
+
+def write_tamsat(path: T.Union[str, os.PathLike], today: pd.Timestamp, seed: int = 2) -> None:
+    """ TAMSAT 0.0375° daily rainfall estimates, from the beginning of the year to D-3 """
+    rng = np.random.default_rng(seed)
+    time = pd.date_range(f'{today.year}-01-01', today - pd.Timedelta(days=3), freq='D', name='time')
+    lat = np.arange(LAT_RANGE[0], LAT_RANGE[1] + 0.01875, 0.0375)
+    lon = np.arange(LON_RANGE[0], LON_RANGE[1] + 0.01875, 0.0375)
+    xr.Dataset(
+        {'rfe': (['time', 'lat', 'lon'], rng.gamma(0.5, 6, (len(time), len(lat), len(lon))).astype('float32'))},
+        coords={'time': time, 'lat': lat, 'lon': lon}).to_netcdf(path)
+
+
+def station_list(n_stations: int, seed: int = 3) -> T.List[T.Dict[str, T.Any]]:
+    """ Stations spread at random over the domain """
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(LAT_RANGE[0] + 0.5, LAT_RANGE[1] - 0.5, n_stations).round(2)
+    lon = rng.uniform(LON_RANGE[0] + 0.5, LON_RANGE[1] - 0.5, n_stations).round(2)
+    return [{'station': f'S{n:04d}', 'lon': float(lon[n]), 'lat': float(lat[n])} for n in range(n_stations)]
+
+
+def write_observations(obs_path: T.Union[str, os.PathLike],
+                       station_list: T.List[T.Dict[str, T.Any]],
+                       today: pd.Timestamp,
+                       fraction: float = 0.05,
+                       seed: int = 4) -> None:
+    """ Observation files of a fraction of the stations, from the beginning of the year to D-1 """
+    rng = np.random.default_rng(seed)
+    Path(obs_path).mkdir(parents=True, exist_ok=True)
+    time = pd.date_range(f'{today.year}-01-01', today - pd.Timedelta(days=1), freq='D', name='time')
+    for station in station_list[:max(1, int(len(station_list) * fraction))]:
+        pd.DataFrame({'tmean': rng.uniform(24, 30, len(time)).round(1),
+                      'tp': rng.gamma(0.5, 6, len(time)).round(1)},
+                     index=time).to_csv(Path(obs_path) / f"{station['station']}.csv")
+
+
+def write_inputs(workdir: T.Union[str, os.PathLike], today: T.Optional[pd.Timestamp] = None) -> T.Dict[str, Path]:
+    """
+    Write the GFS, ERA5-Land and TAMSAT files of a day, unless they already exist.
+
+    Args:
+        workdir: Directory of the files.
+        today: Date of the run, today by default.
+
+    Returns:
+        Path of each file.
+    """
+    today = today if today is not None else pd.Timestamp.now().normalize()
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    paths = {name: workdir / f'{name}_{today:%Y%m%d}.nc' for name in ['gfs', 'era5land', 'tamsat']}
+    for name, write in [('gfs', write_gfs), ('era5land', write_era5land), ('tamsat', write_tamsat)]:
+        if not paths[name].exists():
+            write(paths[name], today)
+    return paths
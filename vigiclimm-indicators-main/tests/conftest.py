@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """ Keep the cached station grid indices in a temporary directory """
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('VIGICLIMM_CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture
+def gfs_ds():
+    """ Fake GFS dataset, with the same variables and dimensions as the output of the GRIB to NetCDF conversion """
+    rng = np.random.default_rng(42)
+    valid_time = pd.date_range('2024-06-01 03:00', periods=8 * 11, freq='3h', name='valid_time')
+    latitude = np.arange(11, 4, -0.25)
+    longitude = np.arange(-8.5, -2.5, 0.25)
+    shape = (len(valid_time), len(latitude), len(longitude))
+
+    def field(low, high):
+        return (['valid_time', 'latitude', 'longitude'], rng.uniform(low, high, shape).astype('float32'))
+
+    return xr.Dataset(
+        {'tp': field(0, 5),
+         '2t': field(293, 313),
+         'dswrf': field(0, 900),
+         'gust': field(0, 20),
+         '2r': field(30, 100),
+         '2d': field(285, 300),
+         '10u': field(-8, 8),
+         '10v': field(-8, 8),
+         'mcc': field(0, 100),
+         'lcc': field(0, 100)},
+        coords={'valid_time': valid_time, 'latitude': latitude, 'longitude': longitude})
+
+
+@pytest.fixture
+def gfs_path(gfs_ds, tmp_path):
+    path = tmp_path / 'gfs.nc'
+    gfs_ds.to_netcdf(path)
+    return path
+
+
+@pytest.fixture
+def era5land_path(tmp_path):
+    """ Fake ERA5-Land hourly 2m temperature, from the beginning of the current year to D-2 """
+    rng = np.random.default_rng(0)
+    today = pd.Timestamp.now().normalize()
+    time = pd.date_range(f'{today.year}-01-01', today - pd.Timedelta(days=2), freq='h', inclusive='left', name='time')
+    latitude = np.arange(11, 4, -0.5)
+    longitude = np.arange(-8.5, -2.5, 0.5)
+    path = tmp_path / 'era5land.nc'
+    xr.Dataset(
+        {'t2m': (['time', 'latitude', 'longitude'],
+                 rng.uniform(293, 310, (len(time), len(latitude), len(longitude))).astype('float32'))},
+        coords={'time': time, 'latitude': latitude, 'longitude': longitude}).to_netcdf(path)
+    return path
+
+
+@pytest.fixture
+def tamsat_path(tmp_path):
+    """ Fake TAMSAT daily rainfall estimates, from the beginning of the current year to D-3 """
+    rng = np.random.default_rng(1)
+    today = pd.Timestamp.now().normalize()
+    time = pd.date_range(f'{today.year}-01-01', today - pd.Timedelta(days=3), freq='D', name='time')
+    lat = np.arange(4, 11, 0.25)
+    lon = np.arange(-8.5, -2.5, 0.25)
+    path = tmp_path / 'tamsat.nc'
+    xr.Dataset(
+        {'rfe': (['time', 'lat', 'lon'], rng.gamma(0.5, 6, (len(time), len(lat), len(lon))).astype('float32'))},
+        coords={'time': time, 'lat': lat, 'lon': lon}).to_netcdf(path)
+    return path
@@ -1,7 +1,11 @@
 import pandas as pd
 import numpy as np
+import xarray as xr
 import pytest
 from vigiclimm_indicators.agro_indicators import agro_indicators as agro
+from vigiclimm_indicators.agro_indicators.generate_agro_indicators import compute_agro_indicators
+from vigiclimm_indicators.weather_indicators.utils import cdd_max, write_to_csv
+from vigiclimm_indicators.weather_indicators.daily_forecast import wet_days
 
 
 @pytest.fixture
@@ -50,6 +54,13 @@ class TestLandPreparation:
     def test_critical_condition(self, df):
         assert agro.land_preparation(self.last_month_dry.tp, df.tp, df.gust).iloc[0] == 0
 
+    def test_dry_soil(self, df, tmp_path):
+        condition = agro.land_preparation(self.last_month_dry.tp, df.tp * 0, df.gust)
+        assert condition.dtype == int
+        # written as 0 in the CSV files, as the other critical conditions
+        write_to_csv(condition, tmp_path, 'station', 'land_preparation')
+        assert (tmp_path / 'station_forecast_land_preparation.csv').read_text().splitlines()[1].endswith(',0')
+
     def test_ideal_condition(self, df):
         assert agro.land_preparation(self.last_month_wet.tp, df.tp, df.gust).iloc[2] == 2
 
@@ -124,6 +135,70 @@ class TestSowing:
     def test_intermediate_condition(self, df):
         assert agro.sowing(self.last_month_dry.tp, df.tp, df.gust).iloc[4] == 1
 
+    @staticmethod
+    def sowing_loop(tp_histo, tp, gust):
+        """ Reference implementation, day by day """
+        tp_merged = pd.concat([tp_histo, tp]).iloc[-17:]
+        condition_values = []
+        for i in range(0, len(tp)):
+            if (tp.iloc[i] <= 10) & (tp.iloc[i] >= 1) & (gust.iloc[i] <= 30) & (cdd_max(tp_merged.iloc[i: 7 + i]) <= 5):
+                result = 2
+            elif (tp.iloc[i] > 30) | (gust.iloc[i] > 50) | (cdd_max(tp_merged.iloc[i: 7 + i]) >= 7):
+                result = 0
+            else:
+                result = 1
+            condition_values.append(result)
+        return pd.Series(condition_values, index=tp.index, dtype="int")
+
+    @pytest.mark.parametrize('history_size', [0, 1, 3, 6, 7, 30])
+    @pytest.mark.parametrize('forecast_size', [4, 10, 20])
+    @pytest.mark.parametrize('dry', [False, True])
+    def test_same_as_loop(self, history_size, forecast_size, dry):
+        rng = np.random.default_rng(history_size + forecast_size)
+        time = pd.date_range('2024-01-01', periods=history_size + forecast_size, freq='D')
+        values = [0, 0.5, 2, 12, 40]
+        # mostly dry days, with dry spells of several days
+        weights = [0.45, 0.35, 0.1, 0.05, 0.05] if dry else None
+        for _ in range(20):
+            tp_histo = pd.Series(rng.choice(values, history_size, p=weights), index=time[:history_size])
+            tp = pd.Series(rng.choice(values, forecast_size, p=weights), index=time[history_size:])
+            tp[rng.uniform(size=forecast_size) < 0.1] = np.nan
+            gust = pd.Series(rng.uniform(0, 60, forecast_size), index=tp.index)
+            pd.testing.assert_series_equal(agro.sowing(tp_histo, tp, gust), self.sowing_loop(tp_histo, tp, gust))
+
+    @pytest.mark.parametrize('history_size', range(7))
+    def test_short_dry_history(self, history_size):
+        time = pd.date_range('2024-01-01', periods=history_size + 10, freq='D')
+        tp_histo = pd.Series(np.zeros(history_size), index=time[:history_size])
+        tp = pd.Series([0.] * 8 + [5., 5.], index=time[history_size:])
+        gust = pd.Series(np.zeros(10), index=tp.index)
+        expected = self.sowing_loop(tp_histo, tp, gust)
+        pd.testing.assert_series_equal(agro.sowing(tp_histo, tp, gust), expected)
+        if history_size == 3:
+            assert expected.tolist() == [0, 0, 0, 0, 0, 1, 1, 1, 2, 2]
+
+    # padded history of 30 days, shorter than 7 days (e.g. first days of January), or without any day
+    @pytest.mark.parametrize('history_days, history_sizes', [(30, [30, 12, 3, 0]), (5, [5, 3, 0]), (0, [0, 0])])
+    @pytest.mark.parametrize('forecast_size', [4, 10])
+    def test_stations(self, history_days, history_sizes, forecast_size):
+        rng = np.random.default_rng(0)
+        time = pd.date_range('2024-01-01', periods=history_days + forecast_size, freq='D')
+        tp_histo = np.full((len(history_sizes), history_days), np.nan)
+        for n, size in enumerate(history_sizes):
+            tp_histo[n, history_days - size:] = rng.choice([0, 0, 0, 0.5, 2, 12], size)
+        tp = xr.DataArray(rng.choice([0, 0, 0, 0.5, 2, 12, 40], (len(history_sizes), forecast_size)),
+                          dims=('station', 'time'), coords={'time': time[history_days:]})
+        gust = xr.DataArray(rng.uniform(0, 60, tp.shape), dims=tp.dims, coords=tp.coords)
+
+        condition = agro.sowing(xr.DataArray(tp_histo, dims=('station', 'time')), tp, gust)
+
+        assert condition.dims == ('station', 'time')
+        for n, size in enumerate(history_sizes):
+            expected = self.sowing_loop(
+                pd.Series(tp_histo[n, history_days - size:], index=time[history_days - size:history_days]),
+                tp.isel(station=n).to_series(), gust.isel(station=n).to_series())
+            np.testing.assert_array_equal(condition.isel(station=n).values, expected.values)
+
 
 class TestIrrigation:
 
@@ -146,3 +221,129 @@ class TestIrrigation:
 
     def test_intermediate_condition(self):
         assert agro.irrigation(self.last_month_dry.tp, self.df.tp, self.df.etp).iloc[2] == 1
+
+
+def test_sowing_history_dry_spell():
+    # the dry spell criterion of sowing looks at the last days of the historical rainfall
+    time = pd.date_range('2024-01-01', freq='D', periods=10, name='time')
+    forecast = pd.DataFrame({'tp': 5., 'gust': 10., 'tmax': 32., 'tmean': 27., 'tmin': 22., 'rhmean': 60.,
+                             'rhmin': 40., 'mcc': 20., 'lcc': 20., 'etp': 5.}, index=time)
+    history = pd.DataFrame({'tp': np.zeros(30)}, index=pd.date_range('2023-12-02', freq='D', periods=30, name='time'))
+    sowing = compute_agro_indicators(forecast, history)['sowing']
+    # 7, 6 then at most 5 dry days in the 7-day windows
+    assert sowing.tolist() == [0, 1] + [2] * 8
+
+
+def _fertilization_loop(tp_histo, tp, tmax, rhmean, gust):
+    """ Reference implementation, day by day """
+    conditions_values = []
+    for i in range(0, len(tp)):
+        if i == 0:
+            recent_wet_days = (wet_days(tp_histo.iloc[-1])) & (wet_days(tp.iloc[i]))
+        else:
+            recent_wet_days = wet_days(tp.iloc[i - 1: i + 1]).sum() >= 1
+        if recent_wet_days & (rhmean.iloc[i] >= 70) & (tmax.iloc[i] < 35) & (tp.iloc[i] > 5) & (tp.iloc[i] < 10):
+            result = 2
+        elif (tp.iloc[i] >= 30) | (tmax.iloc[i] >= 38):
+            result = 0
+        else:
+            result = 1
+        conditions_values.append(result)
+    return pd.Series(conditions_values, index=tp.index, dtype="int")
+
+
+def _harvesting_loop(tp_histo, tp, rhmean):
+    """ Reference implementation, day by day """
+    list_conditions = []
+    for i in range(0, len(tp)):
+        if (tp.iloc[i:i + 2].sum() == 0) & (rhmean.iloc[i] < 80) & (tp_histo.sum() == 0):
+            result = 2
+        elif (tp.iloc[i:i + 2].sum() > 5):
+            result = 0
+        else:
+            result = 1
+        list_conditions.append(result)
+    return pd.Series(list_conditions, index=tp.index, dtype="int")
+
+
+def _protection_loop(tp_histo, tp, tmax, gust, cloud_cover):
+    """ Reference implementation, day by day """
+    list_conditions = []
+    for i in range(0, len(tp)):
+        if i == 0:
+            recent_wet_days = (wet_days(tp_histo.iloc[-1])) & (wet_days(tp.iloc[i]))
+        else:
+            recent_wet_days = wet_days(tp.iloc[i - 1: i + 1]).sum() >= 1
+        if recent_wet_days & (tmax.iloc[i] < 35) & (tp.iloc[i] < 15) & (cloud_cover.iloc[i] >= 50):
+            result = 2
+        elif (gust.iloc[i] >= 50) | (tmax.iloc[i] >= 38) & (cloud_cover.iloc[i] <= 20):
+            result = 0
+        else:
+            result = 1
+        list_conditions.append(result)
+    return pd.Series(list_conditions, index=tp.index, dtype="int")
+
+
+def _irrigation_loop(tp_histo, tp, etp):
+    """ Reference implementation, day by day """
+    list_conditions = []
+    for i in range(0, len(tp)):
+        tp_previous = tp_histo.iloc[-1] if i == 0 else tp.iloc[i - 1]
+        if (tp_previous <= 1) & (tp.iloc[i] <= 1) & (etp.iloc[i] >= 10) & (tp.iloc[i:i + 5].sum() <= 10):
+            result = 2
+        elif (tp.iloc[i] >= 10) | (etp.iloc[i] <= 5) | (tp.iloc[i:i + 5].sum() >= 50):
+            result = 0
+        else:
+            result = 1
+        list_conditions.append(result)
+    return pd.Series(list_conditions, index=tp.index, dtype="int")
+
+
+class TestSameAsLoop:
+
+    n_stations = 60
+
+    @pytest.fixture
+    def data(self):
+        """ Random forecasts and histories, rainfall in tenth of mm to check the thresholds and sums rounding """
+        rng = np.random.default_rng(0)
+        time = pd.date_range('2024-01-01', periods=40, freq='D')
+        shape = (self.n_stations, 10)
+
+        def forecast(values):
+            return xr.DataArray(values, dims=('station', 'time'), coords={'time': time[30:]})
+
+        tp = rng.choice([0, 0.1, 0.9, 1, 1.1, 2.5, 5, 5.1, 9.9, 10, 14.9, 15, 29.9, 30, 45], shape)
+        tp[rng.uniform(size=shape) < 0.4] = 0
+        tp[rng.uniform(size=shape) < 0.05] = np.nan
+        tp_histo = np.round(rng.gamma(0.3, 4, (self.n_stations, 30)), 1)
+        tp_histo[:5] = 0
+        return {
+            'tp_histo': xr.DataArray(tp_histo, dims=('station', 'time'), coords={'time': time[:30]}),
+            'tp': forecast(tp),
+            'tmax': forecast(rng.choice([30, 34.9, 35, 37.9, 38, 40], shape)),
+            'rhmean': forecast(rng.choice([60, 69.9, 70, 79.9, 80, 95], shape)),
+            'gust': forecast(rng.choice([10, 49.9, 50, 60], shape)),
+            'cloud_cover': forecast(rng.choice([10, 20, 20.1, 49.9, 50, 80], shape)),
+            'etp': forecast(rng.choice([4, 5, 5.1, 9.9, 10, 12], shape)),
+        }
+
+    @pytest.mark.parametrize('indicator, reference, params', [
+        (agro.fertilization, _fertilization_loop, ['tp_histo', 'tp', 'tmax', 'rhmean', 'gust']),
+        (agro.harvesting, _harvesting_loop, ['tp_histo', 'tp', 'rhmean']),
+        (agro.protection, _protection_loop, ['tp_histo', 'tp', 'tmax', 'gust', 'cloud_cover']),
+        (agro.irrigation, _irrigation_loop, ['tp_histo', 'tp', 'etp']),
+    ])
+    def test_indicator(self, data, indicator, reference, params):
+        stations = indicator(*(data[par] for par in params))
+        assert stations.dims == ('station', 'time')
+        for n in range(self.n_stations):
+            series = [data[par].isel(station=n).to_series() for par in params]
+            expected = reference(*series)
+            pd.testing.assert_series_equal(indicator(*series), expected)
+            np.testing.assert_array_equal(stations.isel(station=n).values, expected.values)
+
+
+def test_land_preparation_dry_soil(df):
+    tp = pd.Series(0., index=df.index)
+    assert (agro.land_preparation(TestLandPreparation.last_month_dry.tp, tp, df.gust) == 0).all()
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import xarray as xr
+from click.testing import CliRunner
+from vigiclimm_indicators.weather_indicators import daily_forecast
+from vigiclimm_indicators.weather_indicators.preprocess import open_gfs, preprocess_gfs
+from vigiclimm_indicators.weather_indicators.etp import etp_from_gfs
+
+
+class TestComputeAllStations:
+
+    station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                    {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42}]
+
+    @pytest.fixture
+    def forecast(self, gfs_path):
+        return daily_forecast.compute_all_stations(open_gfs(gfs_path), self.station_list)
+
+    def test_raw_parameters(self, gfs_path, forecast):
+        for par in ['tp', 'tmax', 'tmean', 'tmin', 'dswrf', 'rhmean', 'gust', 'lcc']:
+            for i, station in enumerate(self.station_list):
+                exp = preprocess_gfs(gfs_path, par, station['lat'], station['lon'], convert=(par != 'dswrf'))
+                np.testing.assert_array_equal(forecast[par].isel(station=i).values, exp.values)
+
+    def test_etp(self, gfs_path, forecast):
+        for i, station in enumerate(self.station_list):
+            exp = etp_from_gfs(gfs_path, station['lat'], station['lon'])
+            np.testing.assert_array_equal(forecast['etp'].isel(station=i).values, exp.values)
+
+    def test_write(self, forecast, tmp_path):
+        daily_forecast.write_all_stations(forecast, tmp_path)
+        assert len(list(tmp_path.glob('*_forecast_*.csv'))) == len(self.station_list) * len(forecast)
+        assert (tmp_path / 'Korhogo_forecast_sum_tp.csv').read_text().count('\n') == 2
+
+
+class TestComputeGrid:
+
+    @pytest.fixture
+    def grid(self, gfs_path):
+        with open_gfs(gfs_path, load=False) as ds:
+            return daily_forecast.compute_grid(ds, chunk_size=5)
+
+    def test_same_as_stations(self, gfs_path, grid):
+        ds = open_gfs(gfs_path)
+        # stations on grid cells, the last one in the last block of latitudes
+        cells = [(0, 0), (7, 3), (ds.sizes['latitude'] - 1, ds.sizes['longitude'] - 1)]
+        station_list = [{'station': f'S{n}', 'lat': float(ds.latitude[i]), 'lon': float(ds.longitude[j])}
+                        for n, (i, j) in enumerate(cells)]
+        forecast = daily_forecast.compute_all_stations(ds, station_list)
+
+        assert sorted(grid) == sorted(forecast)
+        for par, data in grid.items():
+            assert data.dims == ('time', 'latitude', 'longitude')
+            for n, (i, j) in enumerate(cells):
+                expected = forecast[par].isel(station=n)
+                np.testing.assert_array_equal(data.isel(latitude=i, longitude=j).values, expected.values,
+                                              err_msg=par)
+                assert data.dtype == expected.dtype
+
+    def test_chunk_size(self, gfs_path, grid):
+        with open_gfs(gfs_path, load=False) as ds:
+            single_block = daily_forecast.compute_grid(ds, chunk_size=ds.sizes['latitude'])
+        for par, data in grid.items():
+            assert data.identical(single_block[par]), par
+
+    def test_run_grid(self, gfs_path, tmp_path):
+        result = CliRunner().invoke(daily_forecast.run_grid, ['--ds-path', gfs_path, '--outdir', tmp_path,
+                                                              '--chunk-size', 4])
+        assert result.exit_code == 0, result.output
+        assert len(list(tmp_path.glob('grid_forecast_*.nc'))) == 17
+        with xr.open_dataset(tmp_path / 'grid_forecast_etp.nc') as ds:
+            assert ds['etp'].sizes['time'] == 10
+
+
+def test_all_stations_failed(gfs_path, tmp_path, monkeypatch):
+    def fail(ds_path, station_list):
+        raise ValueError("no data")
+
+    monkeypatch.setattr(daily_forecast, 'compute_all_stations', fail)
+    yml_path = tmp_path / 'stations.yaml'
+    yml_path.write_text("- station: Boundiali\n  lon: -6.47\n  lat: 9.52\n")
+    result = CliRunner().invoke(daily_forecast.run_all_stations, [
+        '--yml-path', yml_path, '--ds-path', gfs_path, '--outdir', tmp_path / 'output', '--output-format', 'netcdf',
+        '--forecast-array'])
+    # the failed stations are reported, without any store to write
+    assert result.exit_code == 1 and isinstance(result.exception, SystemExit), result.output
+    assert not (tmp_path / 'output' / 'forecast.nc').exists()
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vigiclimm_indicators.weather_indicators import daily_forecast, dtypes, utils
+from vigiclimm_indicators.weather_indicators.extreme_events import generate_risk
+from vigiclimm_indicators.weather_indicators.preprocess import postprocess_gfs
+from vigiclimm_indicators.agro_indicators import agro_indicators as agro
+from vigiclimm_indicators.agro_indicators.disease import rice_blast
+
+station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42}]
+
+
+@pytest.fixture
+def compact():
+    dtypes.set_compact_dtypes()
+    yield
+    dtypes.set_compact_dtypes(False)
+
+
+def _open_inputs():
+    return {}
+
+
+def _task(station_list):
+    return [], dtypes.code_dtype()
+
+
+def test_default_dtypes():
+    assert not dtypes.is_compact_dtypes()
+    assert generate_risk(pd.Series([5., 20., 40.]), 10, 30).dtype == np.int64
+
+
+def test_codes(compact):
+    tp = pd.Series([5., 20., 40., 0.])
+    risk = generate_risk(tp, 10, 30)
+    assert risk.dtype == np.int8
+    assert risk.tolist() == [0, 1, 2, 0]
+    assert generate_risk(tp.to_xarray(), 10, 30).dtype == np.int8
+
+    blast = rice_blast(pd.Series([26., 27., 30.]), pd.Series([20., 23., 25.]), pd.Series([95., 88., 95.]))
+    assert blast.dtype == np.int8
+    assert blast.tolist() == [2, 1, 0]
+    assert agro.drying(tp, tp + 30, tp + 60, tp + 50).dtype == np.int8
+    assert agro.sowing(pd.Series(np.zeros(30)), tp, tp).dtype == np.int8
+
+
+def test_physical(compact, gfs_ds):
+    data = gfs_ds['2t'].isel(latitude=0, longitude=0).astype('float64')
+    converted = postprocess_gfs(data, 'tmax', convert=True)
+    assert converted.dtype == np.float32
+    np.testing.assert_array_equal(converted.values, np.round(data.values - 273.15, 1).astype('float32'))
+
+
+def test_forecast_same_values(gfs_ds):
+    expected = daily_forecast.compute_all_stations(gfs_ds, station_list)
+    dtypes.set_compact_dtypes()
+    try:
+        forecast = daily_forecast.compute_all_stations(gfs_ds, station_list)
+    finally:
+        dtypes.set_compact_dtypes(False)
+
+    assert forecast['etp'].dtype == np.float32
+    assert forecast['wet_days'].dtype == bool
+    for par in ['heavy_rain', 'heat_stress', 'strong_wind']:
+        assert expected[par].dtype == np.int64 and forecast[par].dtype == np.int8
+    for par, data in expected.items():
+        np.testing.assert_array_equal(forecast[par].values, data.values.astype(forecast[par].dtype), err_msg=par)
+
+
+def test_workers(compact):
+    station_list = [{'station': f'station_{n}', 'lat': 0, 'lon': 0} for n in range(4)]
+    failed, outputs = utils.run_sharded(_task, station_list, 2, _open_inputs)
+    assert set(outputs) == {np.dtype(np.int8)}
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from vigiclimm_indicators.agro_indicators import generate_agro_indicators as gen
+from vigiclimm_indicators.weather_indicators.output_store import (
+    read_array, stations_to_dataset, write_array, write_store)
+
+
+@pytest.fixture
+def frames():
+    """ Forecast parameters of several stations, as read from the CSV files """
+    rng = np.random.default_rng(0)
+    time = pd.date_range('2024-06-01', periods=10, freq='D', name='time')
+    ranges = {'tp': (0, 40), 'tmax': (28, 42), 'tmean': (22, 32), 'tmin': (18, 26), 'rhmean': (40, 100),
+              'rhmin': (5, 60), 'gust': (0, 70), 'mcc': (0, 100), 'lcc': (0, 100), 'etp': (2, 12)}
+    frames = {}
+    for n in range(12):
+        df = pd.DataFrame({par: rng.uniform(low, high, len(time)).round(1) for par, (low, high) in ranges.items()},
+                          index=time)
+        df.loc[rng.uniform(size=len(time)) < 0.4, 'tp'] = 0
+        frames[f'station_{n}'] = df
+    return frames
+
+
+@pytest.fixture
+def histories():
+    """ Historical rainfall of several stations, of different lengths """
+    rng = np.random.default_rng(1)
+    histories = {}
+    for n, size in enumerate([150, 150, 149, 30, 5, 3] * 2):
+        time = pd.date_range(end='2024-05-31', periods=size, freq='D', name='time')
+        histories[f'station_{n}'] = pd.Series(rng.gamma(0.3, 4, size).round(1), index=time)
+    histories['station_6'][:] = 0
+    return histories
+
+
+def test_same_as_stations(frames, histories):
+    ds = gen.compute_agro_dataset(gen.forecast_block(frames), gen.history_block(histories))
+
+    assert list(ds['station'].values) == list(frames)
+    for i, (station, df) in enumerate(frames.items()):
+        expected = gen.compute_agro_indicators(df, histories[station].to_frame('tp'))
+        assert sorted(ds.data_vars) == sorted(expected)
+        for par, series in expected.items():
+            np.testing.assert_array_equal(ds[par].isel(station=i).values, series.values, err_msg=f'{station} {par}')
+
+
+def test_float32_forecast(frames, histories):
+    forecast = gen.forecast_block(frames)
+    ds = gen.compute_agro_dataset(forecast.astype('float32'), gen.history_block(histories))
+    assert ds.identical(gen.compute_agro_dataset(forecast, gen.history_block(histories)))
+
+
+@pytest.mark.parametrize('missing', [[], [0, -1], [-2, -1]])
+def test_history_from_store(histories, missing):
+    # missing values of the histories themselves, kept as NaN rows
+    for tp in histories.values():
+        tp.iloc[[n for n in missing if -len(tp) <= n < len(tp)]] = np.nan
+    store = stations_to_dataset({station: {'tp': tp} for station, tp in histories.items()}, period='historical')
+    assert gen.history_from_store(store).identical(gen.history_block(histories))
+
+
+def test_forecast_array(frames, histories, tmp_path):
+    forecast = gen.forecast_block(frames)
+    path = write_array(forecast.astype('float32'), tmp_path / 'forecast.bin')
+    ds = gen.compute_agro_dataset(read_array(path), gen.history_block(histories))
+    assert ds.identical(gen.compute_agro_dataset(forecast, gen.history_block(histories)))
+
+
+def test_failed_stations_exit_status(tmp_path):
+    yml_path = tmp_path / 'stations.yaml'
+    yml_path.write_text("- station: Boundiali\n  lon: -6.47\n  lat: 9.52\n")
+    (tmp_path / 'input').mkdir()
+    # no forecast nor historical CSV files for the station
+    result = CliRunner().invoke(gen.run_all_stations, ['--yml-path', yml_path, '--input-path', tmp_path / 'input',
+                                                       '--outdir', tmp_path / 'output'])
+    assert result.exit_code == 1
+
+
+def test_all_stations_failed(frames, histories, tmp_path, monkeypatch):
+    def fail(forecast, history):
+        raise ValueError("no data")
+
+    write_store(gen.forecast_block(frames), tmp_path / 'input', 'forecast', 'netcdf')
+    write_store(stations_to_dataset({station: {'tp': tp} for station, tp in histories.items()}, period='historical'),
+                tmp_path / 'input', 'historical', 'netcdf')
+    monkeypatch.setattr(gen, 'compute_agro_dataset', fail)
+    yml_path = tmp_path / 'stations.yaml'
+    yml_path.write_text("- station: station_0\n  lon: -6.47\n  lat: 9.52\n")
+    result = CliRunner().invoke(gen.run_all_stations, ['--yml-path', yml_path, '--input-path', tmp_path / 'input',
+                                                       '--outdir', tmp_path / 'output', '--output-format', 'netcdf'])
+    assert result.exit_code == 1 and isinstance(result.exception, SystemExit), result.output
+    assert not (tmp_path / 'output' / 'agro.nc').exists()
@@ -0,0 +1,124 @@
+import sys
+import types
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+from pathlib import Path
+from click.testing import CliRunner
+from vigiclimm_indicators.weather_indicators import daily_forecast, gfs_stream
+from vigiclimm_indicators.weather_indicators.preprocess import DAILY_METHODS, daily_gfs_grid, open_gfs
+
+station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42}]
+
+
+def steps(ds):
+    return [ds.isel(valid_time=n) for n in range(ds.sizes['valid_time'])]
+
+
+def test_same_as_resample(gfs_ds):
+    daily = gfs_stream.aggregate_daily(steps(gfs_ds))
+    expected = daily_gfs_grid(gfs_ds, [par for par in DAILY_METHODS if par != '10ws'])
+
+    assert daily.attrs['aggregation'] == 'daily'
+    assert sorted(daily.data_vars) == sorted(expected)
+    for par, data in expected.items():
+        obs = daily[par].rename(valid_time='time')
+        assert obs.dtype == data.dtype
+        np.testing.assert_array_equal(obs['time'].values, data['time'].values)
+        np.testing.assert_allclose(obs.values, data.values, rtol=1e-6, atol=1e-5, err_msg=par)
+
+
+def test_forecast_same_as_gfs(gfs_ds, tmp_path):
+    gfs_stream.aggregate_daily(steps(gfs_ds)).to_netcdf(tmp_path / 'gfs_daily.nc')
+    forecast = daily_forecast.compute_all_stations(open_gfs(tmp_path / 'gfs_daily.nc'), station_list)
+    expected = daily_forecast.compute_all_stations(gfs_ds, station_list)
+    for par, data in expected.items():
+        np.testing.assert_array_equal(forecast[par].values, data.values, err_msg=par)
+        np.testing.assert_array_equal(forecast[par]['time'].values, data['time'].values)
+
+
+def test_missing_variable_backfilled(gfs_ds):
+    step_list = steps(gfs_ds)
+    step_list[0] = step_list[0].drop_vars('tp')
+    daily = gfs_stream.aggregate_daily(step_list)
+
+    filled = gfs_ds.copy()
+    filled['tp'][0] = filled['tp'][1]
+    expected = daily_gfs_grid(filled, ['tp'])['tp']
+    np.testing.assert_allclose(daily['tp'].values, expected.values, rtol=1e-6)
+
+
+# forecast steps zero-padded or not in the file names, which are then not in the order of the steps
+@pytest.mark.parametrize('step_format', ['03d', 'd'])
+def test_stream_gfs(gfs_ds, tmp_path, step_format):
+    (tmp_path / 'steps').mkdir()
+    # the missing variable is filled with the next step
+    step_list = steps(gfs_ds)
+    step_list[0] = step_list[0].drop_vars('tp')
+    for n, step in enumerate(step_list):
+        step.to_netcdf(tmp_path / 'steps' / f'gfs_f{3 * (n + 1):{step_format}}.nc')
+    config_path = tmp_path / 'gfs_to_nc.yml'
+    config_path.write_text("grib_extractor:\n  filters:\n"
+                           + "".join(f"    - name: {name}\n      filter: {{}}\n" for name in gfs_ds.data_vars))
+
+    result = CliRunner().invoke(gfs_stream.stream_gfs, [
+        '--config-file', config_path, '--input-dir', tmp_path / 'steps', '--input-filename-template', 'gfs_f*.nc',
+        '--output-path', tmp_path / 'gfs_daily.nc'])
+    assert result.exit_code == 0, result.output
+    with xr.open_dataset(tmp_path / 'gfs_daily.nc') as ds:
+        assert ds.sizes['valid_time'] == 10
+        assert ds.identical(gfs_stream.aggregate_daily(step_list))
+
+
+def test_grib_requires_cfgrib(tmp_path, monkeypatch):
+    # cfgrib is not installed, or cannot be imported
+    monkeypatch.setitem(sys.modules, 'cfgrib', None)
+    with pytest.raises(ImportError):
+        gfs_stream.read_step(tmp_path / 'gfs.f003.grib2', {'tp': {}})
+
+
+def test_grib_index_shared(tmp_path, monkeypatch):
+    # the GRIB file is indexed once for all the filters, in a temporary directory
+    monkeypatch.setitem(sys.modules, 'cfgrib', types.ModuleType('cfgrib'))
+    calls = []
+
+    def open_dataset(path, engine, backend_kwargs):
+        calls.append(backend_kwargs)
+        return xr.Dataset({'unknown': ('x', [float(len(calls))])})
+
+    monkeypatch.setattr(gfs_stream.xr, 'open_dataset', open_dataset)
+    step = gfs_stream.read_step(tmp_path / 'gfs.f003.grib2', {'tp': {'parameterNumber': 8}, '2t': {'level': 2}})
+    assert [call['filter_by_keys'] for call in calls] == [{'parameterNumber': 8}, {'level': 2}]
+    assert len({call['indexpath'] for call in calls}) == 1
+    assert tmp_path not in Path(calls[0]['indexpath']).parents
+    assert not Path(calls[0]['indexpath']).parent.exists()
+    assert step['tp'].values.tolist() == [1.] and step['2t'].values.tolist() == [2.]
+
+
+def test_read_grib(gfs_ds, tmp_path):
+    pytest.importorskip('cfgrib')
+    from cfgrib.xarray_to_grib import to_grib
+
+    filters = {'tp': {'parameterNumber': 8, 'parameterCategory': 1, 'typeOfLevel': 'surface'},
+               'gust': {'parameterNumber': 22, 'parameterCategory': 2, 'typeOfLevel': 'surface'}}
+    drop_vars = ['time', 'surface', 'step']
+    reference_time = pd.Timestamp(gfs_ds['valid_time'].values[0]) - pd.Timedelta(hours=3)
+    (tmp_path / 'steps').mkdir()
+    for n, step in enumerate(steps(gfs_ds.isel(valid_time=slice(None, 4)))):
+        grib = xr.Dataset({name: step[name].drop_vars('valid_time').assign_attrs(
+            GRIB_parameterNumber=keys['parameterNumber'], GRIB_parameterCategory=keys['parameterCategory'])
+            for name, keys in filters.items()})
+        to_grib(grib, tmp_path / 'steps' / f'gfs.f{3 * (n + 1)}.grib2', no_warn=True,
+                grib_keys={'edition': 2, 'typeOfLevel': 'surface', 'dataDate': int(reference_time.strftime('%Y%m%d')),
+                           'dataTime': int(reference_time.strftime('%H%M')), 'stepUnits': 1, 'step': 3 * (n + 1)})
+
+    paths = sorted((tmp_path / 'steps').glob('*.grib2'), key=gfs_stream.step_time)
+    assert [path.name for path in paths] == [f'gfs.f{3 * (n + 1)}.grib2' for n in range(4)]
+    for path, expected in zip(paths, steps(gfs_ds.isel(valid_time=slice(None, 4)))):
+        step = gfs_stream.read_step(path, filters, drop_vars)
+        assert sorted(step.data_vars) == sorted(filters)
+        assert pd.Timestamp(step['valid_time'].values) == pd.Timestamp(expected['valid_time'].values)
+        for name in filters:
+            np.testing.assert_allclose(step[name].values, expected[name].values, atol=1e-2, err_msg=name)
@@ -0,0 +1,34 @@
+import numpy as np
+from vigiclimm_indicators.weather_indicators import grid_index
+
+
+class TestStationGridIndex:
+
+    station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                    {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42},
+                    {'station': 'Touba', 'lon': -7.68, 'lat': 8.28}]
+
+    def test_same_as_sel_nearest(self, gfs_ds):
+        data = gfs_ds['2t']
+        obs = grid_index.select_stations(data, self.station_list)
+        for n, station in enumerate(self.station_list):
+            exp = data.sel(latitude=station['lat'], longitude=station['lon'], method='nearest')
+            np.testing.assert_array_equal(obs.isel(station=n).values, exp.values)
+            np.testing.assert_array_equal(
+                grid_index.select_station(data, station['lat'], station['lon']).values, exp.values)
+
+    def test_cache_file(self, gfs_ds, cache_dir):
+        i, j = grid_index.load_station_grid_index(gfs_ds.latitude, gfs_ds.longitude, self.station_list)
+        assert len(list(cache_dir.glob('station_grid_index_*.npz'))) == 1
+
+        # a new station list gives a new index
+        station_list = self.station_list + [{'station': 'Odienné', 'lon': -7.57, 'lat': 9.5}]
+        i_new, j_new = grid_index.load_station_grid_index(gfs_ds.latitude, gfs_ds.longitude, station_list)
+        assert len(list(cache_dir.glob('station_grid_index_*.npz'))) == 2
+        np.testing.assert_array_equal(i_new[:3], i)
+        np.testing.assert_array_equal(j_new[:3], j)
+
+    def test_grid_change(self, gfs_ds):
+        i, j = grid_index.load_station_grid_index(gfs_ds.latitude, gfs_ds.longitude, self.station_list)
+        i_new, j_new = grid_index.load_station_grid_index(gfs_ds.latitude[2:], gfs_ds.longitude, self.station_list)
+        np.testing.assert_array_equal(i_new, i - 2)
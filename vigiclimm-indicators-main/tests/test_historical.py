@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+from vigiclimm_indicators.weather_indicators import historical
+from vigiclimm_indicators.weather_indicators.preprocess import extract_gfs_stations
+
+
+class TestEra5Land:
+
+    station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                    {'station': 'Dianra', 'lon': -6.25, 'lat': 8.75},
+                    {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42}]
+
+    @staticmethod
+    def station_reference(era5land_path, station_lat, station_lon):
+        """ Station by station, on the whole file """
+        with xr.open_dataset(era5land_path) as ds:
+            data = ds['t2m'].sel(latitude=station_lat, longitude=station_lon, method='nearest').round(1)
+            return (data.resample(time='D').mean() - 273.15).to_series()
+
+    @pytest.mark.parametrize('chunk_days', [1, 7, 31, 400])
+    def test_same_as_stations(self, era5land_path, chunk_days):
+        daily = historical.get_era5_land_stations(era5land_path, self.station_list, chunk_days=chunk_days)
+        assert daily.dims == ('station', 'time')
+        for station in self.station_list:
+            expected = self.station_reference(era5land_path, station['lat'], station['lon'])
+            np.testing.assert_array_equal(daily.sel(station=station['station']).values, expected.values)
+            assert (daily['time'].values == expected.index.values).all()
+
+    def test_start(self, era5land_path):
+        full = historical.get_era5_land_stations(era5land_path, self.station_list)
+        start = pd.Timestamp(full['time'].values[-3])
+        daily = historical.get_era5_land_stations(era5land_path, self.station_list, start=start)
+        assert daily['time'].values[0] == start
+        assert daily.identical(full.sel(time=slice(start, None)))
+
+    def test_station(self, era5land_path):
+        daily = historical.get_era5_land_stations(era5land_path, self.station_list[:2])
+        for station in self.station_list:
+            series = historical.get_era5_land_data(era5land_path, station['lat'], station['lon'],
+                                                   station['station'], daily)
+            expected = self.station_reference(era5land_path, station['lat'], station['lon'])
+            np.testing.assert_array_equal(series.values, expected.values)
+
+
+class TestTamsat:
+
+    station_list = TestEra5Land.station_list
+
+    def test_same_as_stations(self, tamsat_path):
+        daily = historical.get_tamsat_stations(tamsat_path, self.station_list)
+        assert daily.dims == ('station', 'time')
+        with xr.open_dataset(tamsat_path) as ds:
+            for station in self.station_list:
+                expected = ds['rfe'].sel(lat=station['lat'], lon=station['lon'], method='nearest').round(1)
+                np.testing.assert_array_equal(daily.sel(station=station['station']).values, expected.values)
+
+    def test_station(self, tamsat_path, gfs_path):
+        daily = historical.get_tamsat_stations(tamsat_path, self.station_list[:2])
+        for station in self.station_list:
+            series = historical.get_tamsat_data(tamsat_path, gfs_path, station['lat'], station['lon'],
+                                                station=station['station'], tamsat_daily=daily)
+            expected = historical.get_tamsat_data(tamsat_path, gfs_path, station['lat'], station['lon'])
+            pd.testing.assert_series_equal(series, expected)
+
+    def test_pseudo_obs_stations(self, gfs_path):
+        pseudo_obs = historical.get_gfs_pseudo_obs_stations(gfs_path, self.station_list)
+        assert pseudo_obs.sizes == {'station': 3, 'time': 2}
+        for station in self.station_list:
+            expected = historical.get_gfs_pseudo_obs(gfs_path, station['lat'], station['lon'])
+            np.testing.assert_array_equal(pseudo_obs.sel(station=station['station']).values, expected.values)
+            np.testing.assert_array_equal(pseudo_obs['time'].values, expected['time'].values)
+
+    def test_pseudo_obs_from_extract(self, gfs_path, tmp_path):
+        extract_path = tmp_path / 'gfs_stations.nc'
+        extract_gfs_stations(gfs_path, self.station_list).to_netcdf(extract_path)
+        xr.testing.assert_identical(historical.get_gfs_pseudo_obs_stations(extract_path, self.station_list),
+                                    historical.get_gfs_pseudo_obs_stations(gfs_path, self.station_list))
+        station = self.station_list[0]
+        xr.testing.assert_identical(historical.get_gfs_pseudo_obs(extract_path, station['lat'], station['lon']),
+                                    historical.get_gfs_pseudo_obs(gfs_path, station['lat'], station['lon']))
+
+    def test_station_pseudo_obs(self, tamsat_path, gfs_path):
+        pseudo_obs = historical.get_gfs_pseudo_obs_stations(gfs_path, self.station_list[:2])
+        for station in self.station_list:
+            series = historical.get_tamsat_data(tamsat_path, gfs_path, station['lat'], station['lon'],
+                                                station=station['station'], pseudo_obs=pseudo_obs)
+            expected = historical.get_tamsat_data(tamsat_path, gfs_path, station['lat'], station['lon'])
+            pd.testing.assert_series_equal(series, expected)
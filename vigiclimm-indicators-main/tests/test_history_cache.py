@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from functools import partial
+from vigiclimm_indicators.weather_indicators import historical, history_cache
+
+station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42}]
+
+
+def cache_path(era5land_path):
+    with xr.open_dataset(era5land_path) as ds:
+        return history_cache.history_path('era5land', era5land_path, ds.latitude, ds.longitude, station_list)
+
+
+def test_build(era5land_path):
+    path = cache_path(era5land_path)
+    assert history_cache.load_history(path) is None
+    data = history_cache.update_history(path, station_list, partial(historical.get_era5_land_stations, era5land_path))
+    assert data.identical(historical.get_era5_land_stations(era5land_path, station_list))
+    assert history_cache.load_history(path).identical(data)
+
+
+def test_incremental_same_as_full(era5land_path):
+    path = cache_path(era5land_path)
+    full = historical.get_era5_land_stations(era5land_path, station_list)
+
+    # previous run, with the last day incomplete
+    previous = full.isel(time=slice(None, -2)).copy()
+    previous[:, -1] = 0.
+    history_cache.save_history(previous, path)
+
+    starts = []
+
+    def fetch(stations, start):
+        starts.append(start)
+        return historical.get_era5_land_stations(era5land_path, stations, start=start)
+
+    data = history_cache.update_history(path, station_list, fetch)
+    last_day = pd.Timestamp(previous['time'].values[-1])
+    assert starts == [max(last_day - pd.Timedelta(days=history_cache.OVERLAP_DAYS),
+                          pd.Timestamp(previous['time'].values[0]))]
+    assert data.identical(full)
+    assert history_cache.load_history(path).identical(full)
+
+
+def test_reprocessed_input(era5land_path):
+    path = cache_path(era5land_path)
+    full = historical.get_era5_land_stations(era5land_path, station_list)
+
+    # previous run on a file reprocessed since then: a day of the overlap window has changed
+    previous = full.isel(time=slice(None, -2)).copy()
+    previous[:, -3] = np.nan
+    history_cache.save_history(previous, path)
+
+    starts = []
+
+    def fetch(stations, start):
+        starts.append(start)
+        return historical.get_era5_land_stations(era5land_path, stations, start=start)
+
+    data = history_cache.update_history(path, station_list, fetch)
+    assert starts[-1] is None
+    assert data.identical(full)
+    assert history_cache.load_history(path).identical(full)
+
+
+def test_path_keys(era5land_path):
+    path = cache_path(era5land_path)
+    with xr.open_dataset(era5land_path) as ds:
+        args = ds.latitude, ds.longitude
+        assert history_cache.history_path('era5land', era5land_path, *args, station_list[:1]) != path
+        assert history_cache.history_path('era5land', era5land_path, *args, station_list, year=2000) != path
+        assert history_cache.history_path('tamsat', era5land_path, *args, station_list) != path
+        assert history_cache.history_path('era5land', era5land_path.with_name('other.nc'), *args, station_list) != path
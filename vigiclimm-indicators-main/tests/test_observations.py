@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vigiclimm_indicators.weather_indicators import observations as obs
+
+YEAR = pd.Timestamp.now().year
+
+
+@pytest.fixture
+def obs_path(tmp_path):
+    time = pd.date_range(f'{YEAR - 1}-12-25', periods=20, freq='D', name='time')
+    df = pd.DataFrame({'tmean': np.linspace(25, 30, 20).round(1), 'tp': np.arange(20.)}, index=time)
+    df.to_csv(tmp_path / 'Korhogo.csv')
+    df[['tp']].to_csv(tmp_path / 'Dianra.csv')
+    df[df.index.year < YEAR].to_csv(tmp_path / 'Boundiali.csv')
+    (tmp_path / 'Ferke.csv').write_text('time,tmean,tp\nnot a date,1,2\n')
+    (tmp_path / 'Odienne.csv').write_text(f'time,tmean,tp\n{YEAR}-01-01,28.8,0.6\n02/01/{YEAR},28.5,15.4\n')
+    return tmp_path
+
+
+def test_same_as_csv(obs_path):
+    observations = obs.read_observations(obs_path)
+    expected = pd.read_csv(obs_path / 'Korhogo.csv', index_col="time", converters={"time": pd.to_datetime})
+    expected = expected[expected.index.year == YEAR]
+    for par in ['tmean', 'tp']:
+        pd.testing.assert_series_equal(obs.station_observations(observations, 'Korhogo', par), expected[par])
+
+
+def test_fallback(obs_path):
+    observations = obs.read_observations(obs_path)
+    assert obs.station_observations(observations, 'Man', 'tp') is None
+    assert obs.station_observations(observations, 'Boundiali', 'tp') is None
+
+
+def test_errors(obs_path):
+    observations = obs.read_observations(obs_path)
+    with pytest.raises(ValueError, match="'tmean' not found"):
+        obs.station_observations(observations, 'Dianra', 'tmean')
+    with pytest.raises(ValueError):
+        obs.station_observations(observations, 'Ferke', 'tp')
+
+
+def test_mixed_dates(obs_path):
+    series = obs.station_observations(obs.read_observations(obs_path), 'Odienne', 'tp')
+    assert list(series.index) == [pd.Timestamp(f'{YEAR}-01-01'), pd.Timestamp(f'{YEAR}-02-01')]
+
+
+def test_stations(obs_path):
+    assert list(obs.read_observations(obs_path, ['Korhogo', 'Man'])) == ['Korhogo']
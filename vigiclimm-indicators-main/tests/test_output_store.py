@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vigiclimm_indicators.weather_indicators import daily_forecast, output_store
+from vigiclimm_indicators.weather_indicators.utils import write_to_csv
+
+
+@pytest.fixture(params=['netcdf', 'parquet'])
+def output_format(request):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+    return request.param
+
+
+class TestForecastStore:
+
+    station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                    {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42}]
+
+    @pytest.fixture
+    def forecast(self, gfs_ds):
+        return daily_forecast.compute_all_stations(gfs_ds.rename(valid_time='time'), self.station_list)
+
+    def test_export_same_as_csv(self, forecast, output_format, tmp_path):
+        daily_forecast.write_all_stations(forecast, tmp_path / 'csv')
+        path = output_store.write_store(output_store.blocks_to_dataset(forecast), tmp_path / 'store', 'forecast',
+                                        output_format)
+        output_store.export_to_csv(path, tmp_path / 'export')
+
+        expected = sorted(p.name for p in (tmp_path / 'csv').iterdir())
+        assert sorted(p.name for p in (tmp_path / 'export').iterdir()) == expected
+        for name in expected:
+            assert (tmp_path / 'export' / name).read_text() == (tmp_path / 'csv' / name).read_text()
+
+    def test_padded_block(self, forecast):
+        ds = output_store.blocks_to_dataset(forecast)
+        assert ds['sum_tp'].attrs['padded'] == 1
+        assert ds['sum_tp'].isel(station=0).count() == 1
+        assert 'padded' not in ds['tp'].attrs
+
+
+class TestForecastArray:
+
+    station_list = TestForecastStore.station_list
+
+    @pytest.fixture
+    def forecast(self, gfs_ds):
+        forecast = daily_forecast.compute_all_stations(gfs_ds.rename(valid_time='time'), self.station_list)
+        return output_store.blocks_to_dataset(forecast)
+
+    def test_round_trip(self, forecast, tmp_path):
+        path = output_store.write_array(forecast, output_store.array_path(tmp_path))
+        ds = output_store.read_array(path)
+
+        assert isinstance(ds['tp'].variable._data, np.memmap)
+        assert ds['tp'].dtype == np.float32
+        assert ds['etp'].dtype == np.float64
+        assert list(ds.data_vars) == list(forecast.data_vars)
+        assert ds.attrs == forecast.attrs
+        for name in ['station', 'time', 'latitude', 'longitude']:
+            np.testing.assert_array_equal(ds[name].values, forecast[name].values)
+        for par in forecast.data_vars:
+            assert ds[par].attrs == forecast[par].attrs
+            np.testing.assert_array_equal(ds[par].values, forecast[par].values, err_msg=par)
+
+    def test_float32(self, forecast, tmp_path):
+        forecast = forecast[['tp', 'tmax', 'sum_tp']]
+        ds = output_store.read_array(output_store.write_array(forecast, tmp_path / 'forecast.bin'))
+        assert ds['tp'].dtype == np.float32
+        for par in forecast.data_vars:
+            np.testing.assert_array_equal(ds[par].values, forecast[par].values)
+
+    def test_float64(self, forecast, tmp_path):
+        # values which cannot be stored in float32
+        forecast = forecast[['tp', 'etp']]
+        forecast['etp'] = forecast['etp'] / 3
+        ds = output_store.read_array(output_store.write_array(forecast, tmp_path / 'forecast.bin'))
+        assert ds['tp'].dtype == np.float64
+        np.testing.assert_array_equal(ds['etp'].values, forecast['etp'].values)
+        np.testing.assert_array_equal(ds['tp'].values, output_store.float32_to_csv_float64(forecast['tp'].values))
+
+    def test_not_an_array(self, tmp_path):
+        (tmp_path / 'forecast.bin').write_bytes(b'time,tp\n')
+        with pytest.raises(ValueError):
+            output_store.read_array(tmp_path / 'forecast.bin')
+
+
+class TestStationsStore:
+
+    @pytest.fixture
+    def data(self):
+        time = pd.date_range('2024-01-01', periods=10, freq='D', name='time')
+        return {'A': {'tp': pd.Series(np.arange(10.), index=time),
+                      'wet_days': pd.Series(np.arange(10) % 2 == 0, index=time)},
+                'B': {'tp': pd.Series(np.arange(5.), index=time[3:8]),
+                      'wet_days': pd.Series(np.ones(5, dtype=bool), index=time[3:8])}}
+
+    def test_round_trip(self, data, output_format, tmp_path):
+        path = output_store.write_store(output_store.stations_to_dataset(data, period='historical'), tmp_path,
+                                        'historical', output_format)
+        ds = output_store.read_store(path)
+        assert ds.attrs['period'] == 'historical'
+        for i, station in enumerate(ds['station'].values):
+            for par, series in output_store.station_series(ds, i).items():
+                pd.testing.assert_series_equal(series, data[station][par], check_names=False, check_freq=False,
+                                               check_index_type=False)
+
+    def test_observations_and_reanalysis(self, output_format, tmp_path):
+        # float64 observations first, with NaN rows of their own, then float32 reanalysis of another period
+        time = pd.date_range('2024-01-01', periods=6, freq='D', name='time')
+        data = {'A': {'tp': pd.Series([np.nan, 1.5, np.nan, 2.3, np.nan, np.nan], index=time)},
+                'B': {'tp': pd.Series(np.array([0.3, 0.1, 12.7], dtype='float32'), index=time[2:5])}}
+        for station, series in data.items():
+            write_to_csv(series['tp'], tmp_path / 'csv', station, 'tp', period='historical')
+
+        path = output_store.write_store(output_store.stations_to_dataset(data, period='historical'), tmp_path,
+                                        'historical', output_format)
+        output_store.export_to_csv(path, tmp_path / 'export')
+        for station in data:
+            name = f'{station}_historical_tp.csv'
+            assert (tmp_path / 'export' / name).read_text() == (tmp_path / 'csv' / name).read_text()
+
+    def test_missing_parameter(self, data):
+        del data['B']['wet_days']
+        ds = output_store.stations_to_dataset(data)
+        assert list(output_store.station_series(ds, 1)) == ['tp']
+
+
+def test_product_path_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        output_store.product_path(tmp_path, 'forecast', 'csv')
+
+
+def test_float32_to_csv_float64():
+    values = np.array([0.1, 21.3, np.nan], dtype='float32')
+    np.testing.assert_array_equal(output_store.float32_to_csv_float64(values), [0.1, 21.3, np.nan])
+
+
+@pytest.mark.parametrize('decimals', [0, 1, 2, None])
+def test_float32_to_csv_float64_same_as_strings(decimals):
+    rng = np.random.default_rng(0)
+    values = rng.uniform(-1000, 1000, (20, 500))
+    values = (values if decimals is None else values.round(decimals)).astype('float32')
+    # small and large values, converted through strings
+    values[0, :5] = [1e-9, 3e-5, 2 ** 23, 123456792, -np.inf]
+    expected = values.astype(str).astype('float64')
+    np.testing.assert_array_equal(output_store.float32_to_csv_float64(values), expected)
+    np.testing.assert_array_equal(output_store.float32_to_csv_float64(values[:, ::3]), expected[:, ::3])
@@ -0,0 +1,64 @@
+import pytest
+import yaml
+from click.testing import CliRunner
+from vigiclimm_indicators import pipeline
+from vigiclimm_indicators.weather_indicators import daily_forecast, historical, preprocess
+from vigiclimm_indicators.agro_indicators import generate_agro_indicators
+
+
+@pytest.fixture
+def yml_path(tmp_path):
+    path = tmp_path / 'stations.yaml'
+    path.write_text(yaml.safe_dump([{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                                    {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42}]))
+    return path
+
+
+def test_run_all_same_as_stages(yml_path, gfs_path, era5land_path, tamsat_path, tmp_path):
+    obs_path = tmp_path / 'obs'
+    obs_path.mkdir()
+    stages_path = tmp_path / 'stages'
+    runner = CliRunner()
+    for command, args in [
+            (daily_forecast.run_all_stations, ['--ds-path', gfs_path]),
+            (historical.run_all_stations, ['--obs-path', obs_path, '--era5land-path', era5land_path,
+                                           '--tamsat-path', tamsat_path, '--gfs-path', gfs_path]),
+            (generate_agro_indicators.run_all_stations, ['--input-path', stages_path])]:
+        result = runner.invoke(command, ['--yml-path', yml_path, '--outdir', stages_path] + args)
+        assert result.exit_code == 0, result.output
+
+    result = runner.invoke(pipeline.run_all, ['--yml-path', yml_path, '--ds-path', gfs_path, '--obs-path', obs_path,
+                                              '--era5land-path', era5land_path, '--tamsat-path', tamsat_path,
+                                              '--outdir', tmp_path / 'all'])
+    assert result.exit_code == 0, result.output
+
+    expected = sorted(path.name for path in stages_path.iterdir())
+    assert len(expected) == 2 * 31
+    assert sorted(path.name for path in (tmp_path / 'all').iterdir()) == expected
+    for name in expected:
+        assert (tmp_path / 'all' / name).read_text() == (stages_path / name).read_text()
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'netcdf'])
+def test_no_station(gfs_path, era5land_path, tamsat_path, tmp_path, output_format):
+    yml_path = tmp_path / 'stations.yaml'
+    yml_path.write_text('[]\n')
+    obs_path = tmp_path / 'obs'
+    obs_path.mkdir()
+    outdir = tmp_path / 'output'
+    outdir.mkdir()
+    runner = CliRunner()
+    for command, args in [
+            (daily_forecast.run_all_stations, ['--ds-path', gfs_path, '--forecast-array']),
+            (historical.run_all_stations, ['--obs-path', obs_path, '--era5land-path', era5land_path,
+                                           '--tamsat-path', tamsat_path, '--gfs-path', gfs_path]),
+            (generate_agro_indicators.run_all_stations, ['--input-path', outdir]),
+            (pipeline.run_all, ['--ds-path', gfs_path, '--obs-path', obs_path, '--era5land-path', era5land_path,
+                                '--tamsat-path', tamsat_path])]:
+        result = runner.invoke(command, ['--yml-path', yml_path, '--outdir', outdir,
+                                         '--output-format', output_format] + args)
+        assert result.exit_code == 0, result.output
+    result = runner.invoke(preprocess.extract_stations, ['--yml-path', yml_path, '--ds-path', gfs_path,
+                                                         '--output-path', outdir / 'gfs_stations.nc'])
+    assert result.exit_code == 0, result.output
+    assert list(outdir.iterdir()) == []
@@ -0,0 +1,128 @@
+import pytest
+import numpy as np
+import xarray as xr
+from vigiclimm_indicators.weather_indicators import preprocess
+from vigiclimm_indicators.weather_indicators.etp import etp_from_gfs, etp_from_gfs_stations
+
+
+class TestOpenGfs:
+
+    def test_rename_valid_time(self, gfs_path):
+        ds = preprocess.open_gfs(gfs_path)
+        assert 'time' in ds.dims
+        assert 'valid_time' not in ds.dims
+
+    def test_preprocess_from_dataset(self, gfs_path):
+        ds = preprocess.open_gfs(gfs_path)
+        for par in ['tp', 'tmax', 'rhmin', 'dswrf']:
+            exp = preprocess.preprocess_gfs(gfs_path, par, 9.52, -6.47, convert=True)
+            obs = preprocess.preprocess_gfs(ds, par, 9.52, -6.47, convert=True)
+            xr.testing.assert_identical(obs, exp)
+
+    def test_etp_from_dataset(self, gfs_path):
+        ds = preprocess.open_gfs(gfs_path)
+        xr.testing.assert_identical(etp_from_gfs(ds, 9.52, -6.47), etp_from_gfs(gfs_path, 9.52, -6.47))
+
+
+class TestPreprocessGfsStations:
+
+    station_list = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+                    {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42},
+                    {'station': 'Touba', 'lon': -7.68, 'lat': 8.28}]
+
+    def test_same_as_single_station(self, gfs_path):
+        ds = preprocess.open_gfs(gfs_path)
+        for par in ['tp', 'tmin', 'rhmean', 'gust', 'dswrf']:
+            block = preprocess.preprocess_gfs_stations(ds, par, self.station_list, convert=True)
+            assert block.dims == ('station', 'time')
+            for i, station in enumerate(self.station_list):
+                exp = preprocess.preprocess_gfs(ds, par, station['lat'], station['lon'], convert=True)
+                xr.testing.assert_identical(block.isel(station=i).drop_vars('station'), exp)
+
+    def test_etp_same_as_single_station(self, gfs_path):
+        ds = preprocess.open_gfs(gfs_path)
+        block = etp_from_gfs_stations(ds, self.station_list)
+        for i, station in enumerate(self.station_list):
+            exp = etp_from_gfs(ds, station['lat'], station['lon'])
+            np.testing.assert_array_equal(block.isel(station=i).values, exp.values)
+
+
+class TestExtractGfsStations:
+
+    station_list = TestPreprocessGfsStations.station_list
+
+    def test_same_as_grid(self, gfs_path, tmp_path):
+        extract_path = tmp_path / 'gfs_stations.nc'
+        preprocess.extract_gfs_stations(gfs_path, self.station_list).to_netcdf(extract_path)
+        grid, extract = preprocess.open_gfs(gfs_path), preprocess.open_gfs(extract_path)
+        assert dict(extract.sizes) == {'time': grid.sizes['time'], 'station': len(self.station_list)}
+        for par in ['tp', 'tmin', 'rhmean', 'gust', 'dswrf']:
+            xr.testing.assert_identical(preprocess.preprocess_gfs_stations(extract, par, self.station_list),
+                                        preprocess.preprocess_gfs_stations(grid, par, self.station_list))
+            for station in self.station_list:
+                xr.testing.assert_identical(
+                    preprocess.preprocess_gfs(extract, par, station['lat'], station['lon'], convert=True),
+                    preprocess.preprocess_gfs(grid, par, station['lat'], station['lon'], convert=True))
+        station = self.station_list[1]
+        xr.testing.assert_identical(etp_from_gfs(extract, station['lat'], station['lon']),
+                                    etp_from_gfs(grid, station['lat'], station['lon']))
+
+    def test_unknown_station(self, gfs_path):
+        extract = preprocess.extract_gfs_stations(gfs_path, self.station_list[:2])
+        with pytest.raises(ValueError):
+            preprocess.preprocess_gfs_stations(extract, 'tp', self.station_list)
+
+
+class TestDailyResample:
+
+    @pytest.fixture
+    def data(self, gfs_ds):
+        data = gfs_ds['2t'].rename(valid_time='time').transpose('latitude', 'time', 'longitude').copy()
+        data[:3, 5:9] = np.nan
+        return data
+
+    def test_same_as_resample(self, data):
+        for par in ['tmax', 'tmin', 'tmean', 'tp']:
+            expected = getattr(data.resample(time='D'), preprocess.DAILY_METHODS[par])()
+            xr.testing.assert_identical(preprocess._daily_resample(data, par), expected)
+
+    def test_day_without_steps(self, data):
+        # no step on 2024-06-03
+        data = data.isel(time=np.r_[:15, 23:88])
+        assert preprocess._time_bins(data['time'].values) is None
+        for par in ['tmax', 'tmean']:
+            expected = getattr(data.resample(time='D'), preprocess.DAILY_METHODS[par])()
+            assert expected.sizes['time'] == 12
+            xr.testing.assert_identical(preprocess._daily_resample(data, par), expected)
+
+    def test_unsorted_time_axis(self, data):
+        data = data.isel(time=np.r_[1, 0, 2:88])
+        assert preprocess._time_bins(data['time'].values) is None
+        with pytest.raises(ValueError):
+            preprocess._daily_resample(data, 'tmax')
+
+
+class TestPostprocessGfs:
+
+    @pytest.fixture
+    def daily(self, gfs_ds):
+        return preprocess.daily_gfs_grid(gfs_ds, list(preprocess.UNIT_CONVERSIONS.keys() - {'10ws'}))
+
+    def test_same_as_operators(self, daily):
+        operators = {'gust': lambda x: x * 3.6, '10u': lambda x: x * 3.6, 'tmax': lambda x: x - 273.15,
+                     '2d': lambda x: x - 273.15, 'dswrf': lambda x: x * 0.0864, 'tp': lambda x: x}
+        for par, operator in operators.items():
+            data = daily[par].copy()
+            for convert in [True, False]:
+                obs = preprocess.postprocess_gfs(data, par, convert=convert)
+                exp = (operator(data) if convert else data).round(1)
+                assert obs.dtype == exp.dtype == np.float32
+                np.testing.assert_array_equal(obs.values, exp.values, err_msg=par)
+            # the input values are left unchanged
+            xr.testing.assert_identical(data, daily[par])
+
+    def test_units(self, daily):
+        assert preprocess.postprocess_gfs(daily['tmax'], 'tmax', convert=True).attrs['units'] == 'degC'
+        assert preprocess.postprocess_gfs(daily['tmax'], 'tmax').attrs['units'] == 'K'
+        assert preprocess.postprocess_gfs(daily['dswrf'], 'dswrf', convert=True).attrs['units'] == 'MJ m-2 day-1'
+        assert 'units' not in daily['tmax'].attrs
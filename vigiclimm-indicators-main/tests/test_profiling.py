@@ -0,0 +1,75 @@
+import json
+import pytest
+from vigiclimm_indicators.weather_indicators import profiling, utils
+
+
+@pytest.fixture
+def enabled():
+    profiling.take_records()
+    profiling.enable_profiling()
+    yield
+    profiling.enable_profiling(False)
+    profiling.take_records()
+
+
+@profiling.profile('compute', 'decorated')
+def _decorated(value):
+    return value * 2
+
+
+def _open_inputs():
+    return {}
+
+
+def _task(station_list):
+    for station in station_list:
+        with profiling.profile('compute', 'tp', station['station']):
+            pass
+    return [], None
+
+
+def test_disabled():
+    profiling.take_records()
+    with profiling.profile('compute', 'tp'):
+        pass
+    assert _decorated(2) == 4
+    assert profiling.take_records() == []
+
+
+def test_records(enabled):
+    with profiling.profile('total', stage='forecast'):
+        with profiling.profile('compute', 'tp', 'Korhogo'):
+            pass
+        assert _decorated(2) == 4
+    records = profiling.take_records()
+    assert [(r['stage'], r['step'], r['param'], r['station']) for r in records] == [
+        ('forecast', 'compute', 'tp', 'Korhogo'), ('forecast', 'compute', 'decorated', None),
+        ('forecast', 'total', None, None)]
+    assert all(r['wall'] >= 0 and r['cpu'] >= 0 for r in records)
+    assert records[-1]['wall'] >= records[0]['wall']
+
+
+def test_summary(enabled, tmp_path):
+    with profiling.profile('total', stage='historical'):
+        for station in ['A', 'B', 'C']:
+            with profiling.profile('read', 'tp', station):
+                pass
+    path = tmp_path / 'profile.json'
+    profiling.write_profile(path)
+    profile = json.loads(path.read_text())
+    assert len(profile['records']) == 4
+    summary = {(entry['stage'], entry['step'], entry['param']): entry for entry in profile['summary']}
+    assert summary[('historical', 'read', 'tp')]['calls'] == 3
+    assert summary[('historical', 'total', None)]['calls'] == 1
+    assert profile['summary'][0]['step'] == 'total'
+
+
+def test_workers(enabled):
+    station_list = [{'station': f'station_{n}', 'lat': 0, 'lon': 0} for n in range(10)]
+    with profiling.profile('total', stage='agro'):
+        utils.run_sharded(_task, station_list, 2, _open_inputs)
+    records = profiling.take_records()
+    stations = [r['station'] for r in records if r['step'] == 'compute']
+    assert sorted(stations) == sorted(station['station'] for station in station_list)
+    assert {r['stage'] for r in records} == {'agro'}
+    assert any(r['step'] == 'shard' for r in records)
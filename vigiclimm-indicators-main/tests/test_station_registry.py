@@ -0,0 +1,67 @@
+import yaml
+import pytest
+from pathlib import Path
+from vigiclimm_indicators.weather_indicators import station_registry
+
+YML_PATH = Path(__file__).parent / 'data' / 'station_list.yaml'
+# stations of the production runs, at the root of the repository
+PRODUCTION_YML_PATH = Path(__file__).parents[2] / 'stations_list.yaml'
+
+
+def test_same_as_yaml(cache_dir):
+    with open(YML_PATH, 'r') as file:
+        expected = yaml.safe_load(file)
+    assert station_registry.read_station_yaml(YML_PATH) == expected
+    # built, then loaded from the cache
+    assert station_registry.load_station_list(YML_PATH) == expected
+    assert len(list(cache_dir.glob('stations_*.npz'))) == 1
+    station_registry._loaded_stations.clear()
+    assert station_registry.load_station_list(YML_PATH) == expected
+
+
+def test_rebuilt_on_change(tmp_path, cache_dir):
+    path = tmp_path / 'stations.yaml'
+    path.write_text(yaml.safe_dump([{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52}]))
+    assert [st['station'] for st in station_registry.load_station_list(path)] == ['Boundiali']
+    path.write_text(yaml.safe_dump([{'station': 'Korhogo', 'lon': -5.62, 'lat': 9}]))
+    assert station_registry.load_station_list(path) == [{'station': 'Korhogo', 'lon': -5.62, 'lat': 9.}]
+    assert len(list(cache_dir.glob('stations_*.npz'))) == 2
+
+
+@pytest.mark.parametrize('entries', [
+    {'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+    [{'station': 'Boundiali', 'lon': -6.47}],
+    [{'station': 'Boundiali', 'lon': -6.47, 'lat': 'north'}],
+    [{'station': 'Boundiali', 'lon': -6.47, 'lat': 95.2}],
+    [{'station': '', 'lon': -6.47, 'lat': 9.52}],
+])
+def test_invalid(entries):
+    with pytest.raises(ValueError):
+        station_registry.validate_station_list(entries)
+
+
+@pytest.mark.parametrize('content', ['', '[]\n'])
+def test_no_station(tmp_path, cache_dir, content):
+    path = tmp_path / 'stations.yaml'
+    path.write_text(content)
+    assert station_registry.load_station_list(path) == []
+    station_registry._loaded_stations.clear()
+    assert station_registry.load_station_list(path) == []
+
+
+def test_duplicated_names():
+    entries = [{'station': 'Boundiali', 'lon': -6.47, 'lat': 9.52},
+               {'station': 'Korhogo', 'lon': -5.62, 'lat': 9.42},
+               {'station': 'Boundiali', 'lon': -3.158, 'lat': 5.4019},
+               {'station': ' Korhogo ', 'lon': -5.62, 'lat': 9.42}]
+    # the last station of each name is kept, names are not stripped
+    assert station_registry.validate_station_list(entries) == entries[1:]
+
+
+def test_production_stations(cache_dir):
+    with open(PRODUCTION_YML_PATH, 'r') as file:
+        entries = yaml.safe_load(file)
+    station_list = station_registry.load_station_list(PRODUCTION_YML_PATH)
+    names = [str(entry['station']) for entry in entries]
+    assert [station['station'] for station in station_list] == list(dict.fromkeys(reversed(names)))[::-1]
+    assert len(station_list) < len(entries)
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+from vigiclimm_indicators.weather_indicators import utils
+
+
+def _cdd_max_loop(data, threshold=1):
+    """ Reference implementation, element by element """
+    current_consecutive = 0
+    global_consecutive = 0
+    for value in data <= threshold:
+        if value:
+            current_consecutive += 1
+            global_consecutive = max(global_consecutive, current_consecutive)
+        else:
+            current_consecutive = 0
+    return global_consecutive
+
+
+def _consecutive_event_count_loop(data):
+    """ Reference implementation, element by element """
+    count = 0
+    consecutive_counts = []
+    for value in data:
+        if value:
+            consecutive_counts.append(count)
+            count += 1
+        else:
+            count = 0
+            consecutive_counts.append(count)
+    return pd.Series(consecutive_counts, index=data.index)
+
+
+@pytest.fixture
+def tp():
+    rng = np.random.default_rng(0)
+    values = rng.gamma(0.3, 5, (5, 120)).round(1)
+    values[1, 10:15] = np.nan
+    values[2] = 0
+    values[3] = 5
+    return xr.DataArray(values, dims=('station', 'time'),
+                        coords={'time': pd.date_range('2024-01-01', periods=120, freq='D')})
+
+
+class TestCddMax:
+
+    def test_series(self, tp):
+        for i in range(tp.sizes['station']):
+            series = tp.isel(station=i).to_series()
+            assert utils.cdd_max(series) == _cdd_max_loop(series)
+            assert utils.cdd_max(series, threshold=3) == _cdd_max_loop(series, threshold=3)
+
+    def test_2d(self, tp):
+        expected = [_cdd_max_loop(tp.isel(station=i).to_series()) for i in range(tp.sizes['station'])]
+        np.testing.assert_array_equal(utils.cdd_max(tp.values), expected)
+        np.testing.assert_array_equal(utils.cdd_max(tp).values, expected)
+
+    def test_empty(self):
+        assert utils.cdd_max(pd.Series([], dtype=float)) == 0
+
+
+class TestConsecutiveEventCount:
+
+    def test_series(self, tp):
+        for i in range(tp.sizes['station']):
+            wet = tp.isel(station=i).to_series() >= 1
+            pd.testing.assert_series_equal(utils.consecutive_event_count(wet), _consecutive_event_count_loop(wet))
+
+    def test_2d(self, tp):
+        wet = tp >= 1
+        expected = np.stack([_consecutive_event_count_loop(wet.isel(station=i).to_series()).values
+                             for i in range(tp.sizes['station'])])
+        np.testing.assert_array_equal(utils.consecutive_event_count(wet.values), expected)
+        result = utils.consecutive_event_count(wet)
+        assert result.dims == ('station', 'time')
+        np.testing.assert_array_equal(result.values, expected)
+
+
+def _open_inputs(offset):
+    return {'offset': offset}
+
+
+def _task(station_list, offset):
+    failed = []
+    for station in station_list:
+        if station['lat'] + offset < 0:
+            failed.append(station['station'])
+        utils.logger.info(f"Station {station['station']}")
+    return failed, len(station_list)
+
+
+class TestRunSharded:
+
+    station_list = [{'station': f'station_{n}', 'lat': n - 10, 'lon': 0} for n in range(20)]
+
+    def test_sequential(self):
+        failed, outputs = utils.run_sharded(_task, self.station_list, 1, _open_inputs, 5)
+        assert failed == [f'station_{n}' for n in range(5)]
+        assert outputs == [20]
+
+    def test_workers(self, capsys):
+        failed, outputs = utils.run_sharded(_task, self.station_list, 3, _open_inputs, 5)
+        assert failed == [f'station_{n}' for n in range(5)]
+        assert sum(outputs) == 20
+        # logs are written in the order of the station list
+        logs = [line.split('|')[-1].strip() for line in capsys.readouterr().out.splitlines()]
+        assert logs == [f"Station station_{n}" for n in range(20)]
+
+    def test_empty(self):
+        assert utils.run_sharded(_task, [], 3, _open_inputs, 5) == ([], [])
+
+
+def test_rolling_cdd_max(tp):
+    values = tp.values
+    expected = np.array([[_cdd_max_loop(row[i:i + 7]) for i in range(values.shape[-1])] for row in values])
+    np.testing.assert_array_equal(utils.rolling_cdd_max(values, 7), expected)
+    np.testing.assert_array_equal(utils.rolling_cdd_max(values[0], 7), expected[0])
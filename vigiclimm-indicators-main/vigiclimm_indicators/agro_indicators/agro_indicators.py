@@ -8,16 +8,20 @@ The indicators give a daily state of conditions for the next 10 forecasted days:
     - not favorable (returns "0")
 """
 
+import numpy as np
 import pandas as pd
+import xarray as xr
+import typing as T
 
 from vigiclimm_indicators.weather_indicators.daily_forecast import wet_days
-from vigiclimm_indicators.weather_indicators.utils import cdd_max
+from vigiclimm_indicators.weather_indicators.dtypes import code_dtype
+from vigiclimm_indicators.weather_indicators.utils import rolling_cdd_max
 
 
-def land_preparation(tp_histo: pd.Series,
-                     tp: pd.Series,
-                     gust: pd.Series,
-                     ) -> pd.Series:
+def land_preparation(tp_histo: T.Union[pd.Series, xr.DataArray],
+                     tp: T.Union[pd.Series, xr.DataArray],
+                     gust: T.Union[pd.Series, xr.DataArray],
+                     ) -> T.Union[pd.Series, xr.DataArray]:
     """
     "Préparation du sol" indicator.
 
@@ -36,34 +40,31 @@ def land_preparation(tp_histo: pd.Series,
     Returns:
         Condition values, either 0, 1, or 2.
     """
-    # need at least 4 wet days during the last month + forecasted days
-    if wet_days(tp_histo).sum() >= 4 or (wet_days(tp_histo).sum() + wet_days(tp).sum()) >= 4:
-        # define masks for ideal and critical conditions
-        ideal_condition = (tp < 10) & (tp > 1) & (gust < 30)
-        critical_condition = (tp > 30) | (gust > 50)
+    tp_values, gust_values = np.asarray(tp), np.asarray(gust)
 
-        neutral_condition = ~ideal_condition & ~critical_condition
+    # need at least 4 wet days during the last month + forecasted days (for each station)
+    keepdims = np.ndim(tp_histo) > 1
+    histo_wet_days = wet_days(np.asarray(tp_histo)).sum(axis=-1, keepdims=keepdims)
+    forecast_wet_days = wet_days(tp_values).sum(axis=-1, keepdims=keepdims)
+    moist_soil = (histo_wet_days >= 4) | (histo_wet_days + forecast_wet_days >= 4)
 
-        # Map boolean arrays to condition values
-        condition_values = ideal_condition.astype(int) * 2 + neutral_condition.astype(int)
+    # define masks for ideal and critical conditions, not favorable if the soil is too dry
+    ideal_condition = moist_soil & (tp_values < 10) & (tp_values > 1) & (gust_values < 30)
+    critical_condition = ~moist_soil | (tp_values > 30) | (gust_values > 50)
 
-        # create empty conditions file, with forecast index
-        condition = pd.Series(condition_values, index=tp.index, dtype="int")
-    else:
-        condition = pd.Series(index=tp.index, dtype="int")
-        condition = condition.fillna(False)
+    return _condition(ideal_condition, critical_condition, tp)
 
-    return condition
 
-
-def sowing(tp_histo: pd.Series,
-           tp: pd.Series,
-           gust: pd.Series,
-           ) -> pd.Series:
+def sowing(tp_histo: T.Union[pd.Series, xr.DataArray],
+           tp: T.Union[pd.Series, xr.DataArray],
+           gust: T.Union[pd.Series, xr.DataArray],
+           ) -> T.Union[pd.Series, xr.DataArray]:
     """
     "Semis" indicator.
 
     Guidance for sowing activities.
+    Can be computed for all stations at once, with data of dimensions (station, time): stations with a shorter
+    history must then be padded with NaN at the beginning of `tp_histo`.
 
     Args:
         tp_histo: recent history (last month) of daily rainfall.
@@ -74,33 +75,54 @@ def sowing(tp_histo: pd.Series,
     Returns:
         Condition values, either 0, 1, or 2.
     """
-    # merging historical and forecast rainfall
-    tp_merged = pd.concat([tp_histo, tp]).iloc[-17:]  # 10 days of forecasts + last 7 historical days = 17 days
-
-    condition_values = []
+    merged_days = 17  # 10 days of forecasts + last 7 historical days = 17 days
+    window = 7
 
-    for i in range(0, len(tp)):
-        # ideal conditions
-        if (tp.iloc[i] <= 10) & (tp.iloc[i] >= 1) & (gust.iloc[i] <= 30) & (cdd_max(tp_merged.iloc[i: 7 + i]) <= 5):
-            result = 2
-        # critical conditions
-        elif (tp.iloc[i] > 30) | (gust.iloc[i] > 50) | (cdd_max(tp_merged.iloc[i: 7 + i]) >= 7):
-            result = 0
-        # neutral conditions
-        else:
-            result = 1
+    # merging historical and forecast rainfall
+    histo_values = np.asarray(tp_histo, dtype='float64')
+    tp_values = np.asarray(tp, dtype='float64')
+    tp_merged = np.concatenate([histo_values, tp_values], axis=-1)[..., -merged_days:]
+    # shorter merged data (e.g. history of a few days) is padded with NaN at the beginning, like the stations
+    padding = merged_days - tp_merged.shape[-1]
+    if padding > 0:
+        tp_merged = np.concatenate([np.full(tp_merged.shape[:-1] + (padding,), np.nan), tp_merged], axis=-1)
+
+    # the window of the forecast day i starts at the day i of the merged data, after the padding if any
+    history_size = histo_values.shape[-1]
+    if histo_values.ndim > 1 and history_size > 0:
+        history_size = history_size - np.argmax(~np.isnan(histo_values), axis=-1, keepdims=True)
+        history_size[np.isnan(histo_values).all(axis=-1)] = 0
+    start = merged_days - np.minimum(merged_days, history_size + tp_values.shape[-1])
+
+    rolling = rolling_cdd_max(tp_merged, window)
+    # windows starting after the end of the merged data are empty
+    rolling = np.concatenate([rolling, np.zeros_like(rolling, shape=rolling.shape[:-1] + tp_values.shape[-1:])],
+                             axis=-1)
+    positions = np.broadcast_to(start + np.arange(tp_values.shape[-1]), rolling.shape[:-1] + tp_values.shape[-1:])
+    cdd = np.take_along_axis(rolling, positions, axis=-1)
+
+    gust_values = np.asarray(gust)
+    # ideal conditions
+    ideal_condition = (tp_values <= 10) & (tp_values >= 1) & (gust_values <= 30) & (cdd <= 5)
+    # critical conditions
+    critical_condition = (tp_values > 30) | (gust_values > 50) | (cdd >= 7)
+    # neutral conditions
+    neutral_condition = ~ideal_condition & ~critical_condition
 
-        condition_values.append(result)
+    dtype = code_dtype()
+    condition_values = ideal_condition.astype(dtype) * 2 + neutral_condition.astype(dtype)
 
-    return pd.Series(condition_values, index=tp.index, dtype="int")
+    if isinstance(tp, xr.DataArray):
+        return xr.DataArray(condition_values, dims=tp.dims, coords=tp.coords)
+    return pd.Series(condition_values, index=tp.index, dtype=dtype)
 
 
-def fertilization(tp_histo: pd.Series,
-                  tp: pd.Series,
-                  tmax: pd.Series,
-                  rhmean: pd.Series,
-                  gust: pd.Series,
-                  ) -> pd.Series:
+def fertilization(tp_histo: T.Union[pd.Series, xr.DataArray],
+                  tp: T.Union[pd.Series, xr.DataArray],
+                  tmax: T.Union[pd.Series, xr.DataArray],
+                  rhmean: T.Union[pd.Series, xr.DataArray],
+                  gust: T.Union[pd.Series, xr.DataArray],
+                  ) -> T.Union[pd.Series, xr.DataArray]:
     """
     Fertilization indicator. Guidance for fertilizer spreading activities.
 
@@ -115,42 +137,24 @@ def fertilization(tp_histo: pd.Series,
     Returns:
         Condition values, either 0, 1, or 2.
     """
-    conditions_values = []
-
-    for i in range(0, len(tp)):
-        # for first step, it requires the last observation.
-        if i == 0:
-            if (wet_days(tp_histo.iloc[-1])) & (wet_days(tp.iloc[i])) & (tmax.iloc[i] < 35) & \
-                    (rhmean.iloc[i] >= 70) & (tp.iloc[i] > 5) & (tp.iloc[i] < 10):
-                # ideal conditions
-                result = 2
-            elif (tp.iloc[i] >= 30) | (tmax.iloc[i] >= 38):
-                # critical conditions
-                result = 0
-            else:
-                # intermediate conditions
-                result = 1
-        else:
-            if (wet_days(tp.iloc[i - 1: i + 1]).sum() >= 1) & (rhmean.iloc[i] >= 70) & (tmax.iloc[i] < 35) & \
-                    (tp.iloc[i] > 5) & (tp.iloc[i] < 10):
-                # ideal conditions
-                result = 2
-                # critical conditions
-            elif (tp.iloc[i] >= 30) | (tmax.iloc[i] >= 38):
-                result = 0
-                # intermediate conditions
-            else:
-                result = 1
-
-        conditions_values.append(result)
-
-    return pd.Series(conditions_values, index=tp.index, dtype="int")
-
-
-def harvesting(tp_histo: pd.Series,
-               tp: pd.Series,
-               rhmean: pd.Series
-               ) -> pd.Series:
+    tp_values, tmax_values, rhmean_values = (np.asarray(data) for data in (tp, tmax, rhmean))
+
+    # for first step, it requires the last observation.
+    recent_wet_days = _recent_wet_days(_last_value(tp_histo), tp_values)
+
+    # ideal conditions
+    ideal_condition = recent_wet_days & (rhmean_values >= 70) & (tmax_values < 35) & \
+        (tp_values > 5) & (tp_values < 10)
+    # critical conditions
+    critical_condition = (tp_values >= 30) | (tmax_values >= 38)
+
+    return _condition(ideal_condition, critical_condition, tp)
+
+
+def harvesting(tp_histo: T.Union[pd.Series, xr.DataArray],
+               tp: T.Union[pd.Series, xr.DataArray],
+               rhmean: T.Union[pd.Series, xr.DataArray]
+               ) -> T.Union[pd.Series, xr.DataArray]:
     """
     "Récolte" indicator. Guidance for harvesting activites.
 
@@ -162,32 +166,23 @@ def harvesting(tp_histo: pd.Series,
     Returns:
         Condition values, either 0, 1, or 2.
     """
+    # rainfall of the day and the next one
+    tp_two_days = _forward_sum(np.asarray(tp), 2)
+    histo_sum = np.nansum(np.asarray(tp_histo, dtype='float64'), axis=-1, keepdims=np.ndim(tp_histo) > 1)
 
-    list_conditions = []
-
-    # iterating over forecast
-    for i in range(0, len(tp)):
-
-        if (tp.iloc[i:i + 2].sum() == 0) & (rhmean.iloc[i] < 80) & (tp_histo.sum() == 0):
-            # ideal conditions
-            result = 2
-        elif (tp.iloc[i:i + 2].sum() > 5):
-            # critical conditions
-            result = 0
-        else:
-            # intermediate conditions
-            result = 1
-
-        list_conditions.append(result)
+    # ideal conditions
+    ideal_condition = (tp_two_days == 0) & (np.asarray(rhmean) < 80) & (histo_sum == 0)
+    # critical conditions
+    critical_condition = tp_two_days > 5
 
-    return pd.Series(list_conditions, index=tp.index, dtype="int")
+    return _condition(ideal_condition, critical_condition, tp)
 
 
-def drying(tp: pd.Series,
-           tmax: pd.Series,
-           rhmean: pd.Series,
-           rhmin: pd.Series,
-           ) -> pd.Series:
+def drying(tp: T.Union[pd.Series, xr.DataArray],
+           tmax: T.Union[pd.Series, xr.DataArray],
+           rhmean: T.Union[pd.Series, xr.DataArray],
+           rhmin: T.Union[pd.Series, xr.DataArray],
+           ) -> T.Union[pd.Series, xr.DataArray]:
     """
     "Séchage" indicator. It aims to give guidance to farmers to dry rice.
 
@@ -208,25 +203,21 @@ def drying(tp: pd.Series,
     Returns:
          "Condition" values (either 0, 1 or 2).
     """
+    tp_values, tmax_values, rhmean_values, rhmin_values = (np.asarray(data) for data in (tp, tmax, rhmean, rhmin))
 
     # define masks for ideal and critical conditions
-    ideal_condition = (tp <= 1) & (tmax < 42) & (rhmean < 50) & (rhmin > 10)
-    critical_condition = (tmax > 42) | (tp > 1) | (rhmin < 10)
+    ideal_condition = (tp_values <= 1) & (tmax_values < 42) & (rhmean_values < 50) & (rhmin_values > 10)
+    critical_condition = (tmax_values > 42) | (tp_values > 1) | (rhmin_values < 10)
 
-    neutral_condition = ~ideal_condition & ~critical_condition
-
-    # Map boolean arrays to condition values
-    condition_values = ideal_condition.astype(int) * 2 + neutral_condition.astype(int)
+    return _condition(ideal_condition, critical_condition, tp)
 
-    return pd.Series(condition_values, index=tp.index, dtype="int")
 
-
-def protection(tp_histo: pd.Series,
-               tp: pd.Series,
-               tmax: pd.Series,
-               gust: pd.Series,
-               cloud_cover: pd.Series
-               ) -> pd.Series:
+def protection(tp_histo: T.Union[pd.Series, xr.DataArray],
+               tp: T.Union[pd.Series, xr.DataArray],
+               tmax: T.Union[pd.Series, xr.DataArray],
+               gust: T.Union[pd.Series, xr.DataArray],
+               cloud_cover: T.Union[pd.Series, xr.DataArray]
+               ) -> T.Union[pd.Series, xr.DataArray]:
     """
 
     Protection indicator. Guidance for spreading insecticides.
@@ -241,42 +232,24 @@ def protection(tp_histo: pd.Series,
     Returns:
         Condition values, either 0, 1, or 2.
     """
+    tp_values, tmax_values, gust_values, cloud_cover_values = (
+        np.asarray(data) for data in (tp, tmax, gust, cloud_cover))
+
+    # for first step, it requires the last observation.
+    recent_wet_days = _recent_wet_days(_last_value(tp_histo), tp_values)
 
-    list_conditions = []
-
-    for i in range(0, len(tp)):
-        # for first step, it requires the last observation.
-        if i == 0:
-            if (wet_days(tp_histo.iloc[-1])) & (wet_days(tp.iloc[i])) & (tmax.iloc[i] < 35) & (tp.iloc[i] < 15) & \
-                    (cloud_cover.iloc[i] >= 50):
-                # ideal conditions
-                result = 2
-            elif (gust.iloc[i] >= 50) | (tmax.iloc[i] >= 38) & (cloud_cover.iloc[i] <= 20):
-                # critical conditions
-                result = 0
-            else:
-                # intermediate conditions
-                result = 1
-        else:
-            if (wet_days(tp.iloc[i - 1: i + 1]).sum() >= 1) & (tmax.iloc[i] < 35) & (tp.iloc[i] < 15) &\
-                    (cloud_cover.iloc[i] >= 50):
-                result = 2
-            elif (gust.iloc[i] >= 50) | (tmax.iloc[i] >= 38) & (cloud_cover.iloc[i] <= 20):
-                # critical conditions
-                result = 0
-            else:
-                # intermediate conditions
-                result = 1
-
-        list_conditions.append(result)
-
-    return pd.Series(list_conditions, index=tp.index, dtype="int")
-
-
-def irrigation(tp_histo: pd.Series,
-               tp: pd.Series,
-               etp: pd.Series,
-               ) -> pd.Series:
+    # ideal conditions
+    ideal_condition = recent_wet_days & (tmax_values < 35) & (tp_values < 15) & (cloud_cover_values >= 50)
+    # critical conditions
+    critical_condition = (gust_values >= 50) | (tmax_values >= 38) & (cloud_cover_values <= 20)
+
+    return _condition(ideal_condition, critical_condition, tp)
+
+
+def irrigation(tp_histo: T.Union[pd.Series, xr.DataArray],
+               tp: T.Union[pd.Series, xr.DataArray],
+               etp: T.Union[pd.Series, xr.DataArray],
+               ) -> T.Union[pd.Series, xr.DataArray]:
     """
 
     Irrigation indicator. Guidance for irrigation activities.
@@ -290,32 +263,66 @@ def irrigation(tp_histo: pd.Series,
     Returns:
         Condition values, either 0, 1, or 2.
     """
+    tp_values, etp_values = np.asarray(tp), np.asarray(etp)
+
+    # rainfall of the previous day, the last observation for the first step
+    tp_previous = _shift(tp_values, _last_value(tp_histo))
+    # rainfall of the day and the next four days
+    tp_five_days = _forward_sum(tp_values, 5)
+
+    # ideal conditions
+    ideal_condition = (tp_previous <= 1) & (tp_values <= 1) & (etp_values >= 10) & (tp_five_days <= 10)
+    # critical conditions
+    critical_condition = (tp_values >= 10) | (etp_values <= 5) | (tp_five_days >= 50)
+
+    return _condition(ideal_condition, critical_condition, tp)
+
+
+def _condition(ideal_condition: np.ndarray,
+               critical_condition: np.ndarray,
+               like: T.Union[pd.Series, xr.DataArray]) -> T.Union[pd.Series, xr.DataArray]:
+    """ Map the ideal and critical conditions to 2 and 0, other conditions to 1, with the index of `like` """
+    neutral_condition = ~ideal_condition & ~critical_condition
+    dtype = code_dtype()
+    condition_values = ideal_condition.astype(dtype) * 2 + neutral_condition.astype(dtype)
 
-    list_conditions = []
-
-    for i in range(0, len(tp)):
-        # for first step, it requires the last observation.
-        if i == 0:
-            if (tp_histo.iloc[-1] <= 1) & (tp.iloc[i] <= 1) & (etp.iloc[i] >= 10) & (tp.iloc[i:i + 5].sum() <= 10):
-                # ideal conditions
-                result = 2
-            elif (tp.iloc[i] >= 10) | (etp.iloc[i] <= 5) | (tp.iloc[i:i + 5].sum() >= 50):
-                # critical conditions
-                result = 0
-            else:
-                # intermediate conditions
-                result = 1
-        else:
-            if (tp.iloc[i-1] <= 1) & (tp.iloc[i] <= 1) & (etp.iloc[i] >= 10) & (tp.iloc[i:i + 5].sum() <= 10):
-                # ideal conditions
-                result = 2
-            elif (tp.iloc[i] >= 10) | (etp.iloc[i] <= 5) | (tp.iloc[i:i + 5].sum() >= 50):
-                # critical conditions
-                result = 0
-            else:
-                # intermediate conditions
-                result = 1
-
-        list_conditions.append(result)
-
-    return pd.Series(list_conditions, index=tp.index, dtype="int")
+    if isinstance(like, xr.DataArray):
+        return xr.DataArray(condition_values, dims=like.dims, coords=like.coords)
+    return pd.Series(condition_values, index=like.index, dtype=dtype)
+
+
+def _last_value(tp_histo: T.Union[pd.Series, xr.DataArray]) -> np.ndarray:
+    """ Last historical value (of each station), NaN if there is no history """
+    values = np.asarray(tp_histo, dtype='float64')
+    if values.shape[-1] == 0:
+        return np.full(values.shape[:-1], np.nan)
+    return values[..., -1]
+
+
+def _shift(values: np.ndarray, first: np.ndarray) -> np.ndarray:
+    """ Values of the previous day along the last axis, `first` (one value per station) for the first day """
+    return np.concatenate([np.broadcast_to(np.expand_dims(first, -1), values.shape[:-1] + (1,)).astype(values.dtype),
+                           values[..., :-1]], axis=-1)
+
+
+def _recent_wet_days(tp_histo_last: np.ndarray, tp: np.ndarray) -> np.ndarray:
+    """
+    Wet day on the day or the day before. For the first day, the last observation and the first day must be
+    both wet days.
+    """
+    wet = wet_days(tp)
+    wet_previous = _shift(wet, wet_days(tp_histo_last))
+    recent_wet_days = wet_previous | wet
+    recent_wet_days[..., :1] = wet_previous[..., :1] & wet[..., :1]
+    return recent_wet_days
+
+
+def _forward_sum(values: np.ndarray, days: int) -> np.ndarray:
+    """ Sum of the day and the next `days - 1` days along the last axis, ignoring NaN and the days after the end """
+    values = np.nan_to_num(np.asarray(values, dtype='float64'))
+    size = values.shape[-1]
+    total = np.zeros_like(values)
+    # days added one by one in the same order as a Series sum, to get the same rounding
+    for offset in range(min(days, size)):
+        total[..., :size - offset] += values[..., offset:]
+    return total
@@ -6,6 +6,8 @@ import pandas as pd
 import xarray as xr
 import typing as T
 
+from vigiclimm_indicators.weather_indicators.dtypes import code_dtype
+
 
 def rice_blast(tmean: T.Union[pd.Series, xr.DataArray],
                tmin: T.Union[pd.Series, xr.DataArray],
@@ -39,13 +41,14 @@ def rice_blast(tmean: T.Union[pd.Series, xr.DataArray],
     moderate_risk = ~high_risk & ~no_risk
 
     # Map boolean arrays to risk values
-    risk_values = high_risk.astype(int) * 2 + moderate_risk.astype(int)
+    dtype = code_dtype()
+    risk_values = high_risk.astype(dtype) * 2 + moderate_risk.astype(dtype)
 
     # Create the output object based on input type
     if isinstance(risk_values, xr.DataArray):
         risk = xr.DataArray(risk_values, coords=risk_values.coords)
     elif isinstance(risk_values, pd.Series):
-        risk = pd.Series(risk_values, index=risk_values.index, dtype=int) # type: ignore  # noqa
+        risk = pd.Series(risk_values, index=risk_values.index, dtype=dtype) # type: ignore  # noqa
     else:
         raise TypeError("Expected pd.Series or xr.DataArray")
 
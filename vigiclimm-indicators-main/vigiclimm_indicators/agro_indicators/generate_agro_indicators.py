@@ -1,25 +1,38 @@
 """
 Generation of agro indicators and risk disease indicator for all reference stations.
-Input data are forecast indicators (CSV format).
-Output data in a CSV format (one indicator/station).
+Input data are forecast indicators (CSV format, consolidated store, or memory-mapped forecast array).
+Output data in a CSV format (one indicator/station), or in a consolidated store.
+The indicators of all stations are computed at once, on (station, time) arrays.
 """
 
 import vigiclimm_indicators.agro_indicators.agro_indicators as agro
 from vigiclimm_indicators.agro_indicators.disease import rice_blast
-from vigiclimm_indicators.weather_indicators.utils import write_to_csv, setup_logger
+from vigiclimm_indicators.weather_indicators.utils import write_to_csv, setup_logger, run_sharded
+from vigiclimm_indicators.weather_indicators.dtypes import set_compact_dtypes
+from vigiclimm_indicators.weather_indicators.profiling import profile, enable_profiling, write_profile
+from vigiclimm_indicators.weather_indicators.station_registry import load_station_list
+from vigiclimm_indicators.weather_indicators.output_store import (
+    OUTPUT_FORMATS, array_path, blocks_to_dataset, float32_to_csv_float64, product_path, read_array, read_store,
+    write_store)
 
+import numpy as np
 import pandas as pd
+import xarray as xr
 import typing as T
-import yaml
 import glob
 import os
+import sys
 import click
+from functools import partial
 from pathlib import Path
 from loguru import logger
 
 # loguru logger configuration
 setup_logger(verbose=1)
 
+# forecast parameters used by the agro indicators
+AGRO_PARAMETERS = ['tp', 'tmax', 'tmean', 'tmin', 'rhmean', 'rhmin', 'gust', 'mcc', 'lcc', 'etp']
+
 
 def compute_and_write(input_path: T.Union[str, os.PathLike],
                       station_name: str,
@@ -32,40 +45,189 @@ def compute_and_write(input_path: T.Union[str, os.PathLike],
         station_name: Name of the station/location.
         outdir: Path of the output directory where CSV files will be saved.
     """
+    df, df_histo = read_station_csv(input_path, station_name)
+    write_station(compute_agro_indicators(df, df_histo), outdir, station_name)
+
+
+def read_station_csv(input_path: T.Union[str, os.PathLike],
+                     station_name: str) -> T.Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read the forecast and historical CSV files of a location.
+
+    Args:
+        input_path: Repositery where forecast and historical input are stored (csv files).
+        station_name: Name of the station/location.
+
+    Returns:
+        Forecast parameters and indicators, one column per parameter, and historical rainfall ('tp' column).
+    """
     # get all forecast values in the same dataframe
     df = merge_forecast_files(input_path, station_name)
+    return df, read_history_csv(input_path, station_name)
 
-    # get historical rainfall
-    df_histo = pd.read_csv(
+
+def read_history_csv(input_path: T.Union[str, os.PathLike], station_name: str) -> pd.DataFrame:
+    """
+    Read the historical rainfall CSV file of a location.
+
+    Args:
+        input_path: Repositery where historical input are stored (csv files).
+        station_name: Name of the station/location.
+
+    Returns:
+        Historical rainfall ('tp' column).
+    """
+    return pd.read_csv(
         os.path.join(
             input_path, f'{station_name}_historical_tp.csv'), index_col="time", converters={"time": pd.to_datetime})
 
-    df_sowing = agro.sowing(df_histo, df.tp, df.gust)
-    write_to_csv(df_sowing, outdir, station_name, 'sowing')
 
-    df_drying = agro.drying(df.tp, df.tmax, df.rhmean, df.rhmin)
-    write_to_csv(df_drying, outdir, station_name, 'drying')
+def write_station(indicators: T.Dict[str, pd.Series],
+                  outdir: T.Union[str, os.PathLike],
+                  station_name: str) -> None:
+    """
+    Write the agro indicators of a location to CSV format, one file per indicator.
+
+    Args:
+        indicators: Series of each indicator, see ``compute_agro_indicators``.
+        outdir: Path of the output directory where CSV files will be saved.
+        station_name: Name of the station/location.
+    """
+    for par, data in indicators.items():
+        write_to_csv(data, outdir, station_name, par)
+
+
+def compute_agro_indicators(df: T.Union[pd.DataFrame, xr.Dataset],
+                            df_histo: T.Union[pd.DataFrame, xr.Dataset]
+                            ) -> T.Dict[str, T.Union[pd.Series, xr.DataArray]]:
+    """
+    Compute agro indicators and risk disease indicator for a location, or for all stations at once.
+
+    Args:
+        df: Forecast parameters and indicators, one column per parameter (see ``merge_forecast_files``),
+            or Dataset of dimensions (station, time) (see ``forecast_block``).
+        df_histo: Historical rainfall ('tp' column), or Dataset of dimensions (station, day)
+            (see ``history_block``).
+
+    Returns:
+        Series (or DataArray of dimensions (station, time)) of each indicator.
+    """
+    compute = {
+        'sowing': lambda: agro.sowing(df_histo.tp, df.tp, df.gust),
+        'drying': lambda: agro.drying(df.tp, df.tmax, df.rhmean, df.rhmin),
+        'land_preparation': lambda: agro.land_preparation(df_histo.tp, df.tp, df.gust),
+        'fertilization': lambda: agro.fertilization(df_histo.tp, df.tp, df.tmax, df.rhmean, df.gust),
+        'harvesting': lambda: agro.harvesting(df_histo.tp, df.tp, df.rhmean),
+        'protection': lambda: agro.protection(df_histo.tp, df.tp, df.tmax, df.gust,
+                                              compute_mean_cloud_cover(df.mcc, df.lcc)),
+        'irrigation': lambda: agro.irrigation(df_histo.tp, df.tp, df.etp),
+        'rice_blast': lambda: rice_blast(df.tmean, df.tmin, df.rhmean),  # type: ignore
+    }
+    indicators = {}
+    for name, indicator in compute.items():
+        with profile('compute', name):
+            indicators[name] = indicator()
+    return indicators
+
+
+def compute_agro_dataset(forecast: xr.Dataset, history: xr.Dataset) -> xr.Dataset:
+    """
+    Compute agro indicators and risk disease indicator for all stations at once.
+    The indicators are the same as computed station by station from the CSV files.
+
+    Args:
+        forecast: Forecast parameters of dimensions (station, time), see ``forecast_block`` or ``blocks_to_dataset``.
+        history: Historical rainfall ('tp' variable) of dimensions (station, day), see ``history_block``.
+
+    Returns:
+        Dataset of dimensions (station, time), one variable per indicator.
+    """
+    # parameters converted to the values read from the CSV files, so that the thresholds give the same results
+    forecast = xr.Dataset({par: forecast[par].copy(data=float32_to_csv_float64(forecast[par].values))
+                           for par in AGRO_PARAMETERS})
+    history = history.sel(station=forecast['station'].values)
+    return blocks_to_dataset(compute_agro_indicators(forecast, history))  # type: ignore
+
+
+def forecast_block(frames: T.Dict[str, pd.DataFrame]) -> xr.Dataset:
+    """
+    Gather the forecast parameters of several stations, as read by ``merge_forecast_files``.
+
+    Args:
+        frames: Forecast parameters of each station.
+
+    Returns:
+        Dataset of dimensions (station, time).
+    """
+    time = pd.DatetimeIndex(sorted(set().union(*(df.index for df in frames.values()))), name='time')
+    return xr.Dataset(
+        {par: (('station', 'time'), np.stack([df[par].reindex(time).to_numpy() for df in frames.values()]))
+         for par in AGRO_PARAMETERS},
+        coords={'station': list(frames), 'time': time})
+
+
+def history_block(histories: T.Dict[str, pd.Series]) -> xr.Dataset:
+    """
+    Gather the historical rainfall of several stations. The indicators only look at the last days of history,
+    whatever their dates: the histories are aligned on their last day, shorter ones are padded with NaN.
+
+    Args:
+        histories: Historical rainfall of each station.
+
+    Returns:
+        Dataset with a 'tp' variable of dimensions (station, day), the last day of history being day -1.
+    """
+    size = max((len(tp) for tp in histories.values()), default=0)
+    values = np.full((len(histories), size), np.nan)
+    for n, tp in enumerate(histories.values()):
+        if len(tp):
+            values[n, size - len(tp):] = float32_to_csv_float64(tp.to_numpy())
+    return xr.Dataset({'tp': (('station', 'day'), values)},
+                      coords={'station': list(histories), 'day': np.arange(-size, 0)})
 
-    df_land_preparation = agro.land_preparation(df_histo.tp, df.tp, df.gust)
-    write_to_csv(df_land_preparation, outdir, station_name, 'land_preparation')
 
-    df_fertilization = agro.fertilization(df_histo.tp, df.tp, df.tmax, df.rhmean, df.gust)
-    write_to_csv(df_fertilization, outdir, station_name, 'fertilization')
+def history_from_store(ds: xr.Dataset) -> xr.Dataset:
+    """
+    Historical rainfall of all stations of a historical store, aligned on the last day of each station
+    (see ``history_block``).
 
-    df_harvesting = agro.harvesting(df_histo.tp, df.tp, df.rhmean)
-    write_to_csv(df_harvesting, outdir, station_name, 'harvesting')
+    Args:
+        ds: Historical store of dimensions (station, time), see ``read_store``.
 
-    df_protection = agro.protection(df_histo.tp, df.tp, df.tmax, df.gust, compute_mean_cloud_cover(df.mcc, df.lcc))
-    write_to_csv(df_protection, outdir, station_name, 'protection')
+    Returns:
+        Dataset with a 'tp' variable of dimensions (station, day).
+    """
+    values = float32_to_csv_float64(ds['tp'].values).astype('float64')
+    size = values.shape[-1]
+    if 'tp_rows' in ds.coords:
+        rows = ds['tp_rows'].values.astype(bool)
+    else:
+        # stores written without the rows of the series: rows between the first and last valid values
+        valid = ~np.isnan(values)
+        rows = np.logical_or.accumulate(valid, axis=-1) & np.logical_or.accumulate(valid[:, ::-1], axis=-1)[:, ::-1]
+    # the rows of each station, in order, moved to the last days
+    order = np.argsort(rows, axis=-1, kind='stable')
+    values = np.take_along_axis(values, order, axis=-1)
+    values[~np.take_along_axis(rows, order, axis=-1)] = np.nan
+    return xr.Dataset({'tp': (('station', 'day'), values)},
+                      coords={'station': ds['station'].values, 'day': np.arange(-size, 0)})
 
-    df_irrigation = agro.irrigation(df_histo.tp, df.tp, df.etp)
-    write_to_csv(df_irrigation, outdir, station_name, 'irrigation')
 
-    df_risk_disease = rice_blast(df.tmean, df.tmin, df.rhmean)
-    write_to_csv(df_risk_disease, outdir, station_name, 'rice_blast') # type: ignore  # noqa
+def write_dataset(ds: xr.Dataset, outdir: T.Union[str, os.PathLike]) -> None:
+    """
+    Write the agro indicators computed by ``compute_agro_dataset`` to CSV format, one file per station and indicator.
+
+    Args:
+        ds: Dataset of dimensions (station, time), one variable per indicator.
+        outdir: Path of the output directory where CSV files will be saved.
+    """
+    for i, station_name in enumerate(ds['station'].values):
+        logger.info(f'Writing agro indicators for {station_name}')
+        write_station({str(par): ds[par].isel(station=i).to_series() for par in ds.data_vars}, outdir, station_name)
 
 
-def compute_mean_cloud_cover(mcc: pd.Series, lcc: pd.Series) -> pd.Series:
+def compute_mean_cloud_cover(mcc: T.Union[pd.Series, xr.DataArray],
+                             lcc: T.Union[pd.Series, xr.DataArray]) -> T.Union[pd.Series, xr.DataArray]:
     """
     Compute mean cloud cover, using low and medium level.
     Input are from GFS forecast.
@@ -103,18 +265,140 @@ def merge_forecast_files(input_path: T.Union[str, os.PathLike], station_name: st
     return df
 
 
+def compute_stations(forecast: xr.Dataset, history: xr.Dataset) -> T.Tuple[T.List[str], T.Optional[xr.Dataset]]:
+    """
+    Compute agro indicators for a block of stations with ``compute_agro_dataset``. If the block of stations
+    fails, the stations are computed one by one so that a single station does not make the others fail.
+
+    Args:
+        forecast: Forecast parameters of dimensions (station, time).
+        history: Historical rainfall ('tp' variable) of dimensions (station, day).
+
+    Returns:
+        Names of the stations that failed, and the agro indicators of the others (None if all stations failed).
+    """
+    try:
+        return [], compute_agro_dataset(forecast, history)
+    except Exception:
+        logger.exception("Agro indicators failed for the block of stations, computing stations one by one")
+
+    failed = []
+    blocks = []
+    for station_name in forecast['station'].values:
+        try:
+            blocks.append(compute_agro_dataset(forecast.sel(station=[station_name]),
+                                               history.sel(station=[station_name])))
+        except Exception:
+            logger.exception(f"Agro indicators failed for {station_name}")
+            failed.append(str(station_name))
+    return failed, (xr.concat(blocks, dim='station') if blocks else None)
+
+
+def _compute_and_write_stations(station_list: T.List[T.Dict[str, T.Any]],
+                                input_path: T.Union[str, os.PathLike],
+                                outdir: T.Union[str, os.PathLike],
+                                output_format: str,
+                                stores: T.Optional[T.Dict[str, xr.Dataset]] = None
+                                ) -> T.Tuple[T.List[str], T.Optional[xr.Dataset]]:
+    """
+    Compute agro indicators for a list of stations, and write them to CSV or return them to be written to
+    the consolidated store. The forecast and historical data are read from the stores given by ``_open_inputs``,
+    or from the CSV files. Returns the stations that failed.
+    """
+    failed = []
+    stores = dict(stores) if stores is not None else {}
+    if output_format == 'csv':
+        frames = {}
+        histories = {}
+        for station in station_list:
+            try:
+                with profile('read', station=station['station']):
+                    if 'forecast' in stores:
+                        df_histo = read_history_csv(input_path, station['station'])
+                    else:
+                        df, df_histo = read_station_csv(input_path, station['station'])
+                        frames[station['station']] = df[AGRO_PARAMETERS]
+                histories[station['station']] = df_histo.tp
+            except Exception:
+                logger.exception(f"Agro indicators failed for {station['station']}")
+                failed.append(station['station'])
+        if not histories:
+            return failed, None
+        stores['history'] = history_block(histories)
+        if frames:
+            stores['forecast'] = forecast_block(frames)
+
+    available = set(stores['forecast']['station'].values) & set(stores['history']['station'].values)
+    names = [station['station'] for station in station_list
+             if station['station'] in available and station['station'] not in failed]
+    for station in station_list:
+        if station['station'] not in available and station['station'] not in failed:
+            logger.error(f"Agro indicators failed for {station['station']}: no forecast or historical data")
+            failed.append(station['station'])
+    if not names:
+        return failed, None
+    forecast = stores['forecast'].sel(station=names)
+    history = stores['history'].sel(station=names)
+
+    failed_block, indicators = compute_stations(forecast, history)
+    failed.extend(failed_block)
+
+    if indicators is None or output_format != 'csv':
+        return failed, indicators
+    write_dataset(indicators, outdir)
+    return failed, None
+
+
+def _open_inputs(input_path: T.Union[str, os.PathLike],
+                 output_format: str,
+                 forecast_array: bool = False) -> T.Dict[str, T.Any]:
+    """ Read the consolidated forecast and historical stores, or memory-map the forecast array, once per process """
+    stores = {}
+    if forecast_array:
+        stores['forecast'] = read_array(array_path(input_path, 'forecast'))
+    if output_format != 'csv':
+        if not forecast_array:
+            stores['forecast'] = read_store(product_path(input_path, 'forecast', output_format))
+        stores['history'] = history_from_store(read_store(product_path(input_path, 'historical', output_format)))
+    return {'stores': stores}
+
+
 @click.command()
 @click.option("--yml-path", required=True, type=click.Path(exists=True, path_type=Path))
 @click.option("--input-path", required=True, type=click.Path(exists=True, path_type=Path))
 @click.option("--outdir", required=True, type=Path)
+@click.option("--workers", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option("--output-format", default='csv', show_default=True, type=click.Choice(OUTPUT_FORMATS))
+@click.option("--forecast-array/--no-forecast-array", default=False, show_default=True)
+@click.option("--compact-dtypes/--no-compact-dtypes", default=False, show_default=True)
+@click.option("--profile-path", type=Path)
 def run_all_stations(yml_path: T.Union[str, os.PathLike],
                      input_path: T.Union[str, os.PathLike],
-                     outdir: T.Union[str, os.PathLike]):
+                     outdir: T.Union[str, os.PathLike],
+                     workers: int = 1,
+                     output_format: str = 'csv',
+                     forecast_array: bool = False,
+                     compact_dtypes: bool = False,
+                     profile_path: T.Optional[T.Union[str, os.PathLike]] = None):
 
-    with open(yml_path, 'r') as file:
-        station_list = yaml.safe_load(file)
+    station_list = load_station_list(yml_path)
 
-        for station in station_list:
-            logger.info(f'Writing agro indicators for {station}')
-            compute_and_write(input_path, station['station'], outdir)
-    logger.opt(ansi=True).info('<green>All indicators written successfully</green>')
+    enable_profiling(profile_path is not None)
+    set_compact_dtypes(compact_dtypes)
+    with profile('total', stage='agro'):
+        failed, outputs = run_sharded(partial(_compute_and_write_stations, input_path=input_path, outdir=outdir,
+                                              output_format=output_format),
+                                      station_list, workers, _open_inputs, input_path, output_format, forecast_array)
+
+        blocks = [ds for ds in outputs if ds is not None]
+        if blocks and output_format != 'csv':
+            write_store(xr.concat(blocks, dim='station'), outdir, 'agro', output_format)
+    if profile_path is not None:
+        write_profile(profile_path)
+
+    if failed:
+        logger.error(f"Agro indicators not written for stations: {failed}")
+        # non-zero exit status, so that a partial run can be detected
+        sys.exit(1)
+    else:
+        logger.opt(ansi=True).info('<green>All indicators written successfully</green>')
@@ -0,0 +1,167 @@
+"""
+Run the forecast, historical and agro stages for all stations in a single process.
+
+The forecast and historical indicators of each station are passed in memory to the agro stage, instead of being
+written to CSV files and read back: the CSV files (or the consolidated stores) are only the final outputs.
+The agro indicators are the same as with `vi-run-forecast`, `vi-run-historical` and `vi-run-agro` run one after
+the other.
+"""
+
+import os
+import sys
+import click
+import xarray as xr
+import typing as T
+
+from functools import partial
+from pathlib import Path
+from loguru import logger
+
+from vigiclimm_indicators.weather_indicators import daily_forecast, historical
+from vigiclimm_indicators.weather_indicators.grid_index import load_station_grid_index
+from vigiclimm_indicators.weather_indicators.history_cache import load_history
+from vigiclimm_indicators.weather_indicators.observations import read_observations
+from vigiclimm_indicators.weather_indicators.dtypes import set_compact_dtypes
+from vigiclimm_indicators.weather_indicators.profiling import profile, enable_profiling, write_profile
+from vigiclimm_indicators.weather_indicators.station_registry import load_station_list
+from vigiclimm_indicators.weather_indicators.output_store import (
+    OUTPUT_FORMATS, blocks_to_dataset, stations_to_dataset, write_store)
+from vigiclimm_indicators.weather_indicators.utils import setup_logger, run_sharded
+from vigiclimm_indicators.agro_indicators import generate_agro_indicators as agro
+
+# loguru logger configuration
+setup_logger(verbose=1)
+
+
+def _open_inputs(station_list: T.List[T.Dict[str, T.Any]],
+                 ds_path: T.Union[str, os.PathLike],
+                 era5land_path: T.Union[str, os.PathLike],
+                 tamsat_path: T.Union[str, os.PathLike],
+                 history_paths: T.Optional[T.Dict[str, Path]] = None) -> T.Dict[str, T.Any]:
+    """
+    Open the GFS file, shared by the forecast and historical stages, the cached daily history, and load the station
+    indices
+    """
+    inputs = daily_forecast._open_inputs(station_list, ds_path)
+    with xr.open_dataset(era5land_path) as ds:
+        load_station_grid_index(ds.latitude, ds.longitude, station_list)
+    with xr.open_dataset(tamsat_path) as ds:
+        load_station_grid_index(ds.lat, ds.lon, station_list)
+    if history_paths is not None:
+        inputs['era5land_daily'] = load_history(history_paths['era5land'])
+        inputs['tamsat_daily'] = load_history(history_paths['tamsat'])
+    return inputs
+
+
+def _run_stations(station_list: T.List[T.Dict[str, T.Any]],
+                  obs_path: T.Union[str, os.PathLike],
+                  era5land_path: T.Union[str, os.PathLike],
+                  tamsat_path: T.Union[str, os.PathLike],
+                  outdir: T.Union[str, os.PathLike],
+                  output_format: str,
+                  ds: xr.Dataset,
+                  era5land_daily: T.Optional[xr.DataArray] = None,
+                  tamsat_daily: T.Optional[xr.DataArray] = None) -> T.Tuple[T.List[str], T.Dict[str, T.Any]]:
+    """
+    Run the three stages for a list of stations, and write the indicators to CSV or return them to be written to
+    the consolidated stores. Returns the stations that failed at any stage.
+    """
+    with profile('total', stage='forecast'):
+        failed, blocks = daily_forecast.compute_station_blocks(ds, station_list)
+        forecast = xr.concat([blocks_to_dataset(block) for block in blocks], dim='station') if blocks else None
+
+    with profile('total', stage='historical'):
+        observations = read_observations(obs_path, [station['station'] for station in station_list])
+        if era5land_daily is None:
+            era5land_daily = historical.get_era5_land_shard(era5land_path, station_list, observations)
+        # pseudo-observations filling the last TAMSAT days: first two days of the forecast rainfall already computed
+        pseudo_obs = None if forecast is None else forecast['tp'].isel(time=[0, 1])
+        historical_indicators = {}
+        for station in station_list:
+            logger.info(f'Computing historical indicators for {station}')
+            try:
+                historical_indicators[station['station']] = historical.compute_station(
+                    station, obs_path, era5land_path, tamsat_path, ds, era5land_daily, tamsat_daily,
+                    observations, pseudo_obs)
+            except Exception:
+                logger.exception(f"Historical indicators failed for {station['station']}")
+                failed.append(station['station'])
+
+    # agro indicators of the stations with both forecast and historical data, all at once
+    agro_indicators = None
+    names = [] if forecast is None else [name for name in forecast['station'].values if name in historical_indicators]
+    if names:
+        with profile('total', stage='agro'):
+            history = agro.history_block({name: historical_indicators[name]['tp'] for name in names})
+            failed_agro, agro_indicators = agro.compute_stations(forecast.sel(station=names), history)  # type: ignore
+        failed.extend(failed_agro)
+
+    if output_format != 'csv':
+        return failed, {'forecast': forecast, 'historical': historical_indicators, 'agro': agro_indicators}
+
+    with profile('output', stage='forecast'):
+        for block in blocks:
+            daily_forecast.write_all_stations(block, outdir)
+    with profile('output', stage='historical'):
+        for name, indicators in historical_indicators.items():
+            historical.write_station(indicators, outdir, name)
+    if agro_indicators is not None:
+        with profile('output', stage='agro'):
+            agro.write_dataset(agro_indicators, outdir)
+    return failed, {}
+
+
+@click.command()
+@click.option("--yml-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--ds-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--obs-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--era5land-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--tamsat-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--outdir", required=True, type=Path)
+@click.option("--workers", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option("--output-format", default='csv', show_default=True, type=click.Choice(OUTPUT_FORMATS))
+@click.option("--history-cache/--no-history-cache", default=False, show_default=True)
+@click.option("--compact-dtypes/--no-compact-dtypes", default=False, show_default=True)
+@click.option("--profile-path", type=Path)
+def run_all(yml_path: T.Union[str, os.PathLike],
+            ds_path: T.Union[str, os.PathLike],
+            obs_path: T.Union[str, os.PathLike],
+            era5land_path: T.Union[str, os.PathLike],
+            tamsat_path: T.Union[str, os.PathLike],
+            outdir: T.Union[str, os.PathLike],
+            workers: int = 1,
+            output_format: str = 'csv',
+            history_cache: bool = False,
+            compact_dtypes: bool = False,
+            profile_path: T.Optional[T.Union[str, os.PathLike]] = None):
+
+    station_list = load_station_list(yml_path)
+
+    enable_profiling(profile_path is not None)
+    set_compact_dtypes(compact_dtypes)
+    with profile('total', stage='all'):
+        history_paths = (historical.update_history_cache(station_list, era5land_path, tamsat_path)
+                         if history_cache else None)
+
+        failed, outputs = run_sharded(partial(_run_stations, obs_path=obs_path, era5land_path=era5land_path,
+                                              tamsat_path=tamsat_path, outdir=outdir, output_format=output_format),
+                                      station_list, workers, _open_inputs, station_list, ds_path, era5land_path,
+                                      tamsat_path, history_paths)
+
+        if output_format != 'csv':
+            for product in ['forecast', 'agro']:
+                blocks = [output[product] for output in outputs if output[product] is not None]
+                if blocks:
+                    write_store(xr.concat(blocks, dim='station'), outdir, product, output_format)
+            indicators = {station: data for output in outputs for station, data in output['historical'].items()}
+            if indicators:
+                write_store(stations_to_dataset(indicators, period='historical'), outdir, 'historical', output_format)
+    if profile_path is not None:
+        write_profile(profile_path)
+
+    if failed:
+        logger.error(f"Indicators not written for stations: {sorted(set(failed))}")
+        # non-zero exit status, so that a partial run can be detected
+        sys.exit(1)
+    else:
+        logger.opt(ansi=True).info('<green>All indicators written successfully</green>')
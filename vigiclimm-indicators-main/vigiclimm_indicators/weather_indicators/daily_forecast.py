@@ -1,26 +1,37 @@
 """
-Compute and return daily weather parameters and forecasted indicators from GFS.
+Compute and return daily weather parameters and forecasted indicators from GFS, at the stations or over the whole
+GFS grid (`vi-run-forecast-grid`).
 """
 
 import os
+import sys
 import click
 import xarray as xr
 import pandas as pd
 import typing as T
-import yaml
 
+from functools import partial
 from pathlib import Path
 from loguru import logger
-from .preprocess import preprocess_gfs
+from .preprocess import preprocess_gfs, daily_gfs_grid, daily_gfs_stations, postprocess_gfs, open_gfs, GFSInput
 from .extreme_events import generate_risk
-from .etp import etp_from_gfs
-from .utils import write_to_csv, setup_logger
+from .etp import etp_from_gfs, etp_from_daily
+from .grid_index import load_station_grid_index, is_station_extract
+from .output_store import OUTPUT_FORMATS, array_path, blocks_to_dataset, write_array, write_store
+from .dtypes import set_compact_dtypes
+from .profiling import profile, enable_profiling, write_profile
+from .station_registry import load_station_list
+from .utils import write_to_csv, setup_logger, run_sharded
 
 # loguru logger configuration
 setup_logger(verbose=1)
 
+# raw forecast parameters, and the parameters only used for the ETP
+FORECAST_PARAMETERS = ['tp', 'tmax', 'tmean', 'tmin', 'dswrf', 'rhmean', 'rhmax', 'rhmin', 'gust', 'mcc', 'lcc']
+ETP_PARAMETERS = ['2d', '10u', '10v']
 
-def compute_and_write(ds_path: T.Union[str, os.PathLike],
+
+def compute_and_write(ds_path: GFSInput,
                       station_lat: T.Union[int, float],
                       station_lon: T.Union[int, float],
                       station_name: str,
@@ -30,14 +41,14 @@ def compute_and_write(ds_path: T.Union[str, os.PathLike],
     Input data should be GFS.
 
     Args:
-        ds_path: Path of the GFS file containing all parameters for all steps.
+        ds_path: Path of the GFS file containing all parameters for all steps, or GFS dataset already opened
+            with ``open_gfs``.
         station_lat: Latitude of the location.
         station_lon: Longitude of the location.
         station_name: Name of the station/location.
         outdir: Path of the output directory where CSV files will be saved.
     """
-    par_list = ['tp', 'tmax', 'tmean', 'tmin', 'dswrf', 'rhmean', 'rhmax', 'rhmin', 'gust', 'mcc', 'lcc']
-    for par in par_list:
+    for par in FORECAST_PARAMETERS:
         # keep raw Solar Radiation units; converts otherwise.
         if par == 'dswrf':
             ds = preprocess_gfs(ds_path, par, station_lat, station_lon, convert=False)
@@ -74,6 +85,124 @@ def compute_and_write(ds_path: T.Union[str, os.PathLike],
     write_to_csv(df_etp, outdir, station_name, 'etp')
 
 
+def compute_all_stations(ds_path: GFSInput,
+                         station_list: T.List[T.Dict[str, T.Any]]) -> T.Dict[str, xr.DataArray]:
+    """
+    Compute weather parameters and forecast indicators for all stations at once.
+    Each GFS variable is extracted and resampled once for all stations, in a single (station, time) block which
+    feeds the raw parameters, the extreme events and the ETP.
+
+    Args:
+        ds_path: Path of the GFS file containing all parameters for all steps, or GFS dataset already opened
+            with ``open_gfs``.
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+
+    Returns:
+        Dictionary of DataArrays of dimensions (station, time), one for each parameter/indicator.
+    """
+    with profile('extract'):
+        daily = daily_gfs_stations(ds_path, FORECAST_PARAMETERS + ETP_PARAMETERS, station_list)
+    return compute_forecast(daily)
+
+
+def compute_forecast(daily: T.Dict[str, xr.DataArray]) -> T.Dict[str, xr.DataArray]:
+    """
+    Compute weather parameters and forecast indicators from daily GFS parameters, whatever their other dimensions,
+    e.g. (station, time) or (time, latitude, longitude).
+
+    Args:
+        daily: Daily values of ``FORECAST_PARAMETERS`` and ``ETP_PARAMETERS``, see ``daily_gfs_stations`` and
+            ``daily_gfs_grid``.
+
+    Returns:
+        Dictionary of DataArrays, one for each parameter/indicator.
+    """
+    forecast = {}
+    for par in FORECAST_PARAMETERS:
+        with profile('compute', par):
+            # keep raw Solar Radiation units; converts otherwise.
+            forecast[par] = postprocess_gfs(daily[par], par, convert=(par != 'dswrf'))
+
+    tp = forecast['tp']
+    indicators = {
+        'wet_days': lambda: wet_days(tp),
+        'sum_tp': lambda: tp.sum('time').round(1).expand_dims(time=tp.time.values[:1], axis=-1),
+        'heavy_rain': lambda: generate_risk(tp, 10, 30),
+        'heat_stress': lambda: generate_risk(forecast['tmax'], 35, 38),
+        'strong_wind': lambda: generate_risk(forecast['gust'], 50, 70),
+        'etp': lambda: etp_from_daily(net_rad=postprocess_gfs(daily['dswrf'], 'dswrf', convert=True),
+                                      t=forecast['tmean'],
+                                      tdew=postprocess_gfs(daily['2d'], '2d', convert=True),
+                                      u=postprocess_gfs(daily['10u'], '10u'),
+                                      v=postprocess_gfs(daily['10v'], '10v')),
+    }
+    for name, compute in indicators.items():
+        with profile('compute', name):
+            forecast[name] = compute()
+
+    return forecast
+
+
+def compute_grid(ds: xr.Dataset, chunk_size: int = 8) -> T.Dict[str, xr.DataArray]:
+    """
+    Compute weather parameters and forecast indicators over the whole GFS grid, with the same computations as
+    ``compute_all_stations``. The grid is read and computed by blocks of latitudes, so that only one block of the
+    hourly data is in memory at once.
+
+    Args:
+        ds: GFS dataset opened with ``open_gfs``, preferably without loading it.
+        chunk_size: Number of latitudes of each block.
+
+    Returns:
+        Dictionary of DataArrays of dimensions (time, latitude, longitude), one for each parameter/indicator.
+    """
+    blocks = []
+    for start in range(0, ds.sizes['latitude'], chunk_size):
+        block = ds.isel(latitude=slice(start, start + chunk_size))
+        with profile('extract', station=f"latitude {start}"):
+            daily = daily_gfs_grid(block, FORECAST_PARAMETERS + ETP_PARAMETERS)
+        blocks.append(compute_forecast(daily))
+
+    return {par: xr.concat([block[par] for block in blocks], dim='latitude').transpose('time', 'latitude', 'longitude')
+            for par in blocks[0]}
+
+
+def write_grid(forecast: T.Dict[str, xr.DataArray], outdir: T.Union[str, os.PathLike]) -> None:
+    """
+    Write weather parameters and forecast indicators computed by ``compute_grid`` to NetCDF format,
+    one file per parameter (`grid_forecast_<parameter>.nc`).
+
+    Args:
+        forecast: Dictionary of DataArrays of dimensions (time, latitude, longitude), one for each
+            parameter/indicator.
+        outdir: Path of the output directory where NetCDF files will be saved.
+    """
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    for par, data in forecast.items():
+        with profile('write', par):
+            path = Path(outdir) / f'grid_forecast_{par}.nc'
+            logger.info(f'Writing {par} map to {path}')
+            data.to_dataset(name=par).to_netcdf(path)
+
+
+def write_all_stations(forecast: T.Dict[str, xr.DataArray],
+                       outdir: T.Union[str, os.PathLike]) -> None:
+    """
+    Write weather parameters and forecast indicators computed by ``compute_all_stations`` to CSV format,
+    one file per station and parameter.
+
+    Args:
+        forecast: Dictionary of DataArrays of dimensions (station, time), one for each parameter/indicator.
+        outdir: Path of the output directory where CSV files will be saved.
+    """
+    station_names = next(iter(forecast.values()))['station'].values
+    for i, station_name in enumerate(station_names):
+        logger.info(f'Writing forecast indicators for {station_name}')
+        for par, data in forecast.items():
+            logger.info(f'Writing {par} parameter for {station_name}')
+            write_to_csv(data.isel(station=i).to_series(), outdir, station_name, par)
+
+
 def wet_days(
     data: T.Union[pd.Series, pd.DataFrame, xr.DataArray, xr.Dataset],
     threshold: T.Union[int, float] = 1,
@@ -94,18 +223,131 @@ def wet_days(
     return wet_days
 
 
+def compute_station_blocks(ds_path: GFSInput,
+                           station_list: T.List[T.Dict[str, T.Any]]
+                           ) -> T.Tuple[T.List[str], T.List[T.Dict[str, xr.DataArray]]]:
+    """
+    Compute weather parameters and forecast indicators for a list of stations with ``compute_all_stations``.
+    If the block of stations fails, the stations are computed one by one so that a single station does not
+    make the others fail.
+
+    Args:
+        ds_path: Path of the GFS file containing all parameters for all steps, or GFS dataset already opened
+            with ``open_gfs``.
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+
+    Returns:
+        Names of the stations that failed, and the blocks of forecast indicators of the others.
+    """
+    failed = []
+    try:
+        blocks = [compute_all_stations(ds_path, station_list)]
+    except Exception:
+        logger.exception("Forecast indicators failed for the block of stations, computing stations one by one")
+        blocks = []
+        for station in station_list:
+            try:
+                blocks.append(compute_all_stations(ds_path, [station]))
+            except Exception:
+                logger.exception(f"Forecast indicators failed for {station['station']}")
+                failed.append(station['station'])
+    return failed, blocks
+
+
+def _open_inputs(station_list: T.List[T.Dict[str, T.Any]],
+                 ds_path: T.Union[str, os.PathLike]) -> T.Dict[str, T.Any]:
+    """ Open and decode the GFS file and load the nearest grid cell of all stations, once per process """
+    ds = open_gfs(ds_path)
+    if not is_station_extract(ds):
+        load_station_grid_index(ds.latitude, ds.longitude, station_list)
+    return {'ds': ds}
+
+
+def _compute_and_write_stations(station_list: T.List[T.Dict[str, T.Any]],
+                                outdir: T.Union[str, os.PathLike],
+                                output_format: str,
+                                ds: xr.Dataset,
+                                forecast_array: bool = False) -> T.Tuple[T.List[str], T.Optional[xr.Dataset]]:
+    """
+    Compute forecast indicators for a list of stations, and write them to CSV and/or return them to be written to
+    the consolidated store or to the forecast array. Returns the stations that failed.
+    """
+    failed, blocks = compute_station_blocks(ds, station_list)
+
+    if output_format == 'csv':
+        for forecast in blocks:
+            write_all_stations(forecast, outdir)
+    if not blocks or (output_format == 'csv' and not forecast_array):
+        return failed, None
+    return failed, xr.concat([blocks_to_dataset(forecast) for forecast in blocks], dim='station')
+
+
 @click.command()
 @click.option("--yml-path", required=True, type=click.Path(exists=True, path_type=Path))
 @click.option("--ds-path", required=True, type=click.Path(exists=True, path_type=Path))
 @click.option("--outdir", required=True, type=Path)
+@click.option("--workers", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option("--output-format", default='csv', show_default=True, type=click.Choice(OUTPUT_FORMATS))
+@click.option("--forecast-array/--no-forecast-array", default=False, show_default=True)
+@click.option("--compact-dtypes/--no-compact-dtypes", default=False, show_default=True)
+@click.option("--profile-path", type=Path)
 def run_all_stations(yml_path: T.Union[str, os.PathLike],
                      ds_path: T.Union[str, os.PathLike],
-                     outdir: T.Union[str, os.PathLike]):
+                     outdir: T.Union[str, os.PathLike],
+                     workers: int = 1,
+                     output_format: str = 'csv',
+                     forecast_array: bool = False,
+                     compact_dtypes: bool = False,
+                     profile_path: T.Optional[T.Union[str, os.PathLike]] = None):
 
-    with open(yml_path, 'r') as file:
-        station_list = yaml.safe_load(file)
+    station_list = load_station_list(yml_path)
 
-        for station in station_list:
-            logger.info(f'Writing forecast indicators for {station}')
-            compute_and_write(ds_path, station['lat'], station['lon'], station['station'], outdir)
-    logger.opt(ansi=True).info('<green>All indicators written successfully</green>')
+    enable_profiling(profile_path is not None)
+    set_compact_dtypes(compact_dtypes)
+    with profile('total', stage='forecast'):
+        # the GFS file is opened and decoded once per process, for all stations
+        failed, outputs = run_sharded(partial(_compute_and_write_stations, outdir=outdir,
+                                              output_format=output_format, forecast_array=forecast_array),
+                                      station_list, workers, _open_inputs, station_list, ds_path)
+
+        blocks = [ds for ds in outputs if ds is not None]
+        if blocks and (output_format != 'csv' or forecast_array):
+            forecast = xr.concat(blocks, dim='station')
+            if output_format != 'csv':
+                write_store(forecast, outdir, 'forecast', output_format)
+            if forecast_array:
+                write_array(forecast, array_path(outdir, 'forecast'))
+    if profile_path is not None:
+        write_profile(profile_path)
+
+    if failed:
+        logger.error(f"Forecast indicators not written for stations: {failed}")
+        # non-zero exit status, so that a partial run can be detected
+        sys.exit(1)
+    else:
+        logger.opt(ansi=True).info('<green>All indicators written successfully</green>')
+
+
+@click.command()
+@click.option("--ds-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--outdir", required=True, type=Path)
+@click.option("--chunk-size", default=8, show_default=True, type=click.IntRange(min=1))
+@click.option("--compact-dtypes/--no-compact-dtypes", default=False, show_default=True)
+@click.option("--profile-path", type=Path)
+def run_grid(ds_path: T.Union[str, os.PathLike],
+             outdir: T.Union[str, os.PathLike],
+             chunk_size: int = 8,
+             compact_dtypes: bool = False,
+             profile_path: T.Optional[T.Union[str, os.PathLike]] = None):
+
+    enable_profiling(profile_path is not None)
+    set_compact_dtypes(compact_dtypes)
+    with profile('total', stage='forecast_grid'):
+        # the GFS file is read block by block
+        with open_gfs(ds_path, load=False) as ds:
+            forecast = compute_grid(ds, chunk_size)
+        write_grid(forecast, outdir)
+    if profile_path is not None:
+        write_profile(profile_path)
+
+    logger.opt(ansi=True).info('<green>All maps written successfully</green>')
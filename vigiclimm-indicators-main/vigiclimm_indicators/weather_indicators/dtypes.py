@@ -0,0 +1,36 @@
+"""
+Dtype policy of the parameters and indicators held in memory.
+
+By default, the values keep the dtypes of the computations: float64 for the derived physical values (e.g. ETP),
+int64 for the 0/1/2 risk and condition codes, the wet/dry flags being bool. With compact dtypes (`--compact-dtypes`
+option of the commands), physical values are float32 and codes are int8, which divides the memory of the
+(station, time) blocks by 2 (float values) to 8 (codes). As the physical values are rounded to one decimal, the CSV
+files are the same with both policies. The worker processes of ``utils.run_sharded`` follow the policy of the main
+process.
+"""
+import numpy as np
+import xarray as xr
+
+_compact = False
+
+
+def set_compact_dtypes(compact: bool = True) -> None:
+    """ Use (or stop using) the compact dtypes """
+    global _compact
+    _compact = compact
+
+
+def is_compact_dtypes() -> bool:
+    return _compact
+
+
+def code_dtype() -> np.dtype:
+    """ Dtype of the 0/1/2 risk and condition codes """
+    return np.dtype(np.int8 if _compact else int)
+
+
+def as_physical(data: xr.DataArray) -> xr.DataArray:
+    """ Physical values with the dtype of the policy: float values are converted to float32 with compact dtypes """
+    if _compact and data.dtype.kind == 'f' and data.dtype != np.float32:
+        return data.astype(np.float32)
+    return data
@@ -2,13 +2,14 @@
 Module containing functionality to estimate reference evapotransporation (ETo), sometimes referred as
 potential evapotranspiration (PET), for a grass reference crop using the FAO-56 Penman-Monteith equation.
 """
-import os
 import xarray as xr
 import pandas as pd
 import typing as T
 
 import vigiclimm_indicators.weather_indicators.thermodynamics as thermo
-from vigiclimm_indicators.weather_indicators.preprocess import preprocess_gfs
+from vigiclimm_indicators.weather_indicators.preprocess import (
+    preprocess_gfs, daily_gfs_stations, postprocess_gfs, GFSInput, _as_gfs_dataset)
+from .dtypes import as_physical
 from .wind import wind_speed, wind_speed_2m
 
 
@@ -80,7 +81,7 @@ def fao56_penman_monteith(
     return numerator / denominator
 
 
-def etp_from_gfs(ds_path: T.Union[str, os.PathLike],
+def etp_from_gfs(ds_path: GFSInput,
                  station_lat: T.Union[int, float],
                  station_lon: T.Union[int, float],
                  altitude: T.Union[int, float] = 100
@@ -89,7 +90,8 @@ def etp_from_gfs(ds_path: T.Union[str, os.PathLike],
     Compute ETP using GFS Data as input parameters.
 
     Args:
-        ds_path: Path of the GFS file containing all parameters for all steps.
+        ds_path: Path of the GFS file containing all parameters for all steps, or GFS dataset already opened
+            with ``open_gfs``.
         station_lat: Latitude of the location.
         station_lon: Longitude of the location.
         altitude: altitude of the station [m], by default 100 meters
@@ -97,14 +99,68 @@ def etp_from_gfs(ds_path: T.Union[str, os.PathLike],
     Returns:
         DataArray containing daily forecasted ETo values
     """
+    ds_path = _as_gfs_dataset(ds_path)
+
     net_rad = preprocess_gfs(ds_path, 'dswrf', station_lat, station_lon, convert=True)
     t = preprocess_gfs(ds_path, 'tmean', station_lat, station_lon, convert=True)
     tdew = preprocess_gfs(ds_path, '2d', station_lat, station_lon, convert=True)
 
+    u = preprocess_gfs(ds_path, '10u', station_lat, station_lon)
+    v = preprocess_gfs(ds_path, '10v', station_lat, station_lon)
+
+    return etp_from_daily(net_rad, t, tdew, u, v, altitude)
+
+
+def etp_from_gfs_stations(ds_path: GFSInput,
+                          station_list: T.List[T.Dict[str, T.Any]],
+                          altitude: T.Union[int, float] = 100
+                          ) -> xr.DataArray:
+    """
+    Compute ETP using GFS Data as input parameters, for all stations at once.
+
+    Args:
+        ds_path: Path of the GFS file containing all parameters for all steps, or GFS dataset already opened
+            with ``open_gfs``.
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+        altitude: altitude of the stations [m], by default 100 meters
+
+    Returns:
+        DataArray of dimensions (station, time) containing daily forecasted ETo values
+    """
+    daily = daily_gfs_stations(ds_path, ['dswrf', 'tmean', '2d', '10u', '10v'], station_list)
+
+    return etp_from_daily(net_rad=postprocess_gfs(daily['dswrf'], 'dswrf', convert=True),
+                          t=postprocess_gfs(daily['tmean'], 'tmean', convert=True),
+                          tdew=postprocess_gfs(daily['2d'], '2d', convert=True),
+                          u=postprocess_gfs(daily['10u'], '10u'),
+                          v=postprocess_gfs(daily['10v'], '10v'),
+                          altitude=altitude)
+
+
+def etp_from_daily(net_rad: T.Union[pd.Series, xr.DataArray],
+                   t: T.Union[pd.Series, xr.DataArray],
+                   tdew: T.Union[pd.Series, xr.DataArray],
+                   u: T.Union[pd.Series, xr.DataArray],
+                   v: T.Union[pd.Series, xr.DataArray],
+                   altitude: T.Union[int, float] = 100
+                   ) -> xr.DataArray:
+    """
+    Compute ETP from daily GFS parameters, already extracted and converted.
+
+    Args:
+        net_rad: Daily net radiation [MJ m-2 day-1]
+        t: Daily mean temperature at 2 m height [°C]
+        tdew: Daily mean dewpoint temperature at 2 m height [°C]
+        u: Daily mean U component of the wind at 10 m height [m s-1]
+        v: Daily mean V component of the wind at 10 m height [m s-1]
+        altitude: altitude of the station [m], by default 100 meters
+
+    Returns:
+        DataArray containing daily forecasted ETo values
+    """
     # get wind speed using u and v components, and estimates it at 2m height
     # no conversion; etp function requires wind speed in m/s
-    ws = wind_speed_2m(wind_speed(preprocess_gfs(ds_path, '10u', station_lat, station_lon),
-                                  preprocess_gfs(ds_path, '10v', station_lat, station_lon)), 2)
+    ws = wind_speed_2m(wind_speed(u, v), 2)
 
     etp = fao56_penman_monteith(
         net_rad=net_rad,
@@ -117,4 +173,4 @@ def etp_from_gfs(ds_path: T.Union[str, os.PathLike],
         shf=0.0
     )
 
-    return xr.DataArray(etp).round(1)
+    return as_physical(xr.DataArray(etp).round(1))
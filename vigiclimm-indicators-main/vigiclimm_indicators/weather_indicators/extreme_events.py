@@ -10,6 +10,8 @@ import pandas as pd
 import xarray as xr
 import typing as T
 
+from .dtypes import code_dtype
+
 
 def generate_risk(data: T.Union[pd.Series, xr.DataArray],
                   lower_threshold: T.Union[int, float],
@@ -29,7 +31,8 @@ def generate_risk(data: T.Union[pd.Series, xr.DataArray],
         upper_threshold: Upper threshold value. For example, set to 38°C to generate Heat Stress risk.
 
     Returns:
-        Risk values indicating the severity of the parameter relative to the thresholds.
+        Risk values indicating the severity of the parameter relative to the thresholds, of the codes dtype of
+        the dtype policy (see ``dtypes.code_dtype``).
 
     """
     # Assign risk values based on thresholds
@@ -38,13 +41,14 @@ def generate_risk(data: T.Union[pd.Series, xr.DataArray],
     moderate_risk = ~high_risk & ~no_risk
 
     # Map boolean arrays to risk values
-    risk_values = high_risk.astype(int) * 2 + moderate_risk.astype(int)
+    dtype = code_dtype()
+    risk_values = high_risk.astype(dtype) * 2 + moderate_risk.astype(dtype)
 
     # Create the output object based on input type
     if isinstance(data, xr.DataArray):
         risk = xr.DataArray(risk_values, coords=data.coords)
     elif isinstance(data, pd.Series):
-        risk = pd.Series(risk_values, index=data.index, dtype=int) # type: ignore  # noqa
+        risk = pd.Series(risk_values, index=data.index, dtype=dtype) # type: ignore  # noqa
     else:
         raise TypeError("Expected pd.Series or xr.DataArray")
 
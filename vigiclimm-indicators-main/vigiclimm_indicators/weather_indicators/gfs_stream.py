@@ -0,0 +1,243 @@
+"""
+Streaming aggregation of the GFS forecast steps into daily values.
+
+Instead of converting every GFS step to a single NetCDF file (`gfs.nc`) which is then resampled by day, the step
+files are read one at a time and each step is folded into running daily accumulators, with the daily aggregation
+of each parameter (see ``preprocess.DAILY_METHODS``). Only the daily values are kept in memory and written, in a
+file which can be given instead of `gfs.nc` to the commands (see ``preprocess.is_daily_gfs``).
+
+The GFS variables are extracted from the GRIB files with the filters of the GRIB to NetCDF conversion
+(`gfs_to_nc.yml`), which requires the `cfgrib` package (`grib` extra). Step files already converted to NetCDF
+are also accepted. The step files are read in the order of their valid time, decoded from the files. As with the
+conversion, a variable missing from a step takes its value at the next step.
+"""
+import os
+import tempfile
+import click
+import numpy as np
+import pandas as pd
+import xarray as xr
+import typing as T
+import yaml
+
+from pathlib import Path
+from loguru import logger
+
+from .preprocess import DAILY_METHODS, _gfs_par_name
+from .profiling import profile, enable_profiling, write_profile
+from .utils import setup_logger
+
+# loguru logger configuration
+setup_logger(verbose=1)
+
+# number of days of the daily values
+FORECAST_DAYS = 10
+
+_GRIB_REQUIRED = "Reading GRIB files requires cfgrib, install the `grib` extra"
+
+
+def read_grib_config(config_path: T.Union[str, os.PathLike]) -> T.Tuple[T.Dict[str, T.Dict[str, T.Any]], T.List[str]]:
+    """
+    Read the GFS variables to extract from the configuration of the GRIB to NetCDF conversion.
+
+    Args:
+        config_path: Path of the configuration file (`gfs_to_nc.yml`).
+
+    Returns:
+        GRIB filter of each variable, and coordinates to drop.
+    """
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)['grib_extractor']
+    filters = {var['name']: var['filter'] for var in config['filters']}
+    return filters, config.get('merge_kwargs', {}).get('drop_vars', [])
+
+
+def read_step(path: T.Union[str, os.PathLike],
+              filters: T.Dict[str, T.Dict[str, T.Any]],
+              drop_vars: T.Sequence[str] = ()) -> xr.Dataset:
+    """
+    Read the GFS variables of a step file.
+
+    The messages of a GRIB file are indexed once, the index being shared by the filters (with the same keys), in a
+    temporary directory rather than next to the file.
+
+    Args:
+        path: Path of the GRIB file, or of a NetCDF file with the variables already extracted.
+        filters: GRIB filter of each variable, see ``read_grib_config``.
+        drop_vars: Coordinates to drop.
+
+    Returns:
+        Dataset of the variables found in the file, of dimensions (latitude, longitude) or
+        (valid_time, latitude, longitude).
+    """
+    if Path(path).suffix == '.nc':
+        with xr.open_dataset(path) as ds:
+            return ds[[name for name in filters if name in ds]].drop_vars(drop_vars, errors='ignore').load()
+
+    try:
+        import cfgrib  # noqa: F401
+    except ImportError as err:
+        raise ImportError(_GRIB_REQUIRED) from err
+
+    variables = {}
+    with tempfile.TemporaryDirectory() as index_dir:
+        # the index file name depends on a hash of the index keys, which include the keys of the filter
+        indexpath = os.path.join(index_dir, 'step.{short_hash}.idx')
+        for name, grib_filter in filters.items():
+            with xr.open_dataset(path, engine='cfgrib',
+                                 backend_kwargs={'filter_by_keys': grib_filter, 'indexpath': indexpath}) as ds:
+                if ds.data_vars:
+                    variables[name] = next(iter(ds.data_vars.values())).drop_vars(drop_vars, errors='ignore').load()
+    return xr.Dataset(variables)
+
+
+def step_time(path: T.Union[str, os.PathLike]) -> pd.Timestamp:
+    """
+    Valid time of a step file, decoded from the file: the step files are not sorted by their names, in which the
+    forecast step may not be zero-padded (e.g. `f100` before `f012`).
+
+    Args:
+        path: Path of the GRIB file, or of a NetCDF file with the variables already extracted.
+
+    Returns:
+        Valid time of the first message of a GRIB file, first valid time of a NetCDF file.
+    """
+    if Path(path).suffix == '.nc':
+        with xr.open_dataset(path) as ds:
+            return pd.Timestamp(ds['valid_time'].values.min())
+
+    try:
+        import eccodes
+    except ImportError as err:
+        raise ImportError(_GRIB_REQUIRED) from err
+
+    with open(path, 'rb') as file:
+        message = eccodes.codes_grib_new_from_file(file)
+        if message is None:
+            raise ValueError(f"{path} has no GRIB message")
+        try:
+            date, time = eccodes.codes_get(message, 'validityDate'), eccodes.codes_get(message, 'validityTime')
+        finally:
+            eccodes.codes_release(message)
+    return pd.to_datetime(f'{date:08d}{time:04d}', format='%Y%m%d%H%M')
+
+
+def iter_steps(steps: T.Iterable[xr.Dataset]) -> T.Iterator[xr.Dataset]:
+    """ Split datasets with a 'valid_time' dimension into single steps """
+    for ds in steps:
+        if 'valid_time' in ds.dims:
+            for n in range(ds.sizes['valid_time']):
+                yield ds.isel(valid_time=n)
+        else:
+            yield ds
+
+
+def aggregate_daily(steps: T.Iterable[xr.Dataset], days: int = FORECAST_DAYS) -> xr.Dataset:
+    """
+    Fold GFS steps into daily values, one step at a time. The result is the same as resampling all steps by day
+    (``preprocess._daily_resample``), but the accumulation is done in float64.
+
+    Args:
+        steps: GFS steps in chronological order, each with a scalar 'valid_time' coordinate and GFS variables of
+            dimensions (latitude, longitude), see ``read_step`` and ``iter_steps``.
+        days: Number of days to keep, from the day of the first step.
+
+    Returns:
+        Dataset of dimensions (valid_time, latitude, longitude), one variable per parameter of
+        ``preprocess.DAILY_METHODS`` available in the steps, flagged with an `aggregation` attribute.
+    """
+    # running sums (or extremes) of each day and parameter, and number of values of each day and GFS variable
+    totals: T.Dict[pd.Timestamp, T.Dict[str, np.ndarray]] = {}
+    counts: T.Dict[pd.Timestamp, T.Dict[str, np.ndarray]] = {}
+    # times of the steps waiting for the next value of each GFS variable
+    pending: T.Dict[str, T.List[pd.Timestamp]] = {}
+    templates: T.Dict[str, xr.DataArray] = {}
+    times: T.List[pd.Timestamp] = []
+
+    def fold(var: str, values: np.ndarray, time: pd.Timestamp) -> None:
+        day = time.normalize()
+        day_totals, day_counts = totals.setdefault(day, {}), counts.setdefault(day, {})
+        valid = ~np.isnan(values)
+        day_counts[var] = day_counts.get(var, 0) + valid
+        for par in [par for par in DAILY_METHODS if _gfs_par_name(par) == var]:
+            method = DAILY_METHODS[par]
+            if method in ('sum', 'mean'):
+                day_totals[par] = day_totals.get(par, 0.) + np.where(valid, values, 0.)
+            elif par not in day_totals:
+                day_totals[par] = values.astype('float64')
+            else:
+                day_totals[par] = getattr(np, f'f{method}')(day_totals[par], values)
+
+    for step in iter_steps(steps):
+        time = pd.Timestamp(step['valid_time'].values)
+        times.append(time)
+        for var in pending:
+            pending[var].append(time)
+        for name, data in step.data_vars.items():
+            var = str(name)
+            if var not in templates:
+                # first step with the variable, which also fills the previous steps
+                templates[var] = data
+                pending[var] = list(times)
+            values = data.values.astype('float64')
+            for pending_time in pending[var]:
+                fold(var, values, pending_time)
+            pending[var] = []
+
+    day_list = sorted(totals)[:days]
+    variables = {}
+    for par, method in DAILY_METHODS.items():
+        var = _gfs_par_name(par)
+        if var not in templates:
+            continue
+        template = templates[var]
+        daily = []
+        for day in day_list:
+            count = counts[day].get(var, np.zeros(template.shape, dtype=int))
+            total = totals[day].get(par, np.full(template.shape, np.nan))
+            if method == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    total = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+            daily.append(total.astype(template.dtype))
+        variables[par] = xr.DataArray(
+            np.stack(daily), dims=('valid_time',) + template.dims,
+            coords={'valid_time': pd.DatetimeIndex(day_list, name='valid_time'),
+                    **{name: coord for name, coord in template.coords.items() if name in template.dims}})
+
+    return xr.Dataset(variables, attrs={'aggregation': 'daily'})
+
+
+@click.command()
+@click.option("--config-file", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--input-dir", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--input-filename-template", default='*gfs*grib*', show_default=True)
+@click.option("--output-path", required=True, type=Path)
+@click.option("--profile-path", type=Path)
+def stream_gfs(config_file: T.Union[str, os.PathLike],
+               input_dir: T.Union[str, os.PathLike],
+               input_filename_template: str,
+               output_path: T.Union[str, os.PathLike],
+               profile_path: T.Optional[T.Union[str, os.PathLike]] = None):
+
+    filters, drop_vars = read_grib_config(config_file)
+    # the step files are sorted by valid time, then by name
+    paths = sorted(sorted(Path(input_dir).glob(input_filename_template)), key=step_time)
+    if not paths:
+        raise click.ClickException(f"No file matching {input_filename_template} in {input_dir}")
+
+    enable_profiling(profile_path is not None)
+    with profile('total', stage='gfs_stream'):
+        def steps() -> T.Iterator[xr.Dataset]:
+            for path in paths:
+                logger.info(f"Reading {path.name}")
+                with profile('read', station=path.name):
+                    step = read_step(path, filters, drop_vars)
+                yield step
+
+        daily = aggregate_daily(steps())
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        daily.to_netcdf(output_path)
+    if profile_path is not None:
+        write_profile(profile_path)
+
+    logger.opt(ansi=True).info(f'<green>Daily GFS data of {len(paths)} files written to {output_path}</green>')
@@ -0,0 +1,207 @@
+"""
+Nearest grid cell (i, j) of each station, for the gridded datasets used as input (GFS, ERA5-Land, TAMSAT).
+
+The station list and the grids hardly ever change, so the indices are computed once and saved on disk.
+The cached files are keyed on a hash of the grid coordinates and of the station list: they are rebuilt
+automatically as soon as one of them changes.
+The cache directory can be set with the `VIGICLIMM_CACHE_DIR` environment variable.
+
+The selection functions also accept data already extracted at the stations (see ``preprocess.extract_gfs_stations``),
+with a 'station' dimension instead of the grid: the stations are then looked up by their coordinates.
+"""
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import xarray as xr
+import typing as T
+
+from pathlib import Path
+from loguru import logger
+
+# indices already loaded in this process, by cache file
+_loaded_indices: T.Dict[str, T.Tuple[np.ndarray, np.ndarray]] = {}
+# nearest cell of every loaded station, by grid
+_loaded_points: T.Dict[str, T.Dict[T.Tuple[float, float], T.Tuple[int, int]]] = {}
+
+# coordinates of the stations in data extracted at the stations, as given in the station list
+STATION_COORDS = ['station_lat', 'station_lon']
+
+
+def default_cache_dir() -> Path:
+    """ Directory where the station indices are saved """
+    return Path(os.environ.get("VIGICLIMM_CACHE_DIR", Path.home() / ".cache" / "vigiclimm-indicators"))
+
+
+def grid_key(lat: np.ndarray, lon: np.ndarray) -> str:
+    """ Hash of the grid coordinates """
+    sha = hashlib.sha1()
+    for coord in (lat, lon):
+        sha.update(np.ascontiguousarray(coord, dtype='float64').tobytes())
+        sha.update(b'|')
+    return sha.hexdigest()[:16]
+
+
+def stations_key(station_list: T.List[T.Dict[str, T.Any]]) -> str:
+    """ Hash of the station list (names and coordinates) """
+    sha = hashlib.sha1()
+    for station in station_list:
+        sha.update(f"{station['station']}|{station['lat']!r}|{station['lon']!r}\n".encode())
+    return sha.hexdigest()[:16]
+
+
+def load_station_grid_index(lat: T.Union[np.ndarray, xr.DataArray],
+                            lon: T.Union[np.ndarray, xr.DataArray],
+                            station_list: T.List[T.Dict[str, T.Any]],
+                            cache_dir: T.Optional[T.Union[str, os.PathLike]] = None
+                            ) -> T.Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the indices of the nearest grid cell of every station, from the cache if available.
+
+    Args:
+        lat: Latitude coordinate of the grid
+        lon: Longitude coordinate of the grid
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+        cache_dir: Directory where the indices are saved, by default given by ``default_cache_dir()``
+
+    Returns:
+        Latitude and longitude indices (i, j) of the grid cell of each station.
+    """
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
+    gkey = grid_key(lat, lon)
+    key = f"{gkey}_{stations_key(station_list)}"
+    path = Path(cache_dir if cache_dir is not None else default_cache_dir()) / f"station_grid_index_{key}.npz"
+
+    if str(path) not in _loaded_indices:
+        if path.exists():
+            with np.load(path) as cached:
+                i, j = cached['i'], cached['j']
+        else:
+            logger.info(f"Building station grid index {key}")
+            i = _nearest(lat, [station['lat'] for station in station_list])
+            j = _nearest(lon, [station['lon'] for station in station_list])
+            try:
+                # write to a temporary file first, several processes may build the same index
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                with open(tmp_path, 'wb') as file:
+                    np.savez(file, i=i, j=j)
+                os.replace(tmp_path, path)
+            except OSError as err:
+                logger.warning(f"Station grid index could not be saved: {err}")
+        _loaded_indices[str(path)] = (i, j)
+        _loaded_points.setdefault(gkey, {}).update(
+            {(station['lat'], station['lon']): (int(i[n]), int(j[n])) for n, station in enumerate(station_list)})
+
+    return _loaded_indices[str(path)]
+
+
+def select_station(data: T.Union[xr.DataArray, xr.Dataset],
+                   station_lat: T.Union[int, float],
+                   station_lon: T.Union[int, float],
+                   lat_dim: str = 'latitude',
+                   lon_dim: str = 'longitude'
+                   ) -> T.Union[xr.DataArray, xr.Dataset]:
+    """
+    Select the nearest grid cell of a station. Same as a `sel(..., method='nearest')`, but uses the indices
+    of the stations loaded with ``load_station_grid_index`` if available.
+
+    Args:
+        data: Gridded data
+        station_lat: Latitude of the station
+        station_lon: Longitude of the station
+        lat_dim: Name of the latitude dimension
+        lon_dim: Name of the longitude dimension
+
+    Returns:
+        Data at the grid cell of the station.
+    """
+    if is_station_extract(data, lat_dim):
+        position = _extract_positions(data, [{'lat': station_lat, 'lon': station_lon}])[0]
+        return data.isel(station=position).drop_vars(['station'] + STATION_COORDS)
+
+    lat = data[lat_dim].values
+    lon = data[lon_dim].values
+    point = _loaded_points.get(grid_key(lat, lon), {}).get((station_lat, station_lon))
+    if point is None:
+        point = (int(_nearest(lat, [station_lat])[0]), int(_nearest(lon, [station_lon])[0]))
+    return data.isel({lat_dim: point[0], lon_dim: point[1]})
+
+
+def select_stations(data: T.Union[xr.DataArray, xr.Dataset],
+                    station_list: T.List[T.Dict[str, T.Any]],
+                    lat_dim: str = 'latitude',
+                    lon_dim: str = 'longitude',
+                    cache_dir: T.Optional[T.Union[str, os.PathLike]] = None
+                    ) -> T.Union[xr.DataArray, xr.Dataset]:
+    """
+    Select the nearest grid cell of all stations at once, along a new 'station' dimension.
+
+    Args:
+        data: Gridded data
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+        lat_dim: Name of the latitude dimension
+        lon_dim: Name of the longitude dimension
+        cache_dir: Directory where the indices are saved, by default given by ``default_cache_dir()``
+
+    Returns:
+        Data at the grid cells of the stations.
+    """
+    if is_station_extract(data, lat_dim):
+        return data.isel(station=_extract_positions(data, station_list)).drop_vars(STATION_COORDS).assign_coords(
+            station=[station['station'] for station in station_list])
+
+    i, j = station_indices(data[lat_dim].values, data[lon_dim].values, station_list, cache_dir)
+    coords = {'station': [station['station'] for station in station_list]}
+    if len(i):
+        # a block of the grid is read from a file much faster than scattered cells, rows or columns
+        data = data.isel({lat_dim: slice(i.min(), i.max() + 1), lon_dim: slice(j.min(), j.max() + 1)}).load()
+        i, j = i - i.min(), j - j.min()
+    return data.isel({lat_dim: xr.DataArray(i, dims='station', coords=coords),
+                      lon_dim: xr.DataArray(j, dims='station', coords=coords)})
+
+
+def station_indices(lat: T.Union[np.ndarray, xr.DataArray],
+                    lon: T.Union[np.ndarray, xr.DataArray],
+                    station_list: T.List[T.Dict[str, T.Any]],
+                    cache_dir: T.Optional[T.Union[str, os.PathLike]] = None
+                    ) -> T.Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the indices of the nearest grid cell of every station. Same as ``load_station_grid_index``, but
+    a subset of already loaded stations (e.g. a shard of the station list) does not build a new index.
+
+    Args:
+        lat: Latitude coordinate of the grid
+        lon: Longitude coordinate of the grid
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+        cache_dir: Directory where the indices are saved, by default given by ``default_cache_dir()``
+
+    Returns:
+        Latitude and longitude indices (i, j) of the grid cell of each station.
+    """
+    points = _loaded_points.get(grid_key(np.asarray(lat), np.asarray(lon)), {})
+    if station_list and all((station['lat'], station['lon']) in points for station in station_list):
+        i, j = zip(*(points[(station['lat'], station['lon'])] for station in station_list))
+        return np.array(i), np.array(j)
+    return load_station_grid_index(lat, lon, station_list, cache_dir)
+
+
+def is_station_extract(data: T.Union[xr.DataArray, xr.Dataset], lat_dim: str = 'latitude') -> bool:
+    """ Whether data was already extracted at the stations, instead of being gridded """
+    return 'station' in data.dims and lat_dim not in data.dims
+
+
+def _extract_positions(data: T.Union[xr.DataArray, xr.Dataset],
+                       station_list: T.List[T.Dict[str, T.Any]]) -> np.ndarray:
+    """ Positions of the stations along the 'station' dimension of data extracted at the stations """
+    positions = {point: n for n, point in enumerate(zip(*(data[coord].values.tolist() for coord in STATION_COORDS)))}
+    try:
+        return np.array([positions[(station['lat'], station['lon'])] for station in station_list], dtype=int)
+    except KeyError as err:
+        raise ValueError(f"No data extracted for the station at (lat, lon) = {err.args[0]}") from None
+
+
+def _nearest(coord: np.ndarray, values: T.Sequence[float]) -> np.ndarray:
+    """ Index of the nearest coordinate value, computed the same way as xarray `sel(..., method='nearest')` """
+    return pd.Index(coord).get_indexer(values, method='nearest')
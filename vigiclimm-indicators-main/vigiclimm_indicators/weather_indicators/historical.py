@@ -5,18 +5,29 @@ If there are not available, get precipitation from TAMSAT and temperature from E
 """
 
 import os
+import sys
+import numpy as np
 import pandas as pd
 import xarray as xr
 import typing as T
-import yaml
 import click
+from functools import partial
 from pathlib import Path
 from loguru import logger
 
 from vigiclimm_indicators.weather_indicators.degree_days import degree_days
-from vigiclimm_indicators.weather_indicators.utils import write_to_csv, setup_logger, consecutive_event_count
-from vigiclimm_indicators.weather_indicators.preprocess import preprocess_gfs
+from vigiclimm_indicators.weather_indicators.utils import (
+    write_to_csv, setup_logger, consecutive_event_count, run_sharded)
+from vigiclimm_indicators.weather_indicators.preprocess import (
+    preprocess_gfs, preprocess_gfs_stations, open_gfs, GFSInput)
 from vigiclimm_indicators.weather_indicators.daily_forecast import wet_days
+from vigiclimm_indicators.weather_indicators.grid_index import (
+    load_station_grid_index, is_station_extract, select_station, select_stations, station_indices)
+from vigiclimm_indicators.weather_indicators.profiling import profile, enable_profiling, write_profile
+from vigiclimm_indicators.weather_indicators.observations import Observations, read_observations, station_observations
+from vigiclimm_indicators.weather_indicators.history_cache import history_path, load_history, update_history
+from vigiclimm_indicators.weather_indicators.output_store import OUTPUT_FORMATS, stations_to_dataset, write_store
+from vigiclimm_indicators.weather_indicators.station_registry import load_station_list
 
 # loguru logger configuration
 setup_logger(verbose=1)
@@ -29,7 +40,11 @@ def get_historical_data(station: str,
                         obs_path: T.Union[str, os.PathLike],
                         era5land_path: T.Union[str, os.PathLike],
                         tamsat_path: T.Union[str, os.PathLike],
-                        gfs_path: T.Union[str, os.PathLike],
+                        gfs_path: GFSInput,
+                        era5land_daily: T.Optional[xr.DataArray] = None,
+                        tamsat_daily: T.Optional[xr.DataArray] = None,
+                        observations: T.Optional[Observations] = None,
+                        pseudo_obs: T.Optional[xr.DataArray] = None,
                         ) -> pd.Series:
     """
     This function retrieves daily historical mean temperature and precipitation for the current year.
@@ -44,35 +59,25 @@ def get_historical_data(station: str,
         obs_path: Directory where observation files are stored.
         era5land_path: Directory where ERA5-Land data are stored.
         tamsat_path: Directory where the TAMSAT data are stored.
+        era5land_daily: Daily mean temperature of several stations from ERA5-Land, see ``get_era5_land_stations``.
+        tamsat_daily: Daily rainfall of several stations from TAMSAT, see ``get_tamsat_stations``.
+        observations: Observations of several stations, see ``observations.read_observations``. By default, the
+            observation file of the station is read.
+        pseudo_obs: GFS pseudo-observations of several stations, see ``get_gfs_pseudo_obs_stations``.
     Returns:
         Historical daily mean temperature or rainfall data for the current year.
     """
-    # extract data for the current year only
-    year = pd.Timestamp.now().year
+    if observations is None:
+        observations = read_observations(obs_path, [station])
+    data = station_observations(observations, station, par)
 
-    try:
-        # Attempt to read data from obs files
-        df = pd.read_csv(
-            os.path.join(obs_path, f'{station}.csv'), index_col="time", converters={"time": pd.to_datetime})
-
-        if df is not None:
-            df = df[df.index.year == year]
-            if par not in df.columns:
-                raise ValueError(f"Parameter '{par}' not found in the obs file.")
-            data = df[par]
-            if df.empty:
-                df = None
-
-    except FileNotFoundError:
-        logger.info(f"CSV file for station {station} not found. Using ERA5_LAND and TAMSAT data instead")
-        df = None
-
-    if df is None:
+    if data is None:
         # No obs data, use instead reanalysis/rainfall estimaste
         if par == 'tmean':
-            data = get_era5_land_data(era5land_path, station_lat, station_lon)
+            data = get_era5_land_data(era5land_path, station_lat, station_lon, station, era5land_daily)
         elif par == 'tp':
-            data = get_tamsat_data(tamsat_path, gfs_path, station_lat, station_lon, data_filling=True)
+            data = get_tamsat_data(tamsat_path, gfs_path, station_lat, station_lon, data_filling=True,
+                                   station=station, tamsat_daily=tamsat_daily, pseudo_obs=pseudo_obs)
         else:
             raise ValueError(f"Parameter '{par}' not valid, must be either 'tp' or 'tmean'")
     return data
@@ -80,23 +85,95 @@ def get_historical_data(station: str,
 
 def get_era5_land_data(era5land_path: T.Union[str, os.PathLike],
                        station_lat: float,
-                       station_lon: float) -> pd.Series:
+                       station_lon: float,
+                       station: T.Optional[str] = None,
+                       era5land_daily: T.Optional[xr.DataArray] = None) -> pd.Series:
+    """
+    Daily mean temperature of a station from ERA5-Land.
+
+    Args:
+        era5land_path: Path of the ERA5-Land hourly file.
+        station_lat: Latitude of the station/location.
+        station_lon: Longitude of the station/location.
+        station: Name of the station/location.
+        era5land_daily: Daily mean temperature of several stations, already computed with ``get_era5_land_stations``.
+            The file is only read if the station is not in it.
+
+    Returns:
+        Daily mean temperature [°C].
+    """
+    if era5land_daily is not None and station in era5land_daily['station'].values:
+        return era5land_daily.sel(station=station).to_series()
 
-    ds = xr.open_dataset(era5land_path)
-    data = ds['t2m'].sel(latitude=station_lat, longitude=station_lon, method='nearest').round(1)
-    # resampling from hourly to daily values and convert to °C
-    data = data.resample(time='D').mean() - 273.15
-    return data.to_series()
+    station_list = [{'station': station, 'lat': station_lat, 'lon': station_lon}]
+    return get_era5_land_stations(era5land_path, station_list).isel(station=0).to_series()
+
+
+def get_era5_land_stations(era5land_path: T.Union[str, os.PathLike],
+                           station_list: T.List[T.Dict[str, T.Any]],
+                           start: T.Optional[T.Union[str, pd.Timestamp]] = None,
+                           chunk_days: int = 31) -> xr.DataArray:
+    """
+    Daily mean temperature of all stations from ERA5-Land, in a single pass over the hourly file.
+
+    The file is read lazily, block of `chunk_days` days after block, and only the part of the grid around the
+    stations: the memory used does not depend on the length of the file.
+
+    Args:
+        era5land_path: Path of the ERA5-Land hourly file.
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys).
+        start: First day to read, the whole file by default.
+        chunk_days: Number of days read at once.
+
+    Returns:
+        Daily mean temperature [°C] of dimensions (station, time).
+    """
+    with xr.open_dataset(era5land_path) as ds:
+        t2m = ds['t2m']
+        if start is not None:
+            t2m = t2m.sel(time=slice(pd.Timestamp(start), None))
+
+        i, j = station_indices(t2m.latitude, t2m.longitude, station_list)
+        # read the block of the grid around the stations only, scattered rows and columns are much slower to read
+        i0, j0 = (i.min(), j.min()) if len(i) else (0, 0)
+        rows, columns = slice(i0, i.max(initial=-1) + 1), slice(j0, j.max(initial=-1) + 1)
+        i, j = i - i0, j - j0
+
+        # blocks of whole days, so that each day is averaged at once
+        days = t2m['time'].values.astype('datetime64[D]')
+        first_steps = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        bounds = list(first_steps[::chunk_days]) + [len(days)]
+
+        blocks = []
+        for block_start, block_end in zip(bounds[:-1], bounds[1:]):
+            block = t2m.isel(time=slice(block_start, block_end), latitude=rows, longitude=columns).values
+            data = xr.DataArray(block[:, i, j].T, dims=('station', 'time'),
+                                coords={'station': [station['station'] for station in station_list],
+                                        'time': t2m['time'].values[block_start:block_end]})
+            # resampling from hourly to daily values and convert to °C
+            blocks.append(data.round(1).resample(time='D').mean() - 273.15)
+
+    if not blocks:
+        return xr.DataArray(np.empty((len(station_list), 0), dtype=t2m.dtype), dims=('station', 'time'),
+                            coords={'station': [station['station'] for station in station_list],
+                                    'time': pd.DatetimeIndex([], name='time')})
+    return xr.concat(blocks, dim='time')
 
 
 def get_tamsat_data(tamsat_path: T.Union[str, os.PathLike],
-                    gfs_path: T.Union[str, os.PathLike],
+                    gfs_path: GFSInput,
                     station_lat: T.Union[int, float],
                     station_lon: T.Union[int, float],
-                    data_filling: bool = True) -> pd.Series:
+                    data_filling: bool = True,
+                    station: T.Optional[str] = None,
+                    tamsat_daily: T.Optional[xr.DataArray] = None,
+                    pseudo_obs: T.Optional[xr.DataArray] = None) -> pd.Series:
 
-    ds = xr.open_dataset(tamsat_path)
-    data = ds['rfe'].sel(lat=station_lat, lon=station_lon, method='nearest').round(1)
+    if tamsat_daily is not None and station in tamsat_daily['station'].values:
+        data = tamsat_daily.sel(station=station, drop=True)
+    else:
+        ds = xr.open_dataset(tamsat_path)
+        data = select_station(ds['rfe'], station_lat, station_lon, lat_dim='lat', lon_dim='lon').round(1)
 
     if data_filling:
         logger.info('Filling missing dates with GFS pseudo observations')
@@ -110,15 +187,40 @@ def get_tamsat_data(tamsat_path: T.Union[str, os.PathLike],
         else:
             logger.warning(f"No TAMSAT data after {last_time.date()}, more than two dates to fill")
         # fill missing dates (last D-1 and D-2 with GFS pseudo_obs)
-        pseudo_obs = get_gfs_pseudo_obs(gfs_path, station_lat, station_lon)
-        data_filled = xr.concat([data, pseudo_obs], dim='time')
+        if pseudo_obs is not None and station in pseudo_obs['station'].values:
+            station_pseudo_obs = pseudo_obs.sel(station=station, drop=True)
+        else:
+            station_pseudo_obs = get_gfs_pseudo_obs(gfs_path, station_lat, station_lon)
+        data_filled = xr.concat([data, station_pseudo_obs], dim='time')
         return data_filled.to_series()
 
     else:
         return data.to_series()
 
 
-def get_gfs_pseudo_obs(gfs_path: T.Union[str, os.PathLike],
+def get_tamsat_stations(tamsat_path: T.Union[str, os.PathLike],
+                        station_list: T.List[T.Dict[str, T.Any]],
+                        start: T.Optional[T.Union[str, pd.Timestamp]] = None) -> xr.DataArray:
+    """
+    Daily rainfall estimates of all stations from TAMSAT, in a single selection.
+
+    Args:
+        tamsat_path: Path of the TAMSAT file.
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys).
+        start: First day to read, the whole file by default.
+
+    Returns:
+        Daily rainfall [mm] of dimensions (station, time).
+    """
+    with xr.open_dataset(tamsat_path) as ds:
+        rfe = ds['rfe']
+        if start is not None:
+            rfe = rfe.sel(time=slice(pd.Timestamp(start), None))
+        data = select_stations(rfe, station_list, lat_dim='lat', lon_dim='lon').load()
+    return data.drop_vars(['lat', 'lon']).transpose('station', 'time').round(1)
+
+
+def get_gfs_pseudo_obs(gfs_path: GFSInput,
                        station_lat: T.Union[int, float],
                        station_lon: T.Union[int, float]
                        ) -> xr.DataArray:
@@ -137,33 +239,230 @@ def get_gfs_pseudo_obs(gfs_path: T.Union[str, os.PathLike],
     return ds_first_two_days
 
 
+def get_gfs_pseudo_obs_stations(gfs_path: GFSInput,
+                                station_list: T.List[T.Dict[str, T.Any]]
+                                ) -> xr.DataArray:
+    """
+    GFS pseudo-observations of all stations at once, see ``get_gfs_pseudo_obs``.
+
+    Args:
+        gfs_path: Path of the GFS file, or GFS dataset already opened with ``open_gfs``.
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys).
+
+    Returns:
+        Daily rainfall of the first two forecast days, of dimensions (station, time).
+    """
+    return preprocess_gfs_stations(gfs_path, 'tp', station_list).isel(time=[0, 1])
+
+
+def compute_historical_indicators(tmean: T.Union[pd.Series, xr.DataArray],
+                                  tp: T.Union[pd.Series, xr.DataArray]) -> T.Dict[str, pd.Series]:
+    """
+    Compute historical indicators for a location: degree days, rainfall, wet/dry days and consecutive days count.
+
+    Args:
+        tmean: Historical daily mean temperature for the current year [°C].
+        tp: Historical daily rainfall for the current year [mm].
+
+    Returns:
+        Series of each indicator.
+    """
+    wet = wet_days(tp)
+    dry = ~wet
+    return {
+        'degree_days': degree_days(base=18, tmean=tmean, index="hot").round(1),
+        'tp': tp,
+        'wet_days': wet,
+        'consecutive_wet_days': consecutive_event_count(wet),
+        'dry_days': dry,
+        'consecutive_dry_days': consecutive_event_count(dry),
+    }
+
+
+def compute_station(station: T.Dict[str, T.Any],
+                    obs_path: T.Union[str, os.PathLike],
+                    era5land_path: T.Union[str, os.PathLike],
+                    tamsat_path: T.Union[str, os.PathLike],
+                    gfs_path: GFSInput,
+                    era5land_daily: T.Optional[xr.DataArray] = None,
+                    tamsat_daily: T.Optional[xr.DataArray] = None,
+                    observations: T.Optional[Observations] = None,
+                    pseudo_obs: T.Optional[xr.DataArray] = None) -> T.Dict[str, pd.Series]:
+    """
+    Get the historical mean temperature and rainfall of a station and compute its historical indicators.
+
+    Args:
+        station: Station/location, as read from the stations YAML file ('station', 'lat' and 'lon' keys).
+        obs_path: Directory where observation files are stored.
+        era5land_path: Directory where ERA5-Land data are stored.
+        tamsat_path: Directory where the TAMSAT data are stored.
+        gfs_path: Path of the GFS file, or GFS dataset already opened with ``open_gfs``.
+        era5land_daily: Daily mean temperature of several stations from ERA5-Land, see ``get_era5_land_stations``.
+        tamsat_daily: Daily rainfall of several stations from TAMSAT, see ``get_tamsat_stations``.
+        observations: Observations of several stations, see ``observations.read_observations``. By default, the
+            observation file of the station is read.
+        pseudo_obs: GFS pseudo-observations of several stations, see ``get_gfs_pseudo_obs_stations``.
+
+    Returns:
+        Series of each indicator.
+    """
+    if observations is None:
+        observations = read_observations(obs_path, [station['station']])
+    with profile('read', 'tmean', station['station']):
+        tmean = get_historical_data(station['station'], station['lat'], station['lon'], 'tmean',
+                                    obs_path, era5land_path, tamsat_path, gfs_path, era5land_daily=era5land_daily,
+                                    observations=observations)
+    with profile('read', 'tp', station['station']):
+        tp = get_historical_data(station['station'], station['lat'], station['lon'], 'tp',
+                                 obs_path, era5land_path, tamsat_path, gfs_path, tamsat_daily=tamsat_daily,
+                                 observations=observations, pseudo_obs=pseudo_obs)
+    with profile('compute', station=station['station']):
+        return compute_historical_indicators(tmean, tp)
+
+
 def compute_and_write(tmean: T.Union[pd.Series, xr.DataArray],
                       tp: T.Union[pd.Series, xr.DataArray],
                       outdir: T.Union[str, os.PathLike],
                       station_name: str):
 
-    # compute and write degree days
-    df_dd = degree_days(base=18, tmean=tmean, index="hot").round(1)
-    logger.info(f"Writing historical degree days for {station_name}")
-    write_to_csv(df_dd, outdir, station_name, 'degree_days', period='historical')
+    write_station(compute_historical_indicators(tmean, tp), outdir, station_name)
 
-    # write historical tp, wet/dry days + consecutive days count
-    logger.info(f"Writing historical rainfall for {station_name}")
-    write_to_csv(tp, outdir, station_name, 'tp', period='historical')
 
-    logger.info(f"Writing historical wet_days for {station_name}")
-    wet = wet_days(tp)
-    write_to_csv(wet, outdir, station_name, 'wet_days', period='historical')
+def write_station(indicators: T.Dict[str, pd.Series],
+                  outdir: T.Union[str, os.PathLike],
+                  station_name: str):
 
-    consecutive_wet_days = consecutive_event_count(wet)
-    write_to_csv(consecutive_wet_days, outdir, station_name, 'consecutive_wet_days', period='historical')
+    for par, df in indicators.items():
+        logger.info(f"Writing historical {par} for {station_name}")
+        write_to_csv(df, outdir, station_name, par, period='historical')
 
-    logger.info(f"Writing historical dry_days for {station_name}")
-    dry = ~wet
-    write_to_csv(dry, outdir, station_name, 'dry_days', period='historical')
 
-    consecutive_dry_days = consecutive_event_count(dry)
-    write_to_csv(consecutive_dry_days, outdir, station_name, 'consecutive_dry_days', period='historical')
+@profile('read', 'era5land')
+def get_era5_land_shard(era5land_path: T.Union[str, os.PathLike],
+                        station_list: T.List[T.Dict[str, T.Any]],
+                        observations: Observations) -> T.Optional[xr.DataArray]:
+    """
+    Daily mean temperature from ERA5-Land of the stations without observations, all at once.
+    Returns None if it fails, each station then reads the file on its own.
+    """
+    stations = _without_observations(station_list, observations)
+    if not stations:
+        return None
+    try:
+        return get_era5_land_stations(era5land_path, stations)
+    except Exception:
+        logger.exception("ERA5-Land data could not be read for all stations at once")
+        return None
+
+
+@profile('read', 'gfs_pseudo_obs')
+def get_gfs_pseudo_obs_shard(gfs_path: GFSInput,
+                             station_list: T.List[T.Dict[str, T.Any]],
+                             observations: Observations) -> T.Optional[xr.DataArray]:
+    """
+    GFS pseudo-observations of the stations without observations, all at once.
+    Returns None if it fails, each station then extracts its own pseudo-observations.
+    """
+    stations = _without_observations(station_list, observations)
+    if not stations:
+        return None
+    try:
+        return get_gfs_pseudo_obs_stations(gfs_path, stations)
+    except Exception:
+        logger.exception("GFS pseudo-observations could not be extracted for all stations at once")
+        return None
+
+
+def _without_observations(station_list: T.List[T.Dict[str, T.Any]],
+                          observations: Observations) -> T.List[T.Dict[str, T.Any]]:
+    """ Stations falling back to ERA5-Land and TAMSAT, without observations for the current year """
+    return [station for station in station_list if station['station'] not in observations
+            or (isinstance(observations[station['station']], pd.DataFrame)
+                and observations[station['station']].empty)]
+
+
+def update_history_cache(station_list: T.List[T.Dict[str, T.Any]],
+                         era5land_path: T.Union[str, os.PathLike],
+                         tamsat_path: T.Union[str, os.PathLike]) -> T.Dict[str, Path]:
+    """
+    Update the cached daily ERA5-Land mean temperature and TAMSAT rainfall of all stations with the new days
+    of the input files (see ``history_cache``).
+
+    Args:
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys).
+        era5land_path: Path of the ERA5-Land hourly file.
+        tamsat_path: Path of the TAMSAT file.
+
+    Returns:
+        Path of the cached file of each source.
+    """
+    paths = {}
+    for source, path, lat_dim, lon_dim, fetch in [
+            ('era5land', era5land_path, 'latitude', 'longitude', get_era5_land_stations),
+            ('tamsat', tamsat_path, 'lat', 'lon', get_tamsat_stations)]:
+        with xr.open_dataset(path) as ds:
+            paths[source] = history_path(source, path, ds[lat_dim], ds[lon_dim], station_list)
+        with profile('history_cache', source):
+            update_history(paths[source], station_list, partial(fetch, path))
+    return paths
+
+
+def _open_inputs(station_list: T.List[T.Dict[str, T.Any]],
+                 era5land_path: T.Union[str, os.PathLike],
+                 tamsat_path: T.Union[str, os.PathLike],
+                 gfs_path: T.Union[str, os.PathLike],
+                 history_paths: T.Optional[T.Dict[str, Path]] = None) -> T.Dict[str, T.Any]:
+    """ Open the GFS file, the cached daily history and load the nearest grid cell of all stations, once per process """
+    gfs = open_gfs(gfs_path)
+
+    if not is_station_extract(gfs):
+        load_station_grid_index(gfs.latitude, gfs.longitude, station_list)
+    with xr.open_dataset(era5land_path) as ds:
+        load_station_grid_index(ds.latitude, ds.longitude, station_list)
+    with xr.open_dataset(tamsat_path) as ds:
+        load_station_grid_index(ds.lat, ds.lon, station_list)
+
+    inputs = {'gfs': gfs}
+    if history_paths is not None:
+        inputs['era5land_daily'] = load_history(history_paths['era5land'])
+        inputs['tamsat_daily'] = load_history(history_paths['tamsat'])
+    return inputs
+
+
+def _compute_and_write_stations(station_list: T.List[T.Dict[str, T.Any]],
+                                obs_path: T.Union[str, os.PathLike],
+                                era5land_path: T.Union[str, os.PathLike],
+                                tamsat_path: T.Union[str, os.PathLike],
+                                outdir: T.Union[str, os.PathLike],
+                                output_format: str,
+                                gfs: xr.Dataset,
+                                era5land_daily: T.Optional[xr.DataArray] = None,
+                                tamsat_daily: T.Optional[xr.DataArray] = None
+                                ) -> T.Tuple[T.List[str], T.Dict[str, T.Dict[str, pd.Series]]]:
+    """
+    Compute historical indicators for a list of stations, and write them to CSV or return them to be written to
+    the consolidated store. Returns the stations that failed.
+    """
+    observations = read_observations(obs_path, [station['station'] for station in station_list])
+    if era5land_daily is None:
+        era5land_daily = get_era5_land_shard(era5land_path, station_list, observations)
+    pseudo_obs = get_gfs_pseudo_obs_shard(gfs, station_list, observations)
+
+    failed = []
+    indicators = {}
+    for station in station_list:
+        logger.info(f'Writing historical indicators for {station}')
+        try:
+            station_indicators = compute_station(station, obs_path, era5land_path, tamsat_path, gfs,
+                                                 era5land_daily, tamsat_daily, observations, pseudo_obs)
+            if output_format == 'csv':
+                write_station(station_indicators, outdir, station['station'])
+            else:
+                indicators[station['station']] = station_indicators
+        except Exception:
+            logger.exception(f"Historical indicators failed for {station['station']}")
+            failed.append(station['station'])
+    return failed, indicators
 
 
 @click.command()
@@ -173,25 +472,44 @@ def compute_and_write(tmean: T.Union[pd.Series, xr.DataArray],
 @click.option("--tamsat-path", required=True, type=click.Path(exists=True, path_type=Path))
 @click.option("--gfs-path", required=True, type=click.Path(exists=True, path_type=Path))
 @click.option("--outdir", required=True, type=Path)
+@click.option("--workers", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option("--output-format", default='csv', show_default=True, type=click.Choice(OUTPUT_FORMATS))
+@click.option("--history-cache/--no-history-cache", default=False, show_default=True)
+@click.option("--profile-path", type=Path)
 def run_all_stations(yml_path: T.Union[str, os.PathLike],
                      obs_path: T.Union[str, os.PathLike],
                      era5land_path: T.Union[str, os.PathLike],
                      tamsat_path: T.Union[str, os.PathLike],
                      gfs_path: T.Union[str, os.PathLike],
-                     outdir: T.Union[str, os.PathLike]):
-
-    with open(yml_path, 'r') as file:
-        station_list = yaml.safe_load(file)
-
-        for station in station_list:
-            logger.info(f'Writing historical indicators for {station}')
-            compute_and_write(
-                get_historical_data(
-                    station['station'], station['lat'], station['lon'], 'tmean',
-                    obs_path, era5land_path, tamsat_path, gfs_path),
-                get_historical_data(
-                    station['station'], station['lat'], station['lon'], 'tp',
-                    obs_path, era5land_path, tamsat_path, gfs_path),
-                outdir,
-                station['station'])
-    logger.opt(ansi=True).info('<green>All indicators written successfully</green>')
+                     outdir: T.Union[str, os.PathLike],
+                     workers: int = 1,
+                     output_format: str = 'csv',
+                     history_cache: bool = False,
+                     profile_path: T.Optional[T.Union[str, os.PathLike]] = None):
+
+    station_list = load_station_list(yml_path)
+
+    enable_profiling(profile_path is not None)
+    with profile('total', stage='historical'):
+        # only the new days of ERA5-Land and TAMSAT are read, once for all stations
+        history_paths = update_history_cache(station_list, era5land_path, tamsat_path) if history_cache else None
+
+        failed, outputs = run_sharded(partial(_compute_and_write_stations, obs_path=obs_path,
+                                              era5land_path=era5land_path, tamsat_path=tamsat_path, outdir=outdir,
+                                              output_format=output_format),
+                                      station_list, workers, _open_inputs, station_list, era5land_path, tamsat_path,
+                                      gfs_path, history_paths)
+
+        if output_format != 'csv':
+            indicators = {station: data for output in outputs for station, data in output.items()}
+            if indicators:
+                write_store(stations_to_dataset(indicators, period='historical'), outdir, 'historical', output_format)
+    if profile_path is not None:
+        write_profile(profile_path)
+
+    if failed:
+        logger.error(f"Historical indicators not written for stations: {failed}")
+        # non-zero exit status, so that a partial run can be detected
+        sys.exit(1)
+    else:
+        logger.opt(ansi=True).info('<green>All indicators written successfully</green>')
@@ -0,0 +1,133 @@
+"""
+Incremental on-disk cache of the daily historical data of the stations (ERA5-Land mean temperature, TAMSAT rainfall).
+
+The daily series of the current year only grow by a day or two between two runs: the cached days are kept and
+only the last days are read from the input files. The cached days of this overlap window (`overlap_days` before the
+last cached day, which is always read again, in case it was incomplete) are compared with the input file: if they
+differ, the input file was reprocessed and the whole history is read again. Changes older than the overlap window
+are not detected, hence the cache is not used by default (`--history-cache` option of the commands). The GFS
+pseudo-observations used to fill the last TAMSAT days are never cached, they are replaced by TAMSAT data as soon as
+they are available.
+
+The cached files are keyed on the source, the input file path, the year, the input grid and the station list, in the
+same directory as the station grid indices (see ``grid_index.default_cache_dir``).
+"""
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import typing as T
+
+from pathlib import Path
+from loguru import logger
+
+from vigiclimm_indicators.weather_indicators.grid_index import default_cache_dir, grid_key, stations_key
+
+HISTORY_SOURCES = ['era5land', 'tamsat']
+OVERLAP_DAYS = 7
+
+
+def history_path(source: str,
+                 input_path: T.Union[str, os.PathLike],
+                 lat: T.Union[np.ndarray, xr.DataArray],
+                 lon: T.Union[np.ndarray, xr.DataArray],
+                 station_list: T.List[T.Dict[str, T.Any]],
+                 year: T.Optional[int] = None,
+                 cache_dir: T.Optional[T.Union[str, os.PathLike]] = None) -> Path:
+    """
+    Path of the cached daily data of a source.
+
+    Args:
+        source: Either `era5land` or `tamsat`.
+        input_path: Path of the input file of the source
+        lat: Latitude coordinate of the input grid
+        lon: Longitude coordinate of the input grid
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+        year: Year of the data, the current year by default
+        cache_dir: Cache directory, by default given by ``default_cache_dir()``
+    """
+    if source not in HISTORY_SOURCES:
+        raise ValueError(f"Source must be one of {HISTORY_SOURCES}")
+    year = year if year is not None else pd.Timestamp.now().year
+    input_key = hashlib.sha1(str(Path(input_path).resolve()).encode()).hexdigest()[:16]
+    key = f"{input_key}_{grid_key(np.asarray(lat), np.asarray(lon))}_{stations_key(station_list)}"
+    return Path(cache_dir if cache_dir is not None else default_cache_dir()) / f"history_{source}_{year}_{key}.nc"
+
+
+def load_history(path: T.Union[str, os.PathLike]) -> T.Optional[xr.DataArray]:
+    """
+    Read cached daily data.
+
+    Args:
+        path: Path of the cached file, see ``history_path``.
+
+    Returns:
+        Daily data of dimensions (station, time), None if not cached yet.
+    """
+    if not Path(path).exists():
+        return None
+    with xr.open_dataarray(path) as data:
+        return data.load()
+
+
+def save_history(data: xr.DataArray, path: T.Union[str, os.PathLike]) -> None:
+    """
+    Write daily data to the cache.
+
+    Args:
+        data: Daily data of dimensions (station, time).
+        path: Path of the cached file, see ``history_path``.
+    """
+    path = Path(path)
+    try:
+        # write to a temporary file first, so that an interrupted run does not leave a corrupted cache
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        data.to_netcdf(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as err:
+        logger.warning(f"Daily history could not be saved: {err}")
+
+
+def _same_days(cached: xr.DataArray, new_days: xr.DataArray) -> bool:
+    """ Whether the cached days are the same as the days read again from the input file """
+    return (np.array_equal(cached['time'].values, new_days['time'].values)
+            and np.array_equal(cached.values, new_days.values, equal_nan=True))
+
+
+def update_history(path: T.Union[str, os.PathLike],
+                   station_list: T.List[T.Dict[str, T.Any]],
+                   fetch: T.Callable[[T.List[T.Dict[str, T.Any]], T.Optional[pd.Timestamp]], xr.DataArray],
+                   overlap_days: int = OVERLAP_DAYS) -> xr.DataArray:
+    """
+    Update cached daily data with the days since the last cached day, and save it.
+
+    Args:
+        path: Path of the cached file, see ``history_path``.
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+        fetch: Function called as `fetch(station_list, start)`, reading the daily data of the stations from the
+            input file, from the day `start` (the whole file if None).
+        overlap_days: Number of cached days, before the last one, read again and compared with the input file.
+
+    Returns:
+        Daily data of dimensions (station, time).
+    """
+    cached = load_history(path)
+    if cached is None or cached.sizes['time'] == 0:
+        logger.info(f"Building daily history {Path(path).name}")
+        data = fetch(station_list, None)
+    else:
+        # the last cached day is read again, it may have been incomplete
+        last_day = pd.Timestamp(cached['time'].values[-1])
+        start = max(last_day - pd.Timedelta(days=overlap_days), pd.Timestamp(cached['time'].values[0]))
+        logger.info(f"Updating daily history {Path(path).name} from {last_day.date()}")
+        new_days = fetch(station_list, start)
+        overlap = slice(start, last_day - pd.Timedelta(days=1))
+        if _same_days(cached.sel(time=overlap), new_days.sel(time=overlap)):
+            data = xr.concat([cached.sel(time=slice(None, start - pd.Timedelta(days=1))), new_days], dim='time')
+        else:
+            logger.warning(f"Cached days of {Path(path).name} differ from the input file, rebuilding the history")
+            data = fetch(station_list, None)
+    save_history(data, path)
+    return data
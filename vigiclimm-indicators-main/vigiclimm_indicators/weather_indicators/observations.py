@@ -0,0 +1,84 @@
+"""
+Observations of the synoptic stations, one CSV file per station (`<station>.csv`, with a 'time' column and one column
+per parameter, e.g. 'tmean' and 'tp').
+
+The observation directory is scanned once and the files of the stations are read once, for all parameters: whether
+a station has observations, and for which parameters, is then a dictionary lookup.
+"""
+import os
+import pandas as pd
+import typing as T
+
+from pathlib import Path
+from loguru import logger
+
+from vigiclimm_indicators.weather_indicators.profiling import profile
+
+# observations of each station, or the error raised while reading its file
+Observations = T.Dict[str, T.Union[pd.DataFrame, Exception]]
+
+
+@profile('read', 'obs')
+def read_observations(obs_path: T.Union[str, os.PathLike],
+                      stations: T.Optional[T.Iterable[str]] = None,
+                      year: T.Optional[int] = None) -> Observations:
+    """
+    Read the observation files of several stations.
+
+    Args:
+        obs_path: Directory where observation files are stored.
+        stations: Names of the stations to read, all the files of the directory by default.
+        year: Only keep the observations of this year, the current year by default.
+
+    Returns:
+        Observations of each station with an observation file, for the given year. Files which could not be read are
+        kept with their error, which is raised again by ``station_observations``.
+    """
+    year = year if year is not None else pd.Timestamp.now().year
+    files = {path.stem: path for path in Path(obs_path).glob('*.csv')}
+    if stations is not None:
+        files = {station: files[station] for station in stations if station in files}
+
+    observations: Observations = {}
+    for station, path in files.items():
+        try:
+            df = pd.read_csv(path, dtype={'time': str})
+            df.index = _parse_time(df.pop('time'))
+            observations[station] = df[df.index.year == year]
+        except Exception as err:
+            observations[station] = err
+    return observations
+
+
+def station_observations(observations: Observations, station: str, par: str) -> T.Optional[pd.Series]:
+    """
+    Get the observations of a station for a parameter.
+
+    Args:
+        observations: Observations of the stations, see ``read_observations``.
+        station: Name of the station/location.
+        par: Name of the parameter.
+
+    Returns:
+        Daily observations, None if the station has no observation file or no observation for the year.
+    """
+    df = observations.get(station)
+    if df is None:
+        logger.info(f"CSV file for station {station} not found. Using ERA5_LAND and TAMSAT data instead")
+        return None
+    if isinstance(df, Exception):
+        raise df
+    if par not in df.columns:
+        raise ValueError(f"Parameter '{par}' not found in the obs file.")
+    if df.empty:
+        return None
+    return df[par]
+
+
+def _parse_time(time: pd.Series) -> pd.DatetimeIndex:
+    """ Parse the dates of an observation file, element by element only if they do not share the same format """
+    try:
+        parsed = pd.to_datetime(time)
+    except ValueError:
+        parsed = pd.to_datetime(time, format='mixed')
+    return pd.DatetimeIndex(parsed, name='time')
@@ -0,0 +1,353 @@
+"""
+Consolidated output store.
+
+Instead of one CSV file per station and parameter, all stations and parameters of a product (forecast, historical
+or agro indicators) are written in a single file per run, with (station, time) dimensions, either in NetCDF or in
+Parquet format. The legacy CSV files can still be exported on demand with the `vi-export-csv` command.
+
+Series which do not cover the whole time dimension of the store (e.g. 'sum_tp', or historical data of different
+lengths) are padded with NaN. They are flagged with a `padded` attribute, so that the padding is removed on export.
+The series of each station (see ``stations_to_dataset``) may also have NaN values of their own: the rows of the
+original series are then recorded in a boolean `<name>_rows` coordinate, so that exactly these rows are exported.
+
+The forecast can also be written as a fixed-layout binary array (`forecast.bin`), which the agro stage memory-maps
+instead of parsing files: a JSON header (names of the stations, parameters and days) followed by the values of
+dimensions (station, parameter, day), in float32 unless a float64 parameter cannot be stored in float32.
+"""
+import os
+import json
+import click
+import numpy as np
+import pandas as pd
+import xarray as xr
+import typing as T
+
+from pathlib import Path
+from loguru import logger
+
+from vigiclimm_indicators.weather_indicators.utils import write_to_csv
+
+OUTPUT_FORMATS = ['csv', 'netcdf', 'parquet']
+_EXTENSIONS = {'netcdf': 'nc', 'parquet': 'parquet'}
+_ARRAY_MAGIC = b'VIGICLIMM-ARRAY1'
+# offset of the values in the array files [bytes]
+_ARRAY_ALIGNMENT = 64
+# float32 values converted by rounding (see ``float32_to_csv_float64``): below 2**23, as the spacing of the float32
+# values is then less than 1, and with up to 8 decimals
+_FLOAT32_ROUNDING_LIMIT = 2 ** 23
+_FLOAT32_DECIMALS = 8
+
+
+def product_path(outdir: T.Union[str, os.PathLike], product: str, output_format: str) -> Path:
+    """
+    Path of the consolidated file of a product.
+
+    Args:
+        outdir: Output directory.
+        product: Name of the product, either `forecast`, `historical` or `agro`.
+        output_format: Either `netcdf` or `parquet`.
+    """
+    if output_format not in _EXTENSIONS:
+        raise ValueError(f"Output format must be one of {list(_EXTENSIONS)}")
+    return Path(outdir) / f'{product}.{_EXTENSIONS[output_format]}'
+
+
+def blocks_to_dataset(blocks: T.Dict[str, xr.DataArray], period: str = 'forecast') -> xr.Dataset:
+    """
+    Gather (station, time) blocks of several parameters in a single Dataset.
+
+    Args:
+        blocks: Dictionary of DataArrays of dimensions (station, time), one for each parameter/indicator.
+        period: Specify the nature of data, either `historical` or `forecast`.
+
+    Returns:
+        Dataset of dimensions (station, time), blocks not covering the whole time dimension are padded with NaN.
+    """
+    time = pd.DatetimeIndex(sorted(set().union(*(block['time'].values for block in blocks.values()))), name='time')
+
+    variables = {}
+    for name, block in blocks.items():
+        block = block.transpose('station', 'time').drop_vars(
+            [coord for coord in block.coords if coord not in ('station', 'time', 'latitude', 'longitude')])
+        if block.sizes['time'] != len(time):
+            dtype = str(block.dtype)
+            if block.dtype.kind in 'biu':
+                block = block.astype('float64')
+            block = block.reindex(time=time)
+            block.attrs.update({'padded': 1, 'legacy_dtype': dtype})
+        variables[name] = block
+
+    return xr.Dataset(variables, attrs={'period': period})
+
+
+def stations_to_dataset(data: T.Dict[str, T.Dict[str, pd.Series]], period: str = 'forecast') -> xr.Dataset:
+    """
+    Gather the series of several stations and parameters in a single Dataset.
+
+    Args:
+        data: Series of each station (first key) and parameter (second key).
+        period: Specify the nature of data, either `historical` or `forecast`.
+
+    Returns:
+        Dataset of dimensions (station, time), series not covering the whole time dimension are padded with NaN.
+    """
+    stations = list(data)
+    params = list(dict.fromkeys(par for station_data in data.values() for par in station_data))
+    time = pd.DatetimeIndex(
+        sorted(set().union(*(series.index for station_data in data.values() for series in station_data.values()))),
+        name='time')
+
+    variables = {}
+    for par in params:
+        series = {station: data[station][par] for station in stations if par in data[station]}
+        dtype = np.result_type(*[values.dtype for values in series.values()])
+        if dtype == np.float64:
+            # e.g. float32 reanalysis and float64 observations: the float32 series are converted to the values of
+            # their CSV files, which are written back the same way in float64
+            series = {station: pd.Series(float32_to_csv_float64(values.to_numpy()), index=values.index)
+                      for station, values in series.items()}
+        df = pd.DataFrame(series).reindex(index=time, columns=stations)
+        rows = pd.DataFrame({station: pd.Series(True, index=values.index) for station, values in series.items()}
+                            ).reindex(index=time, columns=stations).notna().to_numpy().T
+        attrs = {}
+        coords = {'station': stations, 'time': time}
+        if not rows.all():
+            attrs = {'padded': 1, 'legacy_dtype': str(dtype)}
+            coords[f'{par}_rows'] = (('station', 'time'), rows)
+            if dtype.kind in 'biuO':
+                df = df.astype('float64')
+        else:
+            df = df.astype(dtype)
+        variables[par] = xr.DataArray(df.to_numpy().T, dims=('station', 'time'), coords=coords, attrs=attrs)
+
+    return xr.Dataset(variables, attrs={'period': period})
+
+
+def write_store(ds: xr.Dataset, outdir: T.Union[str, os.PathLike], product: str, output_format: str) -> Path:
+    """
+    Write a Dataset of dimensions (station, time) to the consolidated file of a product.
+
+    Args:
+        ds: Dataset of dimensions (station, time), see ``blocks_to_dataset`` and ``stations_to_dataset``.
+        outdir: Output directory.
+        product: Name of the product, either `forecast`, `historical` or `agro`.
+        output_format: Either `netcdf` or `parquet`.
+
+    Returns:
+        Path of the written file.
+    """
+    path = product_path(outdir, product, output_format)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    logger.info(f"Writing {product} store to {path}")
+    if output_format == 'netcdf':
+        ds.to_netcdf(path)
+    else:
+        # station coordinates would be read back as (station, time) variables
+        df = ds.drop_vars(['latitude', 'longitude'], errors='ignore').to_dataframe()
+        df.attrs = {'dataset_attrs': json.dumps(ds.attrs),
+                    'variable_attrs': json.dumps({name: ds[name].attrs for name in ds.data_vars})}
+        df.to_parquet(path)
+    return path
+
+
+def read_store(path: T.Union[str, os.PathLike]) -> xr.Dataset:
+    """
+    Read a consolidated file, written by ``write_store``.
+
+    Args:
+        path: Path of the NetCDF or Parquet file.
+
+    Returns:
+        Dataset of dimensions (station, time).
+    """
+    if Path(path).suffix == '.parquet':
+        df = pd.read_parquet(path)
+        ds = df.to_xarray()
+        ds.attrs = json.loads(df.attrs.get('dataset_attrs', '{}'))
+        for name, attrs in json.loads(df.attrs.get('variable_attrs', '{}')).items():
+            ds[name].attrs = attrs
+            if f'{name}_rows' in ds:
+                ds = ds.set_coords(f'{name}_rows')
+        return ds
+    with xr.open_dataset(path) as ds:
+        return ds.load()
+
+
+def array_path(outdir: T.Union[str, os.PathLike], product: str = 'forecast') -> Path:
+    """ Path of the binary array file of a product, see ``write_array`` """
+    return Path(outdir) / f'{product}.bin'
+
+
+def write_array(ds: xr.Dataset, path: T.Union[str, os.PathLike]) -> Path:
+    """
+    Write a Dataset of dimensions (station, time) to a binary array file, see ``read_array``.
+
+    The values are stored in float32. The float64 parameters (e.g. ETP, rounded to one decimal) are converted back
+    to the float64 values of their CSV files when read (see ``float32_to_csv_float64``); if one of them would not
+    give back its own values, all values are stored in float64, the float32 parameters being then converted to the
+    values of their CSV files. Boolean and integer parameters are stored as floats.
+
+    Args:
+        ds: Dataset of dimensions (station, time), see ``blocks_to_dataset``.
+        path: Path of the array file, see ``array_path``.
+
+    Returns:
+        Path of the written file.
+    """
+    params = [str(name) for name in ds.data_vars]
+    dtype = np.dtype(np.float32)
+    for par in params:
+        data = ds[par].values
+        if data.dtype == np.float64 and not np.array_equal(float32_to_csv_float64(data.astype(np.float32)), data,
+                                                           equal_nan=True):
+            dtype = np.dtype(np.float64)
+            break
+    values = np.empty((ds.sizes['station'], len(params), ds.sizes['time']), dtype=dtype.newbyteorder('<'))
+    for i, par in enumerate(params):
+        data = ds[par].transpose('station', 'time').values
+        values[:, i, :] = float32_to_csv_float64(data) if dtype == np.float64 else data
+
+    header = {
+        'dtype': values.dtype.str,
+        'station': [str(station) for station in ds['station'].values],
+        'time': [str(time) for time in ds['time'].values],
+        'coords': {str(name): coord.values.tolist() for name, coord in ds.coords.items()
+                   if coord.dims == ('station',) and name != 'station'},
+        'attrs': ds.attrs,
+        'variables': {par: {'dtype': str(ds[par].dtype), 'attrs': ds[par].attrs} for par in params},
+    }
+    header_bytes = json.dumps(header).encode()
+    # the header is padded so that the values are aligned
+    size = len(_ARRAY_MAGIC) + 8 + len(header_bytes)
+    header_bytes += b' ' * (-size % _ARRAY_ALIGNMENT)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Writing array of {len(params)} parameters to {path}")
+    with open(path, 'wb') as file:
+        file.write(_ARRAY_MAGIC)
+        file.write(len(header_bytes).to_bytes(8, 'little'))
+        file.write(header_bytes)
+        values.tofile(file)
+    return path
+
+
+def read_array(path: T.Union[str, os.PathLike]) -> xr.Dataset:
+    """
+    Memory-map a binary array file, written by ``write_array``. The values are not read nor copied until used.
+
+    Args:
+        path: Path of the array file.
+
+    Returns:
+        Dataset of dimensions (station, time), with the values stored in the file (floats), except the float64
+        parameters stored in float32, which are converted back to their float64 values.
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(_ARRAY_MAGIC)) != _ARRAY_MAGIC:
+            raise ValueError(f"{path} is not an array file")
+        header_size = int.from_bytes(file.read(8), 'little')
+        header = json.loads(file.read(header_size))
+
+    params = list(header['variables'])
+    shape = (len(header['station']), len(params), len(header['time']))
+    if 0 in shape:
+        values = np.empty(shape, dtype=header['dtype'])
+    else:
+        values = np.memmap(path, dtype=header['dtype'], mode='r', offset=len(_ARRAY_MAGIC) + 8 + header_size,
+                           shape=shape)
+
+    coords = {'station': header['station'], 'time': pd.DatetimeIndex(header['time'], name='time')}
+    coords.update({name: ('station', values) for name, values in header['coords'].items()})
+    data_vars = {}
+    for i, par in enumerate(params):
+        data = values[:, i, :]
+        if header['variables'][par]['dtype'] == 'float64':
+            data = float32_to_csv_float64(data)
+        data_vars[par] = (('station', 'time'), data, header['variables'][par]['attrs'])
+    return xr.Dataset(data_vars, coords=coords, attrs=header['attrs'])
+
+
+def station_series(ds: xr.Dataset, station: int) -> T.Dict[str, pd.Series]:
+    """
+    Get the series of all parameters of a station, as they were before being written to the store.
+
+    Args:
+        ds: Dataset of dimensions (station, time), see ``read_store``.
+        station: Position of the station in the station dimension.
+
+    Returns:
+        Series of each parameter, with the rows of the original series. Parameters without any row for the station
+        are left out.
+    """
+    data = ds.isel(station=station)
+    series = {}
+    for name in ds.data_vars:
+        df = data[name].to_series()
+        if data[name].attrs.get('padded'):
+            if f'{name}_rows' in data.coords:
+                df = df[data[f'{name}_rows'].values.astype(bool)]
+            elif df.first_valid_index() is not None:
+                # blocks of stations, padded outside of their times
+                df = df.loc[df.first_valid_index():df.last_valid_index()]
+            else:
+                df = df.iloc[:0]
+            if df.empty:
+                continue
+            df = df.astype(data[name].attrs['legacy_dtype'])
+        series[str(name)] = df
+    return series
+
+
+def export_to_csv(path: T.Union[str, os.PathLike], outdir: T.Union[str, os.PathLike]) -> None:
+    """
+    Export a consolidated file to the legacy CSV files, one per station and parameter.
+
+    Args:
+        path: Path of the NetCDF or Parquet file.
+        outdir: Path of the output directory where CSV files will be saved.
+    """
+    ds = read_store(path)
+    period = ds.attrs.get('period', 'forecast')
+    for i, station_name in enumerate(ds['station'].values):
+        logger.info(f'Exporting {Path(path).name} for {station_name}')
+        for par, df in station_series(ds, i).items():
+            write_to_csv(df, outdir, station_name, par, period=period)
+
+
+def float32_to_csv_float64(values: np.ndarray) -> np.ndarray:
+    """
+    Convert float32 values to the float64 values that would be read back from a CSV file,
+    so that computations from the store give the same results as computations from the legacy CSV files.
+
+    A float32 value is written with the fewest decimals giving back the same float32 value: it is rounded in float64
+    to 0, 1, 2... decimals until it does (one or two passes for values rounded to one decimal), without formatting
+    and parsing strings. The few values with more decimals, or too large for the rounding to be exact, are converted
+    through their string representation.
+    """
+    if values.dtype != np.float32:
+        return values
+    flat = values.ravel()
+    result = flat.astype('float64')
+    finite = np.isfinite(flat)
+    pending = np.flatnonzero(finite & (np.abs(flat) < _FLOAT32_ROUNDING_LIMIT))
+    for decimals in range(_FLOAT32_DECIMALS + 1):
+        if not pending.size:
+            break
+        rounded = np.round(result[pending], decimals)
+        found = rounded.astype(np.float32) == flat[pending]
+        result[pending[found]] = rounded[found]
+        pending = pending[~found]
+    pending = np.concatenate([pending, np.flatnonzero(finite & (np.abs(flat) >= _FLOAT32_ROUNDING_LIMIT))])
+    result[pending] = flat[pending].astype(str).astype('float64')
+    return result.reshape(values.shape)
+
+
+@click.command()
+@click.option("--store-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--outdir", required=True, type=Path)
+def export_csv(store_path: T.Union[str, os.PathLike],
+               outdir: T.Union[str, os.PathLike]):
+    export_to_csv(store_path, outdir)
+    logger.opt(ansi=True).info('<green>All CSV files exported successfully</green>')
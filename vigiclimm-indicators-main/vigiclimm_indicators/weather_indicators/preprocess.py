@@ -1,9 +1,116 @@
 import os
+import click
+import warnings
+import numpy as np
 import xarray as xr
 import typing as T
 
+from pathlib import Path
+from loguru import logger
 
-def preprocess_gfs(ds_path: T.Union[str, os.PathLike],
+from .dtypes import as_physical
+from .grid_index import select_station, select_stations, STATION_COORDS
+from .station_registry import load_station_list
+from .utils import setup_logger
+
+# loguru logger configuration
+setup_logger(verbose=1)
+
+# A GFS input is either the path of the NetCDF file or a dataset already opened with ``open_gfs``
+GFSInput = T.Union[str, os.PathLike, xr.Dataset]
+
+# daily aggregation of each parameter
+DAILY_METHODS = {
+    'tmax': 'max',
+    'tmin': 'min',
+    'tmean': 'mean',
+    'tp': 'sum',
+    'gust': 'max',
+    '10ws': 'mean',
+    '10u': 'mean',
+    '10v': 'mean',
+    'dswrf': 'mean',
+    '2d': 'mean',
+    'rhmax': 'max',
+    'rhmin': 'min',
+    'rhmean': 'mean',
+    'lcc': 'mean',
+    'mcc': 'mean'
+}
+
+# units of the daily GFS parameters and conversion to the units of the outputs:
+# (GFS units, output units, scale, offset), output = GFS * scale + offset
+UNIT_CONVERSIONS: T.Dict[str, T.Tuple[str, str, float, float]] = {
+    'tp': ('mm', 'mm', 1., 0.),
+    'tmax': ('K', 'degC', 1., -273.15),
+    'tmin': ('K', 'degC', 1., -273.15),
+    'tmean': ('K', 'degC', 1., -273.15),
+    '2d': ('K', 'degC', 1., -273.15),
+    'dswrf': ('W m-2', 'MJ m-2 day-1', 0.0864, 0.),
+    'gust': ('m s-1', 'km h-1', 3.6, 0.),
+    '10ws': ('m s-1', 'km h-1', 3.6, 0.),
+    '10u': ('m s-1', 'km h-1', 3.6, 0.),
+    '10v': ('m s-1', 'km h-1', 3.6, 0.),
+    'rhmax': ('%', '%', 1., 0.),
+    'rhmin': ('%', '%', 1., 0.),
+    'rhmean': ('%', '%', 1., 0.),
+    'lcc': ('%', '%', 1., 0.),
+    'mcc': ('%', '%', 1., 0.),
+}
+
+# first step of each day and day of each bin, by time axis (None if the time axis is not regular)
+_day_bins: T.Dict[bytes, T.Optional[T.Tuple[np.ndarray, np.ndarray]]] = {}
+
+
+def open_gfs(ds_path: T.Union[str, os.PathLike], load: bool = True) -> xr.Dataset:
+    """
+    Open a GFS NetCDF file so that it can be shared by all stations and parameters of a run.
+
+    Args:
+        ds_path: Path of the GFS NetCDF file
+        load: If True, decode all variables into memory once. Set to True by default
+
+    Returns:
+        The GFS dataset, with the 'valid_time' dimension renamed to 'time'.
+    """
+    ds = xr.open_dataset(ds_path)
+    ds = ds.rename({"valid_time": "time"})
+    if load:
+        ds = ds.load()
+        ds.close()
+    return ds
+
+
+def extract_gfs_stations(ds_path: T.Union[str, os.PathLike],
+                         station_list: T.List[T.Dict[str, T.Any]]) -> xr.Dataset:
+    """
+    Extract all variables and time steps of a GFS file at the nearest grid cell of the stations.
+    The extract can be used instead of the GFS file by all functions reading GFS data, for these stations only.
+
+    Args:
+        ds_path: Path of the GFS NetCDF file
+        station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+
+    Returns:
+        Dataset of dimensions (valid_time, station), with the coordinates of the grid cells ('latitude' and
+        'longitude') and of the stations ('station_lat' and 'station_lon').
+    """
+    with xr.open_dataset(ds_path) as ds:
+        data = select_stations(ds, station_list)
+    return data.assign_coords({coord: ('station', [station[key] for station in station_list])
+                               for coord, key in zip(STATION_COORDS, ['lat', 'lon'])})
+
+
+def _as_gfs_dataset(ds: GFSInput) -> xr.Dataset:
+    """ Return the given GFS dataset, opening it first if a path is given """
+    if isinstance(ds, xr.Dataset):
+        if "valid_time" in ds.dims:
+            ds = ds.rename({"valid_time": "time"})
+        return ds
+    return open_gfs(ds, load=False)
+
+
+def preprocess_gfs(ds_path: GFSInput,
                    par_name: str,
                    lat_station: T.Union[int, float],
                    lon_station: T.Union[int, float],
@@ -13,7 +120,7 @@ def preprocess_gfs(ds_path: T.Union[str, os.PathLike],
     Extract GFS forecast data for a specific location and apply a unit conversion and a resampling.
 
      Args:
-         ds_path: Path of the GFS NetCDF file
+         ds_path: Path of the GFS NetCDF file, or GFS dataset already opened with ``open_gfs``
          par_name: Name of the parameter that we are interested in
          lat_station: Latitude of the station
          lon_station: Longitude of the station
@@ -23,57 +130,209 @@ def preprocess_gfs(ds_path: T.Union[str, os.PathLike],
         A DataArray containg the daily values of the selected parameter at the station.
     """
 
-    ds = xr.open_dataset(ds_path)
+    ds = _as_gfs_dataset(ds_path)
 
-    ds = ds.rename({"valid_time": "time"})
-
-    if par_name in ['tmax', 'tmin', 'tmean']:
-        ds_par_name = '2t'
-    elif par_name in ['rhmax', 'rhmin', 'rhmean']:
-        ds_par_name = '2r'
+    if is_daily_gfs(ds):
+        data = select_station(ds[par_name], lat_station, lon_station)
     else:
-        ds_par_name = par_name
-
-    # get the data at the station
-    data = ds[ds_par_name].sel(latitude=lat_station, longitude=lon_station, method='nearest')
-    # get daily resampled values
-    data = _daily_resample(data, par_name)
+        # get the data at the station
+        data = select_station(ds[_gfs_par_name(par_name)], lat_station, lon_station)
+        # get daily resampled values
+        data = _daily_resample(data, par_name)
     # Only up to the D+10 forecasts
     data = data.head(time=10)
 
     # units conversion if needed
-    if convert:
-        data = _convert_units(data, par_name)
+    return postprocess_gfs(data, par_name, convert)
+
 
-    return data.round(1)
+def preprocess_gfs_stations(ds_path: GFSInput,
+                            par_name: str,
+                            station_list: T.List[T.Dict[str, T.Any]],
+                            convert: bool = False
+                            ) -> xr.DataArray:
+    """
+    Extract GFS forecast data for all stations at once and apply a unit conversion and a resampling.
+    Stations are extracted with a single pointwise selection, so that the resampling and the unit conversion
+    are applied once on the whole (station, time) block.
+
+     Args:
+         ds_path: Path of the GFS NetCDF file, or GFS dataset already opened with ``open_gfs``
+         par_name: Name of the parameter that we are interested in
+         station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+         convert: If True, convert to an appropriate units. Set to False by default
+
+    Returns:
+        A DataArray of dimensions (station, time) containg the daily values of the selected parameter.
+    """
+    data = daily_gfs_stations(ds_path, [par_name], station_list)[par_name]
+    return postprocess_gfs(data, par_name, convert)
+
+
+def daily_gfs_stations(ds_path: GFSInput,
+                       par_list: T.List[str],
+                       station_list: T.List[T.Dict[str, T.Any]]
+                       ) -> T.Dict[str, xr.DataArray]:
+    """
+    Extract the daily values of several GFS parameters for all stations, in a single pass.
+    Each GFS variable is extracted once at all stations (e.g. '2t' for 'tmax', 'tmean' and 'tmin') and each
+    parameter is resampled once. Values are neither converted nor rounded, see ``postprocess_gfs``.
+
+     Args:
+         ds_path: Path of the GFS NetCDF file, or GFS dataset already opened with ``open_gfs``
+         par_list: Names of the parameters that we are interested in
+         station_list: Stations/locations, as read from the stations YAML file ('station', 'lat' and 'lon' keys)
+
+    Returns:
+        A dictionary of DataArrays of dimensions (station, time), containing the daily values of each parameter.
+    """
+    # get the data at all stations with one vectorized indexing
+    return _daily_gfs(ds_path, par_list,
+                      lambda data: select_stations(data, station_list).transpose('station', 'time'))
+
+
+def daily_gfs_grid(ds_path: GFSInput, par_list: T.List[str]) -> T.Dict[str, xr.DataArray]:
+    """
+    Extract the daily values of several GFS parameters over the whole grid, in a single pass.
+    Only the grid cells of the given dataset are read: pass a block of the grid to bound the memory used.
+    Values are neither converted nor rounded, see ``postprocess_gfs``.
+
+     Args:
+         ds_path: Path of the GFS NetCDF file, or GFS dataset opened with ``open_gfs`` (or a block of it)
+         par_list: Names of the parameters that we are interested in
+
+    Returns:
+        A dictionary of DataArrays of dimensions (time, latitude, longitude), containing the daily values of each
+        parameter.
+    """
+    return _daily_gfs(ds_path, par_list, lambda data: data.transpose('time', 'latitude', 'longitude').load())
+
+
+def _daily_gfs(ds_path: GFSInput,
+               par_list: T.List[str],
+               extract: T.Callable[[xr.DataArray], xr.DataArray]) -> T.Dict[str, xr.DataArray]:
+    """ Daily values of several GFS parameters, each GFS variable being extracted once """
+    ds = _as_gfs_dataset(ds_path)
+
+    extracted: T.Dict[str, xr.DataArray] = {}
+    daily = {}
+    for par_name in par_list:
+        if is_daily_gfs(ds):
+            daily[par_name] = extract(ds[par_name]).head(time=10)
+            continue
+        ds_par_name = _gfs_par_name(par_name)
+        if ds_par_name not in extracted:
+            extracted[ds_par_name] = extract(ds[ds_par_name])
+        # get daily resampled values, only up to the D+10 forecasts
+        daily[par_name] = _daily_resample(extracted[ds_par_name], par_name).head(time=10)
+    return daily
+
+
+def postprocess_gfs(data: xr.DataArray, par_name: str, convert: bool = False) -> xr.DataArray:
+    """
+    Apply the unit conversion (see ``UNIT_CONVERSIONS``) and the rounding to daily GFS values.
+    The values are converted and rounded in a single new array, the given values are left unchanged.
+
+    Args:
+        data: Daily values of the parameter, as returned by ``daily_gfs_stations``
+        par_name: Name of the parameter
+        convert: If True, convert to an appropriate units. Set to False by default
+
+    Returns:
+        The converted values, rounded to one decimal, with their `units` attribute and the physical dtype of the
+        dtype policy (see ``dtypes.as_physical``).
+    """
+    gfs_units, units, scale, offset = UNIT_CONVERSIONS.get(par_name, (None, None, 1., 0.))
+    if not convert:
+        units, scale, offset = gfs_units, 1., 0.
+
+    values = data.values
+    out = np.empty(values.shape, dtype=np.result_type(values.dtype, scale, offset))
+    if scale != 1:
+        values = np.multiply(values, scale, out=out)
+    if offset != 0:
+        values = np.add(values, offset, out=out)
+    np.round(values, 1, out=out)
+
+    data = as_physical(data.copy(data=out))
+    if units is not None:
+        data.attrs['units'] = units
+    return data
+
+
+def is_daily_gfs(ds: xr.Dataset) -> bool:
+    """ Whether the GFS data is already aggregated by day, one variable per parameter (see ``gfs_stream``) """
+    return ds.attrs.get('aggregation') == 'daily'
+
+
+def _gfs_par_name(par_name: str) -> str:
+    """ Name of the GFS variable from which the parameter is computed """
+    if par_name in ['tmax', 'tmin', 'tmean']:
+        return '2t'
+    elif par_name in ['rhmax', 'rhmin', 'rhmean']:
+        return '2r'
+    return par_name
 
 
 def _daily_resample(ds: xr.DataArray, par_name: str) -> xr.DataArray:
-    method = {
-        'tmax': 'max',
-        'tmin': 'min',
-        'tmean': 'mean',
-        'tp': 'sum',
-        'gust': 'max',
-        '10ws': 'mean',
-        '10u': 'mean',
-        '10v': 'mean',
-        'dswrf': 'mean',
-        '2d': 'mean',
-        'rhmax': 'max',
-        'rhmin': 'min',
-        'rhmean': 'mean',
-        'lcc': 'mean',
-        'mcc': 'mean'
-    }
-    return getattr(ds.resample(time='D'), method[par_name])()
-
-
-def _convert_units(ds: xr.DataArray, par_name: str) -> xr.DataArray:
-    if par_name in ['gust', '10u', '10v', '10ws']:
-        ds = ds * 3.6  # m/s tp km/h
-    if par_name in ['tmean', 'tmax', 'tmin', '2d']:
-        ds = ds - 273.15  # K to °C
-    if par_name == 'dswrf':
-        ds = ds * 0.0864  # W/m2 tp MJ/m2
-    return ds
+    """
+    Resample to daily values with the method of the parameter. On a regular time axis (sorted steps, every day
+    from the first to the last one having steps), the day bins are computed once per time axis and all the other
+    dimensions are reduced at once; the result is the same as with ``xarray.DataArray.resample``, which is used
+    otherwise.
+    """
+    method = DAILY_METHODS[par_name]
+    bins = _time_bins(ds['time'].values) if 'time' in ds.dims and ds.dtype.kind == 'f' else None
+    if bins is None:
+        return getattr(ds.resample(time='D'), method)()
+
+    starts, days = bins
+    axis = ds.get_axis_num('time')
+    values = ds.values
+    if method in ('max', 'min'):
+        # exact whatever the order, NaN are skipped
+        daily = getattr(np, f'f{method}').reduceat(values, starts, axis=axis)
+    else:
+        # one reduction per day, as resample does, so that float32 sums are rounded the same way
+        ends = np.append(starts[1:], values.shape[axis])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # days without any value
+            daily = np.stack([getattr(np, f'nan{method}')(values.take(np.arange(start, end), axis=axis), axis=axis)
+                              for start, end in zip(starts, ends)], axis=axis)
+
+    coords = {name: coord for name, coord in ds.coords.items() if 'time' not in coord.dims}
+    coords['time'] = days
+    return xr.DataArray(daily, dims=ds.dims, coords=coords, name=ds.name)
+
+
+def _time_bins(time: np.ndarray) -> T.Optional[T.Tuple[np.ndarray, np.ndarray]]:
+    """ First step of each day and days of a regular time axis, None if the time axis is not regular """
+    key = time.dtype.str.encode() + time.tobytes()
+    if key not in _day_bins:
+        bins = None
+        if time.dtype.kind == 'M' and len(time) and not np.isnat(time).any() and (np.diff(time) > 0).all():
+            day = time.astype('datetime64[D]')
+            starts = np.flatnonzero(np.append(True, day[1:] != day[:-1]))
+            # resample also gives the days without any step
+            if (np.diff(day[starts]) == np.timedelta64(1, 'D')).all():
+                bins = starts, day[starts].astype(time.dtype)
+        _day_bins[key] = bins
+    return _day_bins[key]
+
+
+@click.command()
+@click.option("--yml-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--ds-path", required=True, type=click.Path(exists=True, path_type=Path))
+@click.option("--output-path", required=True, type=Path)
+def extract_stations(yml_path: T.Union[str, os.PathLike],
+                     ds_path: T.Union[str, os.PathLike],
+                     output_path: T.Union[str, os.PathLike]):
+
+    station_list = load_station_list(yml_path)
+    if not station_list:
+        logger.warning("No station, the GFS data is not extracted")
+        return
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    extract_gfs_stations(ds_path, station_list).to_netcdf(output_path)
+    logger.opt(ansi=True).info(f'<green>GFS data of {len(station_list)} stations written to {output_path}</green>')
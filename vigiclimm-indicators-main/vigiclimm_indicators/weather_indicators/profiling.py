@@ -0,0 +1,156 @@
+"""
+Wall time, CPU time and peak memory of each stage, step, parameter and station of a run.
+
+Profiling is off by default: ``profile`` then does nothing. Once enabled (`--profile-path` option of the commands),
+each profiled block is logged with the `param` binding of the logger (see ``utils.setup_logger``) and recorded,
+and ``write_profile`` logs a summary table and saves all records as JSON at the end of the run.
+The records of the worker processes are sent back to the main process with the outputs of their shards.
+"""
+import os
+import sys
+import json
+import time
+import typing as T
+
+from contextlib import contextmanager
+from pathlib import Path
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
+_enabled = False
+_records: T.List[T.Dict[str, T.Any]] = []
+# stages of the enclosing profiled blocks
+_stages: T.List[str] = []
+
+
+def enable_profiling(enabled: bool = True) -> None:
+    """ Start (or stop) recording the profiled blocks """
+    global _enabled
+    _enabled = enabled
+
+
+def is_profiling_enabled() -> bool:
+    return _enabled
+
+
+def current_stage() -> T.Optional[str]:
+    """ Stage of the enclosing profiled block, if any """
+    return _stages[-1] if _stages else None
+
+
+def peak_rss() -> T.Optional[float]:
+    """ Peak resident memory of the current process [MB], None if not available """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss / 1024 ** 2 if sys.platform == 'darwin' else maxrss / 1024
+
+
+@contextmanager
+def profile(step: str,
+            param: T.Optional[str] = None,
+            station: T.Optional[str] = None,
+            stage: T.Optional[str] = None) -> T.Iterator[None]:
+    """
+    Record the wall time, CPU time and peak memory of a block of code. Can also be used as a function decorator.
+
+    Args:
+        step: Name of the step, e.g. 'read', 'compute' or 'write'.
+        param: Name of the parameter/indicator, if any.
+        station: Name of the station/location, if any (None for blocks of stations).
+        stage: Name of the stage, e.g. 'forecast', by default the stage of the enclosing profiled block.
+    """
+    if not _enabled:
+        yield
+        return
+
+    stage = stage if stage is not None else (current_stage() or 'run')
+    _stages.append(stage)
+    rss_start = peak_rss()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        record = {'stage': stage, 'step': step, 'param': param, 'station': station,
+                  'wall': time.perf_counter() - wall_start, 'cpu': time.process_time() - cpu_start,
+                  'peak_rss': peak_rss(), 'pid': os.getpid()}
+        record['peak_rss_increase'] = None if rss_start is None else record['peak_rss'] - rss_start
+        _stages.pop()
+        _records.append(record)
+        label = '|'.join(name for name in (stage, step, param, station) if name is not None)
+        logger.bind(param=label).debug(f"{record['wall']:.3f} s wall, {record['cpu']:.3f} s CPU, "
+                                       f"peak RSS {_format_mb(record['peak_rss'])}")
+
+
+def take_records() -> T.List[T.Dict[str, T.Any]]:
+    """ Remove and return the records of the current process """
+    records = list(_records)
+    _records.clear()
+    return records
+
+
+def add_records(records: T.List[T.Dict[str, T.Any]]) -> None:
+    """ Add records of another process, e.g. a worker of ``utils.run_sharded`` """
+    _records.extend(records)
+
+
+def summarize(records: T.List[T.Dict[str, T.Any]]) -> T.List[T.Dict[str, T.Any]]:
+    """
+    Aggregate records by stage, step and parameter, over all stations.
+
+    Args:
+        records: Records of ``profile``, see ``take_records``.
+
+    Returns:
+        Number of calls, total and maximum wall time, total CPU time and maximum peak memory of each stage, step
+        and parameter, from the most to the least expensive.
+    """
+    summary: T.Dict[T.Tuple[str, str, T.Optional[str]], T.Dict[str, T.Any]] = {}
+    for record in records:
+        key = (record['stage'], record['step'], record['param'])
+        if key not in summary:
+            summary[key] = {'stage': key[0], 'step': key[1], 'param': key[2], 'calls': 0,
+                            'wall': 0., 'wall_max': 0., 'cpu': 0., 'peak_rss': None}
+        entry = summary[key]
+        entry['calls'] += 1
+        entry['wall'] += record['wall']
+        entry['wall_max'] = max(entry['wall_max'], record['wall'])
+        entry['cpu'] += record['cpu']
+        if record['peak_rss'] is not None:
+            entry['peak_rss'] = max(entry['peak_rss'] or 0., record['peak_rss'])
+    return sorted(summary.values(), key=lambda entry: entry['wall'], reverse=True)
+
+
+def write_profile(path: T.Union[str, os.PathLike],
+                  records: T.Optional[T.List[T.Dict[str, T.Any]]] = None) -> None:
+    """
+    Log the summary table of the records and save the summary and all records as JSON.
+
+    Args:
+        path: Path of the JSON file.
+        records: Records of ``profile``, by default those of the current process (see ``take_records``).
+    """
+    records = records if records is not None else take_records()
+    summary = summarize(records)
+
+    logger.info(f"{'stage':<12} {'step':<14} {'param':<24} {'calls':>6} {'wall [s]':>9} {'max [s]':>8} "
+                f"{'CPU [s]':>8} {'peak RSS':>10}")
+    for entry in summary:
+        logger.info(f"{entry['stage']:<12} {entry['step']:<14} {str(entry['param'] or '-'):<24} "
+                    f"{entry['calls']:>6} {entry['wall']:>9.3f} {entry['wall_max']:>8.3f} {entry['cpu']:>8.3f} "
+                    f"{_format_mb(entry['peak_rss']):>10}")
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({'summary': summary, 'records': records}, file, indent=1)
+    logger.info(f"Profile written to {path}")
+
+
+def _format_mb(value: T.Optional[float]) -> str:
+    return '-' if value is None else f'{value:.0f} MB'
@@ -0,0 +1,147 @@
+"""
+Registry of the stations/locations of interest, read from the stations YAML file.
+
+The YAML file is parsed (with the C loader of PyYAML when available) and validated once: the validated stations are
+saved as a NumPy structured array in the cache directory (see ``grid_index.default_cache_dir``), keyed on a hash of
+the content of the YAML file. The next runs only hash the file and load the array, the cache being rebuilt as soon
+as the file changes.
+"""
+import os
+import math
+import hashlib
+import numpy as np
+import typing as T
+import yaml
+
+from pathlib import Path
+from loguru import logger
+
+from vigiclimm_indicators.weather_indicators.grid_index import default_cache_dir
+
+STATION_FIELDS = ['station', 'lat', 'lon']
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# station lists already loaded in this process, by cache file
+_loaded_stations: T.Dict[str, T.List[T.Dict[str, T.Any]]] = {}
+
+
+def read_station_yaml(yml_path: T.Union[str, os.PathLike]) -> T.List[T.Dict[str, T.Any]]:
+    """
+    Parse and validate a stations YAML file, without cache.
+
+    Args:
+        yml_path: Path of the YAML file, a list of stations with 'station', 'lat' and 'lon' keys.
+
+    Returns:
+        Stations/locations, see ``validate_station_list``.
+    """
+    with open(yml_path, 'rb') as file:
+        return validate_station_list(yaml.load(file, Loader=_Loader))
+
+
+def validate_station_list(entries: T.Any) -> T.List[T.Dict[str, T.Any]]:
+    """
+    Check the stations read from a YAML file.
+
+    Args:
+        entries: Content of the YAML file.
+
+    Several stations may have the same name (e.g. villages of different regions). As their output files have the
+    same names, only the last station of each name is kept (its files used to overwrite the files of the others),
+    with a warning. An empty file or list gives no station, also with a warning: the commands then do nothing.
+
+    Returns:
+        Stations/locations with 'station' (str), 'lat' and 'lon' (float) keys, other keys are dropped.
+
+    Raises:
+        ValueError: if the content is not a list, or if a station has no name, or invalid coordinates.
+    """
+    if entries is None or entries == []:
+        logger.warning("The stations file has no station")
+        return []
+    if not isinstance(entries, list):
+        raise ValueError("The stations file must be a list of stations")
+
+    errors = []
+    station_list = []
+    for n, entry in enumerate(entries):
+        if not isinstance(entry, dict) or any(field not in entry for field in STATION_FIELDS):
+            errors.append(f"station #{n}: {STATION_FIELDS} keys are required")
+            continue
+        name = str(entry['station'])
+        if not name:
+            errors.append(f"station #{n}: empty name")
+        try:
+            lat, lon = float(entry['lat']), float(entry['lon'])
+        except (TypeError, ValueError):
+            errors.append(f"station {name}: coordinates must be numbers")
+            continue
+        if not (math.isfinite(lat) and -90 <= lat <= 90 and math.isfinite(lon) and -180 <= lon <= 360):
+            errors.append(f"station {name}: invalid coordinates ({lat}, {lon})")
+        station_list.append({'station': name, 'lon': lon, 'lat': lat})
+
+    if errors:
+        raise ValueError("Invalid stations file:\n" + "\n".join(errors))
+
+    last = {station['station']: n for n, station in enumerate(station_list)}
+    if len(last) < len(station_list):
+        duplicated = sorted({station['station'] for n, station in enumerate(station_list)
+                             if last[station['station']] != n})
+        logger.warning(f"{len(station_list) - len(last)} stations ignored, a later station has the same name: "
+                       f"{', '.join(duplicated[:10])}{', ...' if len(duplicated) > 10 else ''}")
+        station_list = [station for n, station in enumerate(station_list) if last[station['station']] == n]
+    return station_list
+
+
+def station_array(station_list: T.List[T.Dict[str, T.Any]]) -> np.ndarray:
+    """ Structured array of the stations, with 'station', 'lat' and 'lon' fields """
+    width = max((len(station['station']) for station in station_list), default=1)
+    return np.array([(station['station'], station['lat'], station['lon']) for station in station_list],
+                    dtype=[('station', f'U{width}'), ('lat', 'f8'), ('lon', 'f8')])
+
+
+def station_records(stations: np.ndarray) -> T.List[T.Dict[str, T.Any]]:
+    """ Stations of a structured array, see ``station_array`` """
+    return [{'station': name, 'lon': lon, 'lat': lat}
+            for name, lat, lon in zip(stations['station'].tolist(), stations['lat'].tolist(),
+                                      stations['lon'].tolist())]
+
+
+def load_station_list(yml_path: T.Union[str, os.PathLike],
+                      cache_dir: T.Optional[T.Union[str, os.PathLike]] = None) -> T.List[T.Dict[str, T.Any]]:
+    """
+    Get the stations of a YAML file, from the cache if the file did not change.
+
+    Args:
+        yml_path: Path of the YAML file, a list of stations with 'station', 'lat' and 'lon' keys.
+        cache_dir: Directory where the stations are saved, by default given by ``default_cache_dir()``
+
+    Returns:
+        Stations/locations with 'station', 'lat' and 'lon' keys.
+    """
+    with open(yml_path, 'rb') as file:
+        content = file.read()
+    key = hashlib.sha1(content).hexdigest()[:16]
+    path = Path(cache_dir if cache_dir is not None else default_cache_dir()) / f"stations_{key}.npz"
+
+    if str(path) not in _loaded_stations:
+        if path.exists():
+            with np.load(path) as cached:
+                station_list = station_records(cached['stations'])
+        else:
+            logger.info(f"Building station registry {key} from {yml_path}")
+            station_list = validate_station_list(yaml.load(content, Loader=_Loader))
+            try:
+                # write to a temporary file first, several processes may build the same registry
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                with open(tmp_path, 'wb') as file:
+                    np.savez(file, stations=station_array(station_list))
+                os.replace(tmp_path, path)
+            except OSError as err:
+                logger.warning(f"Station registry could not be saved: {err}")
+        _loaded_stations[str(path)] = station_list
+
+    # copies, the station dictionaries may be modified by the caller
+    return [dict(station) for station in _loaded_stations[str(path)]]
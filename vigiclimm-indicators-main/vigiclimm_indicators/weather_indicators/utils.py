@@ -3,70 +3,103 @@ The utils module gathers small useful functions which are common to several main
 """
 import os
 import sys
+import math
 import typing as T
+import numpy as np
 import pandas as pd
+import xarray as xr
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from loguru import logger
 
+from vigiclimm_indicators.weather_indicators.dtypes import set_compact_dtypes, is_compact_dtypes
+from vigiclimm_indicators.weather_indicators.profiling import (
+    profile, enable_profiling, is_profiling_enabled, current_stage, take_records, add_records)
 
-def cdd_max(data: pd.Series, threshold: T.Union[int, float] = 1) -> int:
+# inputs opened once by each worker process of ``run_sharded``
+_worker_inputs: T.Dict[str, T.Any] = {}
+
+
+def cdd_max(data: T.Union[pd.Series, np.ndarray, xr.DataArray],
+            threshold: T.Union[int, float] = 1,
+            dim: str = 'time') -> T.Union[int, np.ndarray, xr.DataArray]:
     """
     Computes the maximum consecutive dry days series within a time period.
 
     Args:
-        data: data containing the parameters to check the events
+        data: data containing the parameters to check the events. Arrays of dimensions (station, time)
+            are reduced along their last axis.
         threshold: dry event threshold
+        dim: time dimension, for xarray objects
 
     Returns:
-        Maximum consecutive events in range, for the given time period.
+        Maximum consecutive events in range, for the given time period (one value per station for 2-D data).
     """
+    if isinstance(data, xr.DataArray):
+        return xr.apply_ufunc(cdd_max, data, kwargs={'threshold': threshold}, input_core_dims=[[dim]])
 
-    true_events = data <= threshold
-
-    current_consecutive = 0
-    global_consecutive = 0
+    max_consecutive = _running_count(np.asarray(data) <= threshold).max(axis=-1, initial=0)
+    if max_consecutive.ndim == 0:
+        return int(max_consecutive)
+    return max_consecutive
 
-    for value in true_events:
-        if value:
-            current_consecutive += 1
-            global_consecutive = max(global_consecutive, current_consecutive)
-        else:
-            current_consecutive = 0
 
-    return global_consecutive
+def rolling_cdd_max(data: np.ndarray,
+                    window: int,
+                    threshold: T.Union[int, float] = 1) -> np.ndarray:
+    """
+    Computes the maximum consecutive dry days of every window of `window` days, along the last axis.
+    Same as `cdd_max(data[..., i:i + window])` for each position `i`: the windows at the end are truncated.
 
+    Args:
+        data: data containing the parameters to check the events, of dimensions (time,) or (station, time)
+        window: number of days of each window
+        threshold: dry event threshold
 
-def consecutive_event_count(data: pd.Series) -> pd.Series:
+    Returns:
+        Maximum consecutive events of the window starting at each position.
+    """
+    running_count = _running_count(np.asarray(data) <= threshold)
+    size = running_count.shape[-1]
+    result = np.zeros_like(running_count)
+    for offset in range(min(window, size)):
+        # a sequence ending at position i + offset counts at most offset + 1 days of the window starting at i
+        np.maximum(result[..., :size - offset], np.minimum(running_count[..., offset:], offset + 1),
+                   out=result[..., :size - offset])
+    return result
+
+
+def consecutive_event_count(data: T.Union[pd.Series, np.ndarray, xr.DataArray],
+                            dim: str = 'time') -> T.Union[pd.Series, np.ndarray, xr.DataArray]:
     """
     Compute consecutive events count in a series within a time period. Data must be filled with Boolean.
     The count resets when a False event occurs.
     Can be applied to compute dry and wet consecutive days.
 
     Args:
-        data: data containing the parameters to check the events
+        data: data containing the parameters to check the events. Arrays of dimensions (station, time)
+            are counted along their last axis.
+        dim: time dimension, for xarray objects
     Returns:
         Series with consecutive events count for the given time period.
     """
-    # Initialize variables
-    count = 0
-    consecutive_counts = []
+    if isinstance(data, xr.DataArray):
+        return xr.apply_ufunc(consecutive_event_count, data, input_core_dims=[[dim]], output_core_dims=[[dim]])
 
-    # Iterate through the series
-    for value in data:
-        if value:
-            consecutive_counts.append(count)
-            count += 1
-        else:
-            count = 0
-            consecutive_counts.append(count)
+    # the count starts at 0 on the first event of a sequence
+    consecutive_counts = np.maximum(_running_count(np.asarray(data, dtype=bool)) - 1, 0)
+    if isinstance(data, pd.Series):
+        return pd.Series(consecutive_counts, index=data.index)
+    return consecutive_counts
 
-    # Append the final count for the last true sequence
-    consecutive_counts.append(count)
-    # Create a new series with the consecutive counts
-    consecutive_series = pd.Series(consecutive_counts[:-1], index=data.index)
 
-    return consecutive_series
+def _running_count(events: np.ndarray) -> np.ndarray:
+    """ Length of the sequence of consecutive True values ending at each position, along the last axis """
+    position = np.arange(events.shape[-1])
+    # position of the last False value before each position, -1 if none
+    last_false = np.maximum.accumulate(np.where(events, -1, position), axis=-1)
+    return position - last_false
 
 
 def write_to_csv(df: pd.Series,
@@ -95,10 +128,11 @@ def write_to_csv(df: pd.Series,
 
     # specify name of the columns
     df.name = parameter
-    df.to_csv(os.path.join(outdir, f'{station_name}_{period}_{parameter}.csv'))
+    with profile('write', parameter, station_name):
+        df.to_csv(os.path.join(outdir, f'{station_name}_{period}_{parameter}.csv'))
 
 
-def setup_logger(verbose: int):
+def setup_logger(verbose: int, sink: T.Any = sys.stdout):
     """
     Configure loguru logger.
     """
@@ -113,5 +147,82 @@ def setup_logger(verbose: int):
         loglevel = "TRACE"
 
     logger.remove()
-    logger.add(sys.stdout, format=log_fmt, level=loglevel, enqueue=False, filter=lambda r: not r["extra"])
-    logger.add(sys.stdout, format=log_fmt_param, level=loglevel, enqueue=False, filter=lambda r: "param" in r["extra"])
+    logger.add(sink, format=log_fmt, level=loglevel, enqueue=False, filter=lambda r: not r["extra"])
+    logger.add(sink, format=log_fmt_param, level=loglevel, enqueue=False, filter=lambda r: "param" in r["extra"])
+
+
+def run_sharded(task: T.Callable[..., T.Tuple[T.List[str], T.Any]],
+                station_list: T.List[T.Dict[str, T.Any]],
+                workers: int,
+                open_inputs: T.Callable[..., T.Dict[str, T.Any]],
+                *args: T.Any) -> T.Tuple[T.List[str], T.List[T.Any]]:
+    """
+    Run a task on all stations, sharding the station list across a pool of processes.
+
+    Each worker opens the inputs once with `open_inputs(*args)` and reuses them for all its shards.
+    The logs of a shard are buffered and written once the shard is done, in the order of the station list.
+    A shard that fails does not stop the others. When profiling is enabled, the records of the workers are added
+    to those of the main process. The workers use the dtype policy of the main process (see ``dtypes``).
+
+    Args:
+        task: Function called as `task(shard, **inputs)`, returning the names of the stations that failed and
+            its output (e.g. data to be written by the main process).
+        station_list: Stations/locations, as read from the stations YAML file.
+        workers: Number of processes. If 1, the task runs in the current process on all stations.
+        open_inputs: Function opening the inputs shared by all stations (datasets...), returned as a dictionary.
+        args: Arguments of `open_inputs`.
+
+    Returns:
+        Names of the stations that failed, and the outputs of the task for each shard.
+    """
+    if not station_list:
+        return [], []
+    if workers <= 1:
+        failed, output = task(station_list, **open_inputs(*args))
+        return failed, [output]
+
+    # several shards per worker, to balance the load and write logs regularly
+    shard_size = math.ceil(len(station_list) / (workers * 4))
+    shards = [station_list[i:i + shard_size] for i in range(0, len(station_list), shard_size)]
+
+    failed = []
+    outputs = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(open_inputs, *args)) as pool:
+        profiling = current_stage() if is_profiling_enabled() else None
+        futures = [pool.submit(_run_shard, task, shard, profiling, is_compact_dtypes()) for shard in shards]
+        for shard, future in zip(shards, futures):
+            try:
+                messages, records, failed_shard, output = future.result()
+            except Exception:
+                logger.exception(f"Worker failed for stations {[station['station'] for station in shard]}")
+                failed.extend(station['station'] for station in shard)
+                continue
+            sys.stdout.write(''.join(messages))
+            sys.stdout.flush()
+            add_records(records)
+            failed.extend(failed_shard)
+            outputs.append(output)
+    return failed, outputs
+
+
+def _init_worker(open_inputs: T.Callable[..., T.Dict[str, T.Any]], *args: T.Any) -> None:
+    _worker_inputs.update(open_inputs(*args))
+
+
+def _run_shard(task: T.Callable[..., T.Tuple[T.List[str], T.Any]],
+               shard: T.List[T.Dict[str, T.Any]],
+               profiling: T.Optional[str] = None,
+               compact_dtypes: bool = False
+               ) -> T.Tuple[T.List[str], T.List[T.Dict[str, T.Any]], T.List[str], T.Any]:
+    """
+    Run a task on a shard in a worker. `profiling` is the stage being profiled, if profiling is enabled, and
+    `compact_dtypes` the dtype policy of the main process (see ``dtypes``).
+    """
+    messages: T.List[str] = []
+    setup_logger(verbose=1, sink=messages.append)
+    enable_profiling(profiling is not None)
+    set_compact_dtypes(compact_dtypes)
+    take_records()
+    with profile('shard', stage=profiling):
+        failed, output = task(shard, **_worker_inputs)
+    return messages, take_records(), failed, output